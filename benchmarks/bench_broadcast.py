@@ -0,0 +1,78 @@
+"""
+Micro-benchmark: broadcast con serializzazione per destinatario contro encode-once.
+
+Simula 1k e 10k connessioni (meta' JSON, meta' binarie) che accodano i buffer
+ricevuti senza fare I/O, cosi' si misura solo il costo di serializzazione e framing.
+
+Uso:  python benchmarks/bench_broadcast.py [--sizes 1000 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from common.protocol import *
+from server.outbound import frame_buffers
+
+class FakeConnection:
+    """Connessione simulata: conta i byte accodati."""
+    def __init__(self, codec):
+        self.codec = codec
+        self.queued = 0
+
+    def send_buffers(self, buffers):
+        for b in buffers: self.queued += len(b)
+
+    def send_message(self, msg):
+        self.send_buffers(frame_buffers(msg, self.codec))
+
+def per_recipient(conns, msg):
+    for conn in conns: conn.send_message(msg)
+
+def encode_once(conns, msg):
+    frame = SharedFrame(msg)
+    for conn in conns: conn.send_buffers(frame.buffers_for(conn.codec))
+
+def personal_per_recipient(conns, msg, narrator_idx):
+    for i, conn in enumerate(conns):
+        evt = msg.copy()
+        evt["am_i_narrator"] = (i == narrator_idx)
+        conn.send_message(evt)
+
+def personal_patched(conns, msg, narrator_idx):
+    frame = PersonalizedFrame(msg, "am_i_narrator")
+    for i, conn in enumerate(conns):
+        conn.send_buffers(frame.buffers_for(conn.codec, i == narrator_idx))
+
+def measure(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    sizes = parser.parse_args().sizes
+
+    story = {"type": EVT_STORY_UPDATE, "version": 200, "story": [f"Segmento {i} della storia condivisa." for i in range(200)]}
+    segment = {"type": EVT_NEW_SEGMENT, "segment_id": 7, "timeout": 60}
+    started = {"type": EVT_GAME_STARTED, "narrator": "Luigi", "theme": "Viaggio al centro di un buco nero", "is_spectator": False}
+
+    print(f"{'connessioni':>11} {'evento':<22}{'per-dest ms':>13}{'encode-once ms':>16}{'speedup':>9}")
+    for n in sizes:
+        conns = [FakeConnection(CODEC_BINARY if i % 2 else CODEC_JSON) for i in range(n)]
+        for name, msg in ((EVT_STORY_UPDATE, story), (EVT_NEW_SEGMENT, segment)):
+            old = measure(per_recipient, conns, msg)
+            new = measure(encode_once, conns, msg)
+            print(f"{n:>11} {name:<22}{old:>13.2f}{new:>16.2f}{old / new:>8.1f}x")
+        old = measure(personal_per_recipient, conns, started, 0)
+        new = measure(personal_patched, conns, started, 0)
+        print(f"{n:>11} {EVT_GAME_STARTED + ' (pers.)':<22}{old:>13.2f}{new:>16.2f}{old / new:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: amplificazione delle scritture su disco con N standby.
+
+Gioca una partita sul master (WAL reale in una directory temporanea) e replica
+ogni tick a N standby. Prima ogni standby riscriveva il proprio WAL a ogni voce
+ricevuta, quindi il cluster scriveva N+1 volte ogni modifica; ora lo standby
+tiene lo stato in memoria e lo scrive solo al checkpoint periodico (i record
+accumulati in un'unica scrittura) o alla promozione. Conta i byte e le scritture
+effettivamente eseguite dal LogWriter; le colonne "x master" sono il totale del
+cluster diviso per quanto scrive il solo master.
+
+Uso:  python benchmarks/bench_checkpoint.py [--standbys 1 2 4] [--segments 200] [--checkpoint-every 50]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from collections import defaultdict
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from server.gamestate import GameState
+from server.checkpoint import node_dir, recovery_file
+from server.wal import StateLog, shared_writer
+
+written = defaultdict(lambda: [0, 0])   # directory del nodo -> [byte, scritture]
+
+def count_writes():
+    original = StateLog._write_batch
+    def counted(self, batch):
+        last_reset = max((i for i, (kind, _) in enumerate(batch) if kind != "append"), default=-1)
+        data = [d for kind, d in batch[max(last_reset, 0):] if d]
+        stats = written[os.path.dirname(self.path)]
+        stats[0] += sum(len(d.encode('utf-8')) for d in data)
+        stats[1] += 1
+        original(self, batch)
+    StateLog._write_batch = counted
+
+def sentence(i):
+    return f"Frase numero {i} della storia, scritta da uno dei giocatori della stanza."
+
+def play(data_dir, standbys, segments, checkpoint_every, in_memory):
+    """checkpoint_every: tick tra due checkpoint dello standby (0: solo alla promozione, a fine partita)."""
+    master = GameState(save_file=recovery_file(node_dir(data_dir, 0), "alfa"))
+    # Come sul master: i record si accumulano fino al tick di commit
+    persist, master.save_state = master.save_state, lambda: None
+    nodes = [GameState(save_file=recovery_file(node_dir(data_dir, i + 1), "alfa"), load=False) for i in range(standbys)]
+    ticks = 0
+
+    def tick():
+        nonlocal ticks
+        records = persist()
+        ticks += 1
+        for node in nodes:
+            if in_memory:
+                node.apply_records(records)
+                if checkpoint_every and ticks % checkpoint_every == 0: node.checkpoint()
+            else:
+                # Comportamento precedente: ogni voce ricevuta finiva nel WAL dello standby
+                node.apply_records(records)
+                node._pending = list(records)
+                node.save_state()
+        shared_writer().flush()
+
+    for i in range(6): master.add_player(i, f"Giocatore_{i}")
+    master.start_new_story()
+    tick()
+    for seg in range(segments):
+        master.start_new_segment()
+        tick()
+        for addr in master.players:
+            if addr != master.narrator and master.add_proposal(addr, sentence(seg))[0]: tick()
+        master.set_phase_selecting()
+        tick()
+        master.select_proposal(0)
+        tick()
+    for node in nodes:
+        if in_memory: node.checkpoint()
+    shared_writer().flush()
+
+def measure(standbys, segments, checkpoint_every, in_memory=True):
+    data_dir = tempfile.mkdtemp()
+    written.clear()
+    try:
+        play(data_dir, standbys, segments, checkpoint_every, in_memory)
+        master = written[os.path.dirname(recovery_file(node_dir(data_dir, 0), "alfa"))]
+        total = [sum(s[0] for s in written.values()), sum(s[1] for s in written.values())]
+        return master, total
+    finally:
+        shutil.rmtree(data_dir)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--standbys", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--segments", type=int, default=200)
+    parser.add_argument("--checkpoint-every", type=int, default=50, help="tick tra due checkpoint dello standby")
+    args = parser.parse_args()
+    count_writes()
+
+    print(f"{'standby':>8}{'modalita':>12}{'KB totali':>12}{'x master':>10}{'scritture':>11}{'x master':>10}")
+    for standbys in args.standbys:
+        modes = (("WAL", args.checkpoint_every, False), ("intervallo", args.checkpoint_every, True), ("promozione", 0, True))
+        for label, checkpoint_every, in_memory in modes:
+            master, total = measure(standbys, args.segments, checkpoint_every, in_memory)
+            print(f"{standbys:>8}{label:>12}{total[0] / 1024:>12.0f}{total[0] / master[0]:>10.2f}"
+                  f"{total[1]:>11}{total[1] / master[1]:>10.2f}")
+
+if __name__ == "__main__":
+    main()
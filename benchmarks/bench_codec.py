@@ -0,0 +1,49 @@
+"""
+Benchmark: codec JSON contro codec binario compatto, per tipo di messaggio.
+
+Per ogni messaggio tipico del protocollo riporta la dimensione del corpo e il tempo
+medio di encode/decode nei due codec.
+
+Uso:  python benchmarks/bench_codec.py [--iterations 20000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from common.protocol import *
+
+def sample_messages():
+    proposals = [{"id": i, "author": f"Scrittore_{i}", "text": f"E poi il drago numero {i} apri' la porta del castello."} for i in range(10)]
+    story = [f"Frase numero {i} della storia condivisa, scritta a piu' mani." for i in range(50)]
+    return {
+        CMD_HEARTBEAT: {"type": CMD_HEARTBEAT},
+        CMD_JOIN: {"type": CMD_JOIN, "username": "Mario", "codec": CODEC_BINARY},
+        CMD_SUBMIT: {"type": CMD_SUBMIT, "text": "C'era una volta un fungo parlante."},
+        CMD_SELECT_PROPOSAL: {"type": CMD_SELECT_PROPOSAL, "proposal_id": 3},
+        EVT_WELCOME: {"type": EVT_WELCOME, "msg": "Benvenuto Mario!", "is_leader": True, "codec": CODEC_BINARY},
+        EVT_GAME_STARTED: {"type": EVT_GAME_STARTED, "narrator": "Luigi", "theme": "Viaggio al centro di un buco nero", "am_i_narrator": False, "is_spectator": False},
+        EVT_NEW_SEGMENT: {"type": EVT_NEW_SEGMENT, "segment_id": 12, "timeout": 60},
+        EVT_VOTE_UPDATE: {"type": EVT_VOTE_UPDATE, "count": 3, "needed": 8},
+        EVT_NARRATOR_DECISION_NEEDED: {"type": EVT_NARRATOR_DECISION_NEEDED, "proposals": proposals, "timeout": 30},
+        EVT_STORY_UPDATE: {"type": EVT_STORY_UPDATE, "story": story},
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    n = parser.parse_args().iterations
+
+    print(f"{'messaggio':<26}{'json B':>8}{'bin B':>8}{'json enc us':>13}{'bin enc us':>12}{'json dec us':>13}{'bin dec us':>12}")
+    for name, msg in sample_messages().items():
+        row = [name]
+        bodies = {c: encode_body(msg, c) for c in (CODEC_JSON, CODEC_BINARY)}
+        assert decode_body(bodies[CODEC_BINARY]) == msg
+        sizes = [len(bodies[CODEC_JSON]), len(bodies[CODEC_BINARY])]
+        enc = [timeit.timeit(lambda: encode_body(msg, c), number=n) / n * 1e6 for c in (CODEC_JSON, CODEC_BINARY)]
+        dec = [timeit.timeit(lambda: decode_body(bodies[c]), number=n) / n * 1e6 for c in (CODEC_JSON, CODEC_BINARY)]
+        print(f"{name:<26}{sizes[0]:>8}{sizes[1]:>8}{enc[0]:>13.2f}{enc[1]:>12.2f}{dec[0]:>13.2f}{dec[1]:>12.2f}")
+
+if __name__ == "__main__":
+    main()
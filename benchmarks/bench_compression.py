@@ -0,0 +1,76 @@
+"""
+Benchmark: compressione zlib dei frame, per tipo di messaggio.
+
+Per ogni messaggio grande del protocollo (e per lo snapshot di replica) riporta
+i byte del corpo con il codec binario, i byte dopo la compressione, il risparmio
+e il costo CPU medio di compressione e decompressione. Per la replica confronta
+anche il flusso zlib persistente (usato verso gli slave) con la compressione per frame.
+
+Uso:  python benchmarks/bench_compression.py [--iterations 2000] [--segments 100]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import zlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from common.protocol import *
+from server.replication import encode_snapshot
+
+WORDS = ("il drago la principessa un castello nel bosco antico poi all'improvviso "
+         "una voce misteriosa chiamo' il cavaliere che non aveva paura della notte").split()
+
+def sentence(i):
+    return " ".join(WORDS[(i * 7 + k * 3) % len(WORDS)] for k in range(14)).capitalize() + "."
+
+def sample_messages(segments):
+    story = [sentence(i) for i in range(segments)]
+    proposals = [{"id": i, "author": f"Scrittore_{i}", "text": sentence(i + 1000)} for i in range(12)]
+    return {
+        EVT_NEW_SEGMENT: {"type": EVT_NEW_SEGMENT, "segment_id": 12, "timeout": 60},
+        EVT_NARRATOR_DECISION_NEEDED: {"type": EVT_NARRATOR_DECISION_NEEDED, "proposals": proposals, "timeout": 30},
+        EVT_STORY_UPDATE: {"type": EVT_STORY_UPDATE, "version": len(story), "story": story},
+        EVT_GAME_ENDED: {"type": EVT_GAME_ENDED, "final_story": story, "timeout": 30},
+    }, story
+
+def snapshot(story, n):
+    return {"players": {f"127.0.0.1:{5000 + i}": f"Giocatore_{i}" for i in range(20)},
+            "story": story[:n], "phase": "WRITING", "current_segment_id": n, "is_running": True}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--segments", type=int, default=100)
+    args = parser.parse_args()
+    n = args.iterations
+    messages, story = sample_messages(args.segments)
+
+    print(f"Soglia di compressione: {COMPRESS_THRESHOLD} B, livello {COMPRESS_LEVEL}")
+    print(f"{'messaggio':<28}{'bin B':>8}{'zlib B':>8}{'risparmio':>11}{'comp us':>10}{'decomp us':>11}")
+    for name, msg in messages.items():
+        body = encode_body(msg, CODEC_BINARY)
+        header, packed = frame_body(body, compress=True)
+        flagged = HEADER.unpack(header)[0] & COMPRESSED_FLAG
+        comp = timeit.timeit(lambda: frame_body(body, compress=True), number=n) / n * 1e6
+        decomp = timeit.timeit(lambda: decompress_body(packed), number=n) / n * 1e6 if flagged else 0.0
+        saved = 1 - len(packed) / len(body)
+        print(f"{name:<28}{len(body):>8}{len(packed):>8}{saved:>10.0%}{comp:>10.1f}{decomp:>11.1f}")
+
+    # Replica: uno snapshot per ogni segmento aggiunto, come fa il master a ogni save_state
+    payloads = [encode_snapshot(snapshot(story, i)) for i in range(1, args.segments + 1)]
+    raw = sum(len(p) for p in payloads)
+    per_frame = sum(len(zlib.compress(p, COMPRESS_LEVEL)) for p in payloads)
+    stream = zlib.compressobj(COMPRESS_LEVEL)
+    persistent = sum(len(stream.compress(p) + stream.flush(zlib.Z_SYNC_FLUSH)) for p in payloads)
+    def run_stream():
+        c = zlib.compressobj(COMPRESS_LEVEL)
+        for p in payloads: c.compress(p) + c.flush(zlib.Z_SYNC_FLUSH)
+    cpu = timeit.timeit(run_stream, number=max(1, n // 200)) / max(1, n // 200) / len(payloads) * 1e6
+    print(f"\nReplica ({len(payloads)} snapshot, {raw} B in chiaro):")
+    print(f"  zlib per frame:      {per_frame:>9} B ({1 - per_frame / raw:.0%} risparmiato)")
+    print(f"  flusso persistente:  {persistent:>9} B ({1 - persistent / raw:.0%} risparmiato), {cpu:.1f} us/snapshot")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: tempo di failover su localhost.
+
+Avvia un master e uno standby reali come sottoprocessi, attende che lo standby sia
+collegato al canale di replica e poi simula il guasto del master:
+  crash   SIGKILL: il socket di replica si chiude, lo standby lo vede subito
+  blocco  SIGSTOP: il processo resta vivo e tiene le porte, ma smette di rinnovare
+          la lease; lo standby lo rileva alla scadenza e lo ferma
+Misura il tempo dal guasto al momento in cui la porta di gioco dello standby accetta
+connessioni, per diverse durate della lease (rinnovo ogni lease / 5).
+
+Uso:  python benchmarks/bench_failover.py [--leases 0.25 0.5 1.0] [--trials 5] [--async]
+Richiede le porte 7000 (replica), --port e --port+1 libere. I file di recovery dei
+due nodi (data/nodes/<porta>) vengono rimossi alla fine.
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(ROOT, 'src'))
+from server.checkpoint import node_dir
+from server.gamestate import DATA_DIR
+
+SERVER_SCRIPT = os.path.join(ROOT, 'src', 'server', '__main__.py')
+
+def wait_for_port(port, timeout=15, interval=0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError: time.sleep(interval)
+    return False
+
+def start_node(port, lease, extra):
+    args = [sys.executable, "-u", SERVER_SCRIPT, "SLAVE", str(port),
+            "--lease-timeout", str(lease), "--lease-renew", str(lease / 5)] + extra
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    process.following = threading.Event()
+
+    def read_output():
+        for line in process.stdout:
+            if "Trovato Master" in line: process.following.set()
+    threading.Thread(target=read_output, daemon=True).start()
+    return process
+
+def stop(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGCONT)
+        process.kill()
+    process.wait()
+
+def trial(failure, lease, port, extra):
+    master = start_node(port, lease, extra)
+    standby = None
+    try:
+        if not wait_for_port(port): return None
+        standby = start_node(port + 1, lease, extra)
+        if not standby.following.wait(15): return None
+        time.sleep(5 * lease)   # almeno qualche rinnovo della lease
+        t0 = time.perf_counter()
+        master.send_signal(signal.SIGKILL if failure == "crash" else signal.SIGSTOP)
+        if not wait_for_port(port + 1, timeout=30, interval=0.002): return None
+        return time.perf_counter() - t0
+    finally:
+        stop(master)
+        if standby: stop(standby)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--leases", type=float, nargs="+", default=[0.25, 0.5, 1.0])
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--port", type=int, default=65500)
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    args = parser.parse_args()
+    extra = ["--async"] if args.use_async else []
+
+    print(f"{'lease s':>8}{'guasto':>8}{'mediana ms':>12}{'max ms':>10}{'riusciti':>10}")
+    try:
+        for lease in args.leases:
+            for failure in ("crash", "blocco"):
+                times = [t for t in (trial(failure, lease, args.port, extra) for _ in range(args.trials)) if t is not None]
+                if not times:
+                    print(f"{lease:>8.2f}{failure:>8}{'-':>12}{'-':>10}{0:>7}/{args.trials}")
+                    continue
+                print(f"{lease:>8.2f}{failure:>8}{statistics.median(times) * 1000:>12.0f}"
+                      f"{max(times) * 1000:>10.0f}{len(times):>7}/{args.trials}")
+    finally:
+        for port in (args.port, args.port + 1):
+            shutil.rmtree(node_dir(DATA_DIR, port), ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: costo delle verifiche di GameState sul percorso caldo al crescere dei giocatori.
+
+Per ogni dimensione misura le operazioni chiamate a ogni proposta o selezione
+(count_active_writers, has_user_submitted, add_proposal, select_proposal) e il
+passaggio del leader in remove_player, confrontandole con le vecchie scansioni
+lineari. Con gli indici il tempo per chiamata resta costante anche a 10k giocatori.
+Riporta poi la memoria per giocatore e per proposta: chiavi (ip, porta) e proposte
+a dizionario contro id di sessione interi, record Proposal con __slots__ e nomi internati.
+
+Uso:  python benchmarks/bench_gamestate.py [--sizes 100 1000 10000] [--iterations 2000]
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from server.gamestate import GameState, PHASE_WRITING
+from server.records import Proposal, intern_name
+
+def build_game(players):
+    game = GameState(persistence=False)
+    game.save_state = lambda: None
+    for i in range(players):
+        game.add_player(("127.0.0.1", 10000 + i), f"Giocatore_{i}")
+    game.start_new_story()
+    game.start_new_segment()
+    # Meta' degli scrittori ha gia' inviato: le verifiche lavorano su un segmento pieno
+    writers = [a for a, n in game.players.items() if n != game.narrator_username]
+    for addr in writers[:len(writers) // 2]: game.add_proposal(addr, "frase")
+    return game, writers
+
+# Le implementazioni precedenti, per confronto
+def linear_count_active_writers(game):
+    return sum(1 for name in game.players.values() if name in game.story_usernames and name != game.narrator_username)
+
+def linear_has_user_submitted(game, username):
+    return any(p['author'] == username for p in game.active_proposals)
+
+def linear_find_proposal(game, proposal_id):
+    return next((p for p in game.active_proposals if p['id'] == proposal_id), None)
+
+def fresh(text):
+    """Copia distinta di una stringa, come quelle prodotte da recv/json.loads per ogni messaggio."""
+    return text.encode('utf-8').decode('utf-8')
+
+def allocated_bytes(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+def memory_rows(size):
+    names = [f"Giocatore_{i}" for i in range(size)]
+    text = "Una frase qualunque della storia."
+    # Prima: chiavi (ip, porta) in players/player_votes/last_active, proposte a dizionario
+    def old_players():
+        addrs = [(fresh("127.0.0.1"), 10000 + i) for i in range(size)]
+        return addrs, {a: fresh(n) for a, n in zip(addrs, names)}, {a: True for a in addrs}, {a: 0.0 for a in addrs}
+    def new_players():
+        return {i: intern_name(fresh(n)) for i, n in enumerate(names)}, {i: True for i in range(size)}
+    def old_proposals():
+        return [{"id": i, "author": fresh(n), "text": text} for i, n in enumerate(names)]
+    def new_proposals():
+        return [Proposal(i, fresh(n), text) for i, n in enumerate(names)]
+    return [
+        ("giocatore", allocated_bytes(old_players) / size, allocated_bytes(new_players) / size),
+        ("proposta", allocated_bytes(old_proposals) / size, allocated_bytes(new_proposals) / size),
+    ]
+
+def per_call_us(func, n):
+    return timeit.timeit(func, number=n) / n * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    n = args.iterations
+
+    print(f"{'giocatori':>10}{'operazione':>24}{'indice us':>12}{'lineare us':>12}")
+    for size in args.sizes:
+        game, writers = build_game(size)
+        last_writer = writers[-1]
+        last_name = game.players[last_writer]
+        last_id = game.active_proposals[-1]['id']
+        rows = [
+            ("count_active_writers", lambda: game.count_active_writers(), lambda: linear_count_active_writers(game)),
+            ("has_user_submitted", lambda: game.has_user_submitted(last_name), lambda: linear_has_user_submitted(game, last_name)),
+            ("cerca proposta", lambda: last_id in game._proposals_by_id, lambda: linear_find_proposal(game, last_id)),
+            ("spettatore in storia", lambda: last_name in game._story_set, lambda: last_name in game.story_usernames),
+        ]
+        # La vecchia count_active_writers e' O(giocatori x partecipanti): meno ripetizioni
+        linear_n = max(1, n * 10 // size)
+        for name, indexed, linear in rows:
+            print(f"{size:>10}{name:>24}{per_call_us(indexed, n):>12.2f}{per_call_us(linear, linear_n):>12.2f}")
+
+        # add_proposal completo (validazione + record), sul writer che non ha ancora scritto
+        game.phase = PHASE_WRITING
+        add = per_call_us(lambda: game.add_proposal(last_writer, "frase"), n)
+        print(f"{size:>10}{'add_proposal':>24}{add:>12.2f}{'-':>12}")
+
+        # Passaggio del leader: ogni uscita del leader promuove il primo rimasto
+        leaving = min(n, len(game.players) - 1)
+        start = timeit.default_timer()
+        for _ in range(leaving): game.remove_player(game.leader)
+        handoff = (timeit.default_timer() - start) / leaving * 1e6
+        print(f"{size:>10}{'remove_player (leader)':>24}{handoff:>12.2f}{'-':>12}")
+
+    print(f"\n{'giocatori':>10}{'record':>24}{'prima B':>12}{'dopo B':>12}")
+    for size in args.sizes:
+        for name, old, new in memory_rows(size):
+            print(f"{size:>10}{name:>24}{old:>12.0f}{new:>12.0f}")
+
+if __name__ == "__main__":
+    main()
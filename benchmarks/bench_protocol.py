@@ -0,0 +1,159 @@
+"""
+Benchmark del livello di framing: send_json/recv_json e FramedConnection.
+
+Per ogni trasporto (socketpair, TCP su loopback) e per ogni payload realistico
+(heartbeat, proposta, storia da 500 segmenti, lista di 1.000 proposte) misura:
+  - throughput a senso unico: messaggi/s e byte/s
+  - latenza andata/ritorno verso un thread echo: p50 e p99 in microsecondi
+
+I risultati vengono scritti anche in JSON (--output) insieme a commit, versione di
+Python e piattaforma, per confrontare le regressioni del framing tra commit diversi.
+
+Uso:  python benchmarks/bench_protocol.py [--seconds 1.0] [--rtt-samples 2000] [--output risultati.json]
+                                          [--compare risultati_precedenti.json]
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from common.protocol import *
+
+def sample_payloads():
+    return {
+        "heartbeat": {"type": CMD_HEARTBEAT},
+        "proposal": {"type": CMD_SUBMIT, "text": "E poi il drago apri' la porta del castello, senza fare rumore."},
+        "story_500": {"type": EVT_STORY_UPDATE, "version": 500,
+                      "story": [f"Frase numero {i} della storia condivisa, scritta a piu' mani." for i in range(500)]},
+        "proposals_1000": {"type": EVT_NARRATOR_DECISION_NEEDED, "timeout": 30,
+                           "proposals": [{"id": i, "author": f"Scrittore_{i}", "text": f"Proposta {i}: il viaggio continua."} for i in range(1000)]},
+    }
+
+# --- Trasporti ---
+def socketpair_transport():
+    return socket.socketpair()
+
+def tcp_transport():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    client = socket.create_connection(listener.getsockname())
+    server, _ = listener.accept()
+    listener.close()
+    for s in (client, server): s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return client, server
+
+TRANSPORTS = {"socketpair": socketpair_transport, "tcp_loopback": tcp_transport}
+
+# --- Implementazioni del framing: (send(sock_or_conn, msg), recv(...), wrap(sock)) ---
+IMPLEMENTATIONS = {
+    "send_json/recv_json": (send_json, recv_json, lambda s: s),
+    "FramedConnection": (lambda c, m: c.send_message(m), lambda c: c.recv_message(), FramedConnection),
+}
+
+def measure_throughput(make_transport, impl, msg, seconds):
+    send, recv, wrap = impl
+    left, right = make_transport()
+    writer, reader = wrap(left), wrap(right)
+    frame_size = len(encode_frame(msg))
+    received = [0]
+    stop = threading.Event()
+
+    def consume():
+        while recv(reader) is not None: received[0] += 1
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+    sent = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(10): send(writer, msg)
+        sent += 10
+    left.shutdown(socket.SHUT_WR)
+    consumer.join()
+    elapsed = time.perf_counter() - start
+    left.close(); right.close()
+    assert received[0] == sent, f"persi {sent - received[0]} messaggi"
+    return {"messages_per_sec": sent / elapsed, "bytes_per_sec": sent * frame_size / elapsed, "frame_bytes": frame_size}
+
+def measure_rtt(make_transport, impl, msg, samples):
+    send, recv, wrap = impl
+    left, right = make_transport()
+    client, server = wrap(left), wrap(right)
+
+    def echo():
+        while True:
+            m = recv(server)
+            if m is None: return
+            send(server, m)
+
+    threading.Thread(target=echo, daemon=True).start()
+    rtts = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        send(client, msg)
+        recv(client)
+        rtts.append(time.perf_counter() - t0)
+    left.close(); right.close()
+    rtts.sort()
+    return {"rtt_p50_us": rtts[len(rtts) // 2] * 1e6, "rtt_p99_us": rtts[min(len(rtts) - 1, int(len(rtts) * 0.99))] * 1e6}
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(path, results):
+    """Stampa la variazione percentuale rispetto a un'esecuzione precedente."""
+    with open(path, encoding='utf-8') as f: previous = json.load(f)
+    key = lambda r: (r["transport"], r["implementation"], r["payload"])
+    before = {key(r): r for r in previous["results"]}
+    print(f"\nConfronto con {path} (commit {previous.get('commit')}):")
+    print(f"{'trasporto':<14}{'implementazione':<22}{'payload':<16}{'msg/s':>9}{'p50':>9}{'p99':>9}")
+    for row in results:
+        old = before.get(key(row))
+        if not old: continue
+        delta = lambda field: (row[field] / old[field] - 1) * 100
+        print(f"{row['transport']:<14}{row['implementation']:<22}{row['payload']:<16}"
+              f"{delta('messages_per_sec'):>+8.1f}%{delta('rtt_p50_us'):>+8.1f}%{delta('rtt_p99_us'):>+8.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=1.0, help="durata di ogni misura di throughput")
+    parser.add_argument("--rtt-samples", type=int, default=2000)
+    parser.add_argument("--output", help="file JSON con i risultati")
+    parser.add_argument("--compare", help="file JSON di un'esecuzione precedente da confrontare")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'trasporto':<14}{'implementazione':<22}{'payload':<16}{'frame B':>9}{'msg/s':>11}{'MB/s':>9}{'p50 us':>9}{'p99 us':>9}")
+    for transport_name, make_transport in TRANSPORTS.items():
+        for impl_name, impl in IMPLEMENTATIONS.items():
+            for payload_name, msg in sample_payloads().items():
+                # I payload grandi hanno round-trip lunghi: meno campioni
+                samples = args.rtt_samples if len(encode_frame(msg)) < 4096 else max(50, args.rtt_samples // 20)
+                row = {"transport": transport_name, "implementation": impl_name, "payload": payload_name}
+                row.update(measure_throughput(make_transport, impl, msg, args.seconds))
+                row.update(measure_rtt(make_transport, impl, msg, samples))
+                results.append(row)
+                print(f"{transport_name:<14}{impl_name:<22}{payload_name:<16}{row['frame_bytes']:>9}{row['messages_per_sec']:>11.0f}"
+                      f"{row['bytes_per_sec'] / 1e6:>9.1f}{row['rtt_p50_us']:>9.1f}{row['rtt_p99_us']:>9.1f}")
+
+    if args.compare: compare(args.compare, results)
+
+    if args.output:
+        report = {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                  "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "seconds": args.seconds, "results": results}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nRisultati scritti in {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark: tempo di riconnessione di un client dopo la caduta del master.
+
+Avvia un master e uno standby reali, collega un client al master ed esegue il JOIN,
+poi termina il master (SIGKILL) e misura il tempo fino al WELCOME del nuovo master:
+  sequenziale  il ciclo precedente dei client: pausa di 2 s, poi un nodo alla volta
+               con timeout di 2 s ciascuno
+  parallelo    ServerConnector: tentativi in corsa verso tutti i nodi, ultimo master
+               per primo, pause brevi e crescenti tra un giro e l'altro
+La lista dei nodi comprende anche due porte senza server, come nel deployment a 4 nodi.
+
+Uso:  python benchmarks/bench_reconnect.py [--trials 5] [--port 65500] [--async]
+Richiede le porte 7000 (replica) e da --port a --port+3 libere. I file di recovery
+dei nodi (data/nodes/<porta>) vengono rimossi alla fine.
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(ROOT, 'src'))
+from client.connector import ServerConnector, reconnect_delays
+from common.protocol import CMD_JOIN, FramedConnection
+from server.checkpoint import node_dir
+from server.gamestate import DATA_DIR
+
+SERVER_SCRIPT = os.path.join(ROOT, 'src', 'server', '__main__.py')
+
+def start_node(port, extra):
+    process = subprocess.Popen([sys.executable, "-u", SERVER_SCRIPT, "SLAVE", str(port)] + extra,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    process.following = threading.Event()
+
+    def read_output():
+        for line in process.stdout:
+            if "Trovato Master" in line: process.following.set()
+    threading.Thread(target=read_output, daemon=True).start()
+    return process
+
+def wait_for_port(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError: time.sleep(0.05)
+    return False
+
+def join(sock):
+    """WELCOME del server, o None se la connessione cade (es. master che sta terminando)."""
+    try:
+        conn = FramedConnection(sock)
+        conn.send_message({"type": CMD_JOIN, "username": "bench"})
+        return conn.recv_message()
+    except OSError: return None
+    finally: sock.close()
+
+def sequential_reconnect(servers):
+    while True:
+        time.sleep(2)
+        for addr in servers:
+            try: sock = socket.create_connection(addr, timeout=2)
+            except OSError: continue
+            # Come i client: una connessione che cade subito fa ripartire il ciclo
+            if join(sock): return True
+            break
+
+def parallel_reconnect(connector):
+    for delay in reconnect_delays():
+        connected = connector.connect()
+        if connected and join(connected[0]): return True
+        time.sleep(delay)
+
+def trial(strategy, port, extra):
+    servers = [('127.0.0.1', port + i) for i in range(4)]
+    connector = ServerConnector(servers)
+    master = start_node(port, extra)
+    standby = None
+    try:
+        if not wait_for_port(port): return None
+        standby = start_node(port + 1, extra)
+        if not standby.following.wait(15): return None
+        sock, _ = connector.connect()
+        if not join(sock): return None
+        time.sleep(0.5)
+        t0 = time.perf_counter()
+        master.kill()
+        if strategy == "sequenziale": sequential_reconnect(servers)
+        else: parallel_reconnect(connector)
+        return time.perf_counter() - t0
+    finally:
+        for process in (master, standby):
+            if process and process.poll() is None: process.kill()
+            if process: process.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--port", type=int, default=65500)
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    args = parser.parse_args()
+    extra = ["--async"] if args.use_async else []
+
+    print(f"{'strategia':>12}{'mediana ms':>12}{'max ms':>10}{'riusciti':>10}")
+    try:
+        for strategy in ("sequenziale", "parallelo"):
+            times = [t for t in (trial(strategy, args.port, extra) for _ in range(args.trials)) if t is not None]
+            if not times:
+                print(f"{strategy:>12}{'-':>12}{'-':>10}{0:>7}/{args.trials}")
+                continue
+            print(f"{strategy:>12}{statistics.median(times) * 1000:>12.0f}{max(times) * 1000:>10.0f}{len(times):>7}/{args.trials}")
+    finally:
+        for i in range(4):
+            shutil.rmtree(node_dir(DATA_DIR, args.port + i), ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark: byte di replica per mutazione al crescere della storia.
+
+Gioca una partita con un GameState reale e, per ogni mutazione del segmento
+(proposte, cambio di fase, selezione), confronta lo snapshot completo inviato
+prima a ogni slave con la voce numerata del log di operazioni inviata ora.
+Lo snapshot cresce con la storia, la voce resta della dimensione della modifica.
+
+Uso:  python benchmarks/bench_replication.py [--segments 10 100 1000] [--writers 5]
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from server.gamestate import GameState
+from server.replication import ReplicationLog, encode_snapshot
+
+def sentence(i):
+    return f"Frase numero {i} della storia, scritta da uno dei giocatori della stanza."
+
+def measure(segments, writers):
+    game = GameState(persistence=False)
+    # Come sul master: i record si accumulano fino al tick di commit
+    persist, game.save_state = game.save_state, lambda: None
+    log = ReplicationLog()
+    snapshot_bytes = entry_bytes = mutations = 0
+
+    def replicate():
+        # Come commit_tick: i record del tick diventano una voce del log
+        nonlocal snapshot_bytes, entry_bytes, mutations
+        records = persist()
+        snapshot_bytes += len(encode_snapshot(game.get_state_dict()))
+        entry_bytes += len(log.append({"room": "main", "ops": records}))
+        mutations += 1
+
+    for i in range(writers + 1): game.add_player(i, f"Giocatore_{i}")
+    game.start_new_story()
+    replicate()
+    for seg in range(segments):
+        game.start_new_segment()
+        replicate()
+        for addr in game.players:
+            if addr != game.narrator and game.add_proposal(addr, sentence(seg))[0]: replicate()
+        game.set_phase_selecting()
+        replicate()
+        game.select_proposal(0)
+        replicate()
+    return snapshot_bytes / mutations, entry_bytes / mutations
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--writers", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'segmenti':>10}{'snapshot B/mut':>16}{'operazioni B/mut':>18}{'rapporto':>10}")
+    for segments in args.segments:
+        snapshot, entry = measure(segments, args.writers)
+        print(f"{segments:>10}{snapshot:>16.0f}{entry:>18.0f}{snapshot / entry:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: latenza del commit sul master con uno slave sano e uno bloccato.
+
+Il commit replica ogni voce a tutti gli slave. Prima gli invii erano sendall
+sincroni fatti sotto il lock del gioco: quando il buffer TCP dello slave bloccato
+si riempie, il commit resta fermo (qui fino al timeout di 2 s). Con SlaveLink il
+commit accoda soltanto: la latenza resta di microsecondi, lo slave bloccato viene
+scollegato quando la sua coda supera la soglia e quello sano riceve tutto.
+
+Uso:  python benchmarks/bench_replication_fanout.py [--commits 10000] [--entry-bytes 2048] [--interval 0.0002]
+"""
+import argparse
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from server.replication import SlaveLink
+
+def drain(sock, counter):
+    while True:
+        data = sock.recv(65536)
+        if not data: return
+        counter[0] += len(data)
+
+def healthy_and_stalled():
+    healthy_master, healthy_slave = socket.socketpair()
+    stalled_master, stalled_slave = socket.socketpair()
+    received = [0]
+    threading.Thread(target=drain, args=(healthy_slave, received), daemon=True).start()
+    return (healthy_master, stalled_master), (healthy_slave, stalled_slave), received
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99) - 1] * 1e6, samples[-1] * 1e6
+
+def run_sync(commits, payload, interval):
+    masters, slaves, _ = healthy_and_stalled()
+    for sock in masters: sock.settimeout(2)
+    samples = []
+    for i in range(commits):
+        start = time.perf_counter()
+        try:
+            for sock in masters: sock.sendall(payload)
+        except socket.timeout:
+            samples.append(time.perf_counter() - start)
+            return samples, f"commit bloccato al n. {i + 1}"
+        samples.append(time.perf_counter() - start)
+        time.sleep(interval)
+    return samples, "mai bloccato"
+
+def run_queued(commits, payload, interval):
+    masters, slaves, received = healthy_and_stalled()
+    links = [SlaveLink(sock) for sock in masters]
+    samples, dropped_at = [], None
+    for i in range(commits):
+        start = time.perf_counter()
+        for link in links:
+            if not link.closed and not link.send(payload, i + 1) and dropped_at is None: dropped_at = i + 1
+        samples.append(time.perf_counter() - start)
+        time.sleep(interval)
+    deadline = time.time() + 5
+    while received[0] < commits * len(payload) and time.time() < deadline: time.sleep(0.01)
+    ok = "ricevuto tutto" if received[0] == commits * len(payload) and not links[0].closed else f"ricevuti {received[0]} byte"
+    return samples, f"bloccato scollegato al commit {dropped_at}, sano: {ok}"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commits", type=int, default=10000)
+    parser.add_argument("--entry-bytes", type=int, default=2048)
+    parser.add_argument("--interval", type=float, default=0.0002, help="secondi tra due commit")
+    args = parser.parse_args()
+    payload = b"x" * args.entry_bytes
+
+    print(f"{'invio':<10}{'p50 us':>10}{'p99 us':>10}{'max us':>12}  esito")
+    for name, run in (("sincrono", run_sync), ("in coda", run_queued)):
+        samples, outcome = run(args.commits, payload, args.interval)
+        p50, p99, worst = percentiles(samples)
+        print(f"{name:<10}{p50:>10.1f}{p99:>10.1f}{worst:>12.0f}  {outcome}")
+
+if __name__ == "__main__":
+    main()
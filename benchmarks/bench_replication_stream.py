@@ -0,0 +1,67 @@
+"""
+Benchmark: ricezione di uno stato di replica da piu' megabyte sullo slave.
+
+Codifica uno stato con una storia lunga (dimensione scelta con --sizes, in MB) e
+misura il tempo per ricomporlo dai chunk ricevuti con tre decoder:
+  originale  - decode in str di ogni chunk, '__END__' in buffer e split (il vecchio slave)
+  delimitat. - SnapshotReader sul flusso legacy (bytearray, ricerca incrementale del delimitatore)
+  frame      - SnapshotReader sul flusso a frame con lunghezza (FrameBuffer riutilizzato)
+Il decoder originale rilegge il buffer intero a ogni chunk: il tempo cresce col quadrato.
+
+Uso:  python benchmarks/bench_replication_stream.py [--sizes 1 4 8] [--chunk 4096]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from server.replication import SnapshotReader, encode_message, encode_snapshot
+
+def big_state(megabytes):
+    line = "Il cavaliere attraverso' il bosco antico senza voltarsi indietro."
+    segments = megabytes * 1024 * 1024 // (len(line) + 4)
+    return {"room": "main", "state": {"story": [line] * segments, "phase": "WRITING"}}
+
+def original_decoder(stream, chunk):
+    buffer = ""
+    received = []
+    for i in range(0, len(stream), chunk):
+        buffer += stream[i:i + chunk].decode('utf-8')
+        while '__END__\n' in buffer:
+            json_str, buffer = buffer.split('__END__\n', 1)
+            received.append(json.loads(json_str))
+    return received
+
+def reader_decoder(stream, chunk):
+    reader = SnapshotReader()
+    view = memoryview(stream)
+    received = []
+    for i in range(0, len(stream), chunk): received.extend(reader.feed(view[i:i + chunk]))
+    return received
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--chunk", type=int, default=4096)
+    args = parser.parse_args()
+
+    print(f"{'MB':>4}{'originale s':>14}{'delimitat. s':>14}{'frame s':>10}")
+    for size in args.sizes:
+        state = big_state(size)
+        legacy_stream = encode_snapshot(state)
+        framed_stream = encode_message(state)
+        t_original, r1 = timed(original_decoder, legacy_stream, args.chunk)
+        t_legacy, r2 = timed(reader_decoder, legacy_stream, args.chunk)
+        t_framed, r3 = timed(reader_decoder, framed_stream, args.chunk)
+        assert r1 == r2 == r3 == [state]
+        print(f"{size:>4}{t_original:>14.3f}{t_legacy:>14.3f}{t_framed:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark: byte ricevuti da un client che rientra nella stanza dopo una disconnessione.
+
+Avvia un server reale, gioca una partita di N segmenti con quattro client e fa uscire
+uno degli scrittori prima degli ultimi --missed turni. Poi lo fa rientrare due volte:
+  completo  JOIN senza token: WELCOME piu' lo stato completo (GAME_STARTED con tutta
+            la storia e la fase corrente), come prima della ripresa delle sessioni
+  ripresa   JOIN con token e ultima sequenza vista: WELCOME e solo gli eventi persi
+Conta i byte letti dal socket (client come quelli reali: codec binario, batch, delta
+della storia, compressione) per diverse lunghezze della storia; con --no-compress il
+server invia i frame senza compressione.
+
+Uso:  python benchmarks/bench_resume.py [--segments 10 50 200] [--missed 1] [--port 65500] [--no-compress]
+Richiede le porte 7000 (replica) e --port libere. I file di recovery del nodo
+(data/nodes/<porta>) vengono rimossi alla fine.
+"""
+import argparse
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(ROOT, 'src'))
+from common.protocol import (CMD_JOIN, CMD_START_GAME, CMD_SUBMIT, CMD_SELECT_PROPOSAL, CMD_DECIDE_CONTINUE,
+                             CODEC_BINARY, EVT_WELCOME, EVT_GAME_STARTED, EVT_NARRATOR_DECISION_NEEDED,
+                             EVT_ASK_CONTINUE, EVT_NEW_SEGMENT, FramedConnection, ResumeCursor, unpack_batch)
+from server.checkpoint import node_dir
+from server.gamestate import DATA_DIR
+
+SERVER_SCRIPT = os.path.join(ROOT, 'src', 'server', '__main__.py')
+
+class CountingSocket:
+    """Socket che conta i byte ricevuti."""
+    def __init__(self, sock):
+        self.sock = sock
+        self.received = 0
+
+    def recv_into(self, buffer, *args):
+        n = self.sock.recv_into(buffer, *args)
+        self.received += n
+        return n
+
+    def __getattr__(self, name): return getattr(self.sock, name)
+
+class Player:
+    def __init__(self, port, username, room, resume=None, compress=True):
+        self.sock = CountingSocket(socket.create_connection(('127.0.0.1', port)))
+        self.conn = FramedConnection(self.sock)
+        self.conn.accept_compressed = compress
+        self.cursor = ResumeCursor()
+        self.inbox = queue.Queue()
+        self.conn.send_message({"type": CMD_JOIN, "username": username, "room": room, "codec": CODEC_BINARY,
+                                "story_deltas": True, "batch": True, "compress": compress, **(resume or {})})
+        threading.Thread(target=self._listen, daemon=True).start()
+        self.welcome = self.wait_for(EVT_WELCOME)
+
+    def _listen(self):
+        try:
+            while True:
+                msg = self.conn.recv_message()
+                if not msg: break
+                for part in unpack_batch(msg):
+                    if part.get('type') == EVT_WELCOME: self.conn.codec = part.get('codec', self.conn.codec)
+                    if self.cursor.accept(part): self.inbox.put(part)
+        except OSError: pass
+
+    def wait_for(self, msg_type, timeout=10):
+        deadline = time.monotonic() + timeout
+        while True:
+            msg = self.inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+            if msg.get('type') == msg_type: return msg
+
+    def send(self, msg): self.conn.send_message(msg)
+    def close(self): self.conn.close()
+
+def wait_for_port(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError: time.sleep(0.05)
+    return False
+
+def sentence(i):
+    return f"Frase numero {i} della storia, scritta da uno dei giocatori della stanza."
+
+def play_round(narrator, writers, i):
+    for writer in writers:
+        writer.wait_for(EVT_NEW_SEGMENT)
+        writer.send({"type": CMD_SUBMIT, "text": sentence(i)})
+    narrator.wait_for(EVT_NARRATOR_DECISION_NEEDED)
+    narrator.send({"type": CMD_SELECT_PROPOSAL, "proposal_id": 0})
+    narrator.wait_for(EVT_ASK_CONTINUE)
+    narrator.send({"type": CMD_DECIDE_CONTINUE, "action": "CONTINUE"})
+
+def rejoin_bytes(port, room, username, compress, resume=None, settle=0.3):
+    """Byte ricevuti dal JOIN fino a 'settle' secondi di silenzio, e se il server ha fatto la ripresa."""
+    player = Player(port, username, room, resume, compress)
+    last = -1
+    while player.sock.received != last:
+        last = player.sock.received
+        time.sleep(settle)
+    player.close()
+    time.sleep(0.2)   # il server elabora l'uscita prima del prossimo JOIN
+    return player.sock.received, bool(player.welcome.get('resumed'))
+
+def measure(port, segments, missed, compress):
+    room = f"bench-{segments}"
+    players = [Player(port, f"Giocatore_{i}", room, compress=compress) for i in range(4)]
+    try:
+        players[0].send({"type": CMD_START_GAME})
+        started = {p: p.wait_for(EVT_GAME_STARTED) for p in players}
+        narrator = next(p for p in players if started[p].get('am_i_narrator'))
+        writers = [p for p in players if p is not narrator]
+        leaver = writers[-1]
+        for i in range(segments):
+            if i == max(segments - missed, 0):
+                leaver.close()
+                time.sleep(0.2)
+                writers.remove(leaver)
+            play_round(narrator, writers, i)
+        time.sleep(0.2)
+        full, _ = rejoin_bytes(port, room, "Giocatore_3", compress)
+        resumed, ok = rejoin_bytes(port, room, "Giocatore_3", compress, leaver.cursor.join_fields())
+        return full, resumed, ok
+    finally:
+        for p in players: p.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segments", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--missed", type=int, default=1, help="turni giocati mentre il client e' disconnesso")
+    parser.add_argument("--port", type=int, default=65500)
+    parser.add_argument("--no-compress", dest="compress", action="store_false")
+    args = parser.parse_args()
+
+    server = subprocess.Popen([sys.executable, SERVER_SCRIPT, "SLAVE", str(args.port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(args.port): sys.exit("Server non raggiungibile")
+        print(f"{'segmenti':>9}{'completo B':>12}{'ripresa B':>11}{'riduzione':>11}{'ripresa':>9}")
+        for segments in args.segments:
+            full, resumed, ok = measure(args.port, segments, args.missed, args.compress)
+            print(f"{segments:>9}{full:>12}{resumed:>11}{full / resumed:>10.1f}x{'si' if ok else 'no':>9}")
+    finally:
+        server.kill()
+        server.wait()
+        shutil.rmtree(node_dir(DATA_DIR, args.port), ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
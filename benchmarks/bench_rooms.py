@@ -0,0 +1,58 @@
+"""
+Benchmark: costo di memoria delle stanze inattive in un solo processo.
+
+Crea N stanze come fa il server (GameState con il proprio file di recovery, Room,
+CommitScheduler) e misura con tracemalloc i byte per stanza, i file aperti e i
+thread del processo: il thread di scrittura del WAL, i temi e l'archivio storico
+sono condivisi, quindi una stanza vuota costa solo i propri oggetti.
+
+Uso:  python benchmarks/bench_rooms.py [--rooms 100 1000 5000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'server')))
+from server.gamestate import GameState
+from server.rooms import Room, RoomRegistry, room_save_file
+from server.scheduler import CommitScheduler
+
+def build(rooms_dir, count):
+    guard = threading.RLock()
+    def factory(room_id):
+        room = Room(room_id, GameState(save_file=room_save_file(rooms_dir, room_id)))
+        room.scheduler = CommitScheduler(lambda changed, broadcasts: None, guard=guard)
+        return room
+    registry = RoomRegistry(factory)
+    for i in range(count): registry.get_or_create(f"stanza_{i}")
+    return registry
+
+def open_files():
+    try: return len(os.listdir(f"/proc/{os.getpid()}/fd"))
+    except OSError: return -1
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    print(f"{'stanze':>8}{'B/stanza':>12}{'file aperti':>14}{'thread':>8}")
+    for count in args.rooms:
+        rooms_dir = tempfile.mkdtemp()
+        files_before = open_files()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        registry = build(rooms_dir, count)
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{count:>8}{(after - before) / count:>12.0f}{open_files() - files_before:>14}{threading.active_count():>8}")
+        del registry
+        shutil.rmtree(rooms_dir)
+
+if __name__ == "__main__":
+    main()
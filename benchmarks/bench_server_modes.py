@@ -0,0 +1,112 @@
+"""
+Benchmark: server threaded (un thread per client) contro server asyncio (event loop singolo).
+
+Avvia il server reale come sottoprocesso in ciascuna modalita', apre N connessioni,
+esegue il JOIN e misura: connessioni servite, tempo di join, throughput richiesta/risposta,
+thread e memoria residente del processo server.
+
+Uso:  python benchmarks/bench_server_modes.py [--clients 2000] [--rounds 5] [--port 65500]
+Richiede le porte 7000 (replica) e --port libere.
+"""
+import argparse
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(ROOT, 'src'))
+from common.protocol import CMD_HEARTBEAT, CMD_JOIN, encode_frame, recv_json
+
+SERVER_SCRIPT = os.path.join(ROOT, 'src', 'server', '__main__.py')
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try: resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError): pass
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError: time.sleep(0.1)
+    return False
+
+def proc_status(pid):
+    info = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ("Threads", "VmRSS"): info[key] = value.strip()
+    except OSError: pass
+    return info
+
+def run_mode(mode, clients, rounds, port):
+    args = [sys.executable, SERVER_SCRIPT, "SLAVE", str(port)]
+    if mode == "async": args.append("--async")
+    server = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(port): return {"mode": mode, "error": "server non avviato"}
+
+        socks = []
+        heartbeat = encode_frame({"type": CMD_HEARTBEAT})
+        last_sweep = time.time()
+        t0 = time.perf_counter()
+        for i in range(clients):
+            try:
+                s = socket.create_connection(('127.0.0.1', port), timeout=10)
+                s.sendall(encode_frame({"type": CMD_JOIN, "username": f"bench_{i}"}))
+                socks.append(s)
+            except OSError: break
+            # Heartbeat periodico: con molti client la fase di connessione supera HEARTBEAT_TIMEOUT
+            if time.time() - last_sweep > 2:
+                for s in socks: s.sendall(heartbeat)
+                last_sweep = time.time()
+        joined = sum(1 for s in socks if recv_json(s))
+        join_time = time.perf_counter() - t0
+        status = proc_status(server.pid)
+
+        frame = encode_frame({"type": CMD_JOIN, "username": "bench"})
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            for s in socks: s.sendall(frame)
+            for s in socks: recv_json(s)
+        elapsed = time.perf_counter() - t0
+
+        for s in socks: s.close()
+        return {
+            "mode": mode,
+            "connected": joined,
+            "join_s": join_time,
+            "msg_per_s": (rounds * len(socks)) / elapsed if elapsed else 0,
+            "threads": status.get("Threads", "?"),
+            "rss": status.get("VmRSS", "?"),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+        time.sleep(0.5)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--port", type=int, default=65500)
+    opts = parser.parse_args()
+    raise_fd_limit()
+
+    print(f"{'modalita':<10}{'connessi':>10}{'join (s)':>10}{'msg/s':>12}{'thread':>8}{'RSS':>14}")
+    for mode in ("threaded", "async"):
+        r = run_mode(mode, opts.clients, opts.rounds, opts.port)
+        if "error" in r:
+            print(f"{mode:<10} {r['error']}")
+            continue
+        print(f"{r['mode']:<10}{r['connected']:>10}{r['join_s']:>10.2f}{r['msg_per_s']:>12.0f}{r['threads']:>8}{r['rss']:>14}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark: throughput del deployment a shard al crescere dei worker (1..N processi).
+
+Avvia il router reale (src/server/router.py) con 1, 2, ... worker e lo carica con
+piu' processi client, ognuno con molte connessioni in stanze diverse: ogni client
+esegue il JOIN e poi manda richieste STORY_RESYNC in pipeline (una finestra di
+richieste in volo), contando le risposte. Con un solo worker il throughput e'
+limitato da un core e da un lock globale; con N worker cresce fino al numero di
+core della macchina (su una macchina a un core le righe restano uguali).
+
+Uso:  python benchmarks/bench_sharding.py [--workers 1 2 4] [--clients 200] [--seconds 5] [--port 65500]
+Richiede la porta --port libera.
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(ROOT, 'src'))
+from common.protocol import CMD_JOIN, CMD_STORY_RESYNC, FramedConnection
+
+ROUTER_SCRIPT = os.path.join(ROOT, 'src', 'server', 'router.py')
+WINDOW = 8   # richieste in volo per connessione
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError: time.sleep(0.1)
+    return False
+
+def client_process(port, proc_id, clients, seconds, results):
+    """Un processo di carico: 'clients' connessioni, ognuna nella propria stanza."""
+    conns = []
+    for i in range(clients):
+        c = FramedConnection(socket.create_connection(('127.0.0.1', port), timeout=10))
+        c.send_message({"type": CMD_JOIN, "username": f"bench_{proc_id}_{i}", "room": f"bench_{proc_id}_{i}"})
+        conns.append(c)
+    for c in conns: c.recv_message()   # WELCOME
+
+    resync = {"type": CMD_STORY_RESYNC}
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for c in conns:
+            for _ in range(WINDOW): c.send_message(resync)
+        for c in conns:
+            for _ in range(WINDOW):
+                if c.recv_message() is not None: done += 1
+    for c in conns: c.close()
+    results.put(done)
+
+def run(workers, clients, procs, seconds, port):
+    router = subprocess.Popen([sys.executable, ROUTER_SCRIPT, "--workers", str(workers), "--port", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(port): return None
+        time.sleep(0.5 + 0.2 * workers)   # i worker partono dopo il listener del router
+        results = multiprocessing.Queue()
+        per_proc = max(1, clients // procs)
+        jobs = [multiprocessing.Process(target=client_process, args=(port, p, per_proc, seconds, results)) for p in range(procs)]
+        t0 = time.perf_counter()
+        for job in jobs: job.start()
+        total = sum(results.get() for _ in jobs)
+        elapsed = time.perf_counter() - t0
+        for job in jobs: job.join()
+        return total / elapsed
+    finally:
+        router.terminate()
+        router.wait()
+        time.sleep(1)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--procs", type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--port", type=int, default=65500)
+    opts = parser.parse_args()
+
+    print(f"core disponibili: {os.cpu_count()}")
+    print(f"{'worker':>8}{'risposte/s':>14}{'scala':>8}")
+    base = None
+    for workers in opts.workers:
+        rate = run(workers, opts.clients, opts.procs, opts.seconds, opts.port)
+        if rate is None:
+            print(f"{workers:>8}  router non avviato")
+            continue
+        base = base or rate
+        print(f"{workers:>8}{rate:>14.0f}{rate / base:>8.2f}")
+
+if __name__ == "__main__":
+    main()
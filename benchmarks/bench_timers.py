@@ -0,0 +1,80 @@
+"""
+Benchmark: N scadenze in attesa con un threading.Timer ciascuna o con il TimerService.
+
+Pianifica N timer con scadenze distribuite nell'arco di --spread secondi (dopo --delay)
+e ne cancella meta', come le stanze che cambiano fase prima dello scadere. Misura:
+  pianifica ms  tempo per creare e avviare tutti i timer
+  thread        thread attivi in piu' mentre i timer sono in attesa
+  ritardo       ritardo dello scatto rispetto alla scadenza (mediana, p99, massimo)
+threading.Timer crea un thread per timer: oltre --max-threads timer la riga viene saltata
+(con 100000 timer servono minuti e si possono esaurire i limiti del processo).
+
+Uso:  python benchmarks/bench_timers.py [--counts 1000 10000 100000] [--delay 1.0] [--spread 1.0] [--max-threads 10000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from server.timers import TimerService
+
+def thread_timer(delay, callback):
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+def run(schedule, count, delay, spread):
+    fired = [None] * count
+    deadlines = [0.0] * count
+    threads_before = threading.active_count()
+
+    def deadline(i):
+        return lambda: fired.__setitem__(i, time.monotonic())
+    t0 = time.perf_counter()
+    handles = []
+    for i in range(count):
+        offset = delay + spread * i / count
+        deadlines[i] = time.monotonic() + offset
+        handles.append(schedule(offset, deadline(i)))
+    elapsed = time.perf_counter() - t0
+    threads = threading.active_count() - threads_before
+    for handle in handles[::2]: handle.cancel()
+
+    end = time.monotonic() + delay + spread + 10
+    while any(fired[i] is None for i in range(count - 1, 0, -2)) and time.monotonic() < end: time.sleep(0.05)
+    while threading.active_count() > threads_before and time.monotonic() < end: time.sleep(0.05)
+    drift = sorted(fired[i] - deadlines[i] for i in range(1, count, 2) if fired[i] is not None)
+    return elapsed, threads, drift
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--delay", type=float, default=1.0)
+    parser.add_argument("--spread", type=float, default=1.0)
+    parser.add_argument("--max-threads", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'timer':>8}{'modalita':>16}{'pianifica ms':>14}{'thread':>8}{'mediana ms':>12}{'p99 ms':>9}{'max ms':>9}")
+    for count in args.counts:
+        service = TimerService()
+        modes = (("threading.Timer", thread_timer), ("TimerService", service.call_later))
+        for label, schedule in modes:
+            if schedule is thread_timer and count > args.max_threads:
+                print(f"{count:>8}{label:>16}  saltato (oltre --max-threads)")
+                continue
+            try: elapsed, threads, drift = run(schedule, count, args.delay, args.spread)
+            except RuntimeError as e:
+                print(f"{count:>8}{label:>16}  fallito: {e}")
+                time.sleep(args.delay + args.spread)   # i thread gia' avviati terminano
+                continue
+            p99 = drift[int(len(drift) * 0.99)]
+            print(f"{count:>8}{label:>16}{elapsed * 1000:>14.0f}{threads:>8}{statistics.median(drift) * 1000:>12.1f}"
+                  f"{p99 * 1000:>9.1f}{drift[-1] * 1000:>9.1f}")
+        service.close()
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,11 @@ import threading
 import sys
 import os
 import time
+from collections import deque
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from common.protocol import *
+from client.connector import ServerConnector, reconnect_delays
 
 # ==========================================
 # CONFIGURAZIONE CLIENT (HA - 4 NODI)
@@ -25,8 +27,10 @@ STATE_DECIDING_CONTINUE = "DECIDING_CONTINUE"
 STATE_VOTING = "VOTING"
 
 sock = None
+connector = ServerConnector(SERVERS)
 intentional_exit = False
 username_cache = ""
+room_cache = DEFAULT_ROOM
 
 class InputTimer:
     def __init__(self):
@@ -71,6 +75,9 @@ class ClientState:
         self.is_spectator = False
         self.game_running = False
         self.phase = STATE_VIEWING
+        self.story = []
+        self.history_next = None   # cursore della prossima pagina di /storico
+        self.resume = ResumeCursor()   # token e ultimo evento visto: al rientro arrivano solo gli eventi persi
 
 state = ClientState()
 cli_timer = InputTimer()
@@ -79,23 +86,34 @@ def heartbeat_loop(sock_ref):
     while True:
         time.sleep(3)
         try:
-            if sock_ref: send_json(sock_ref, {"type": CMD_HEARTBEAT})
+            if sock_ref: sock_ref.send_message({"type": CMD_HEARTBEAT})
             else: break
         except: break
 
 def listen_from_server(sock_ref):
     global sock, intentional_exit
+    pending = deque()   # eventi di un BATCH ancora da gestire, in ordine
     while True:
         try:
-            msg = recv_json(sock_ref)
+            msg = pending.popleft() if pending else sock_ref.recv_message()
             if not msg: 
                 if intentional_exit: break
                 else: raise Exception("Server closed")
+            if msg.get('type') == EVT_BATCH:
+                pending.extend(unpack_batch(msg))
+                continue
+            # Evento gia' visto prima della disconnessione (ripresa della sessione)
+            if not state.resume.accept(msg): continue
             
             if msg.get('type') == EVT_GOODBYE:
                 print(f"\n[SERVER] {msg.get('msg')}")
                 os._exit(0)
 
+            if msg.get('type') == EVT_HISTORY:
+                # Non tocca il timer di fase: la consultazione puo' avvenire in qualunque momento
+                print_history_page(msg)
+                continue
+
             msg_type = msg.get('type')
             timeout = msg.get('timeout', 0)
             
@@ -104,6 +122,7 @@ def listen_from_server(sock_ref):
 
             if msg_type == EVT_GAME_STARTED:
                 state.game_running = True
+                state.story = []
                 state.am_i_narrator = msg.get('am_i_narrator', False)
                 state.is_spectator = msg.get('is_spectator', False)
                 state.phase = STATE_VIEWING
@@ -136,8 +155,11 @@ def listen_from_server(sock_ref):
                     print(f"\n>>> Inserisci il NUMERO della proposta migliore: <<<")
 
             elif msg_type == EVT_STORY_UPDATE:
+                if not apply_story_update(state.story, msg):
+                    sock_ref.send_message({"type": CMD_STORY_RESYNC, "version": len(state.story)})
+                    continue
                 print("\n\n📖 STORIA AGGIORNATA:")
-                for line in msg.get('story'): print(f" > {line}")
+                for line in state.story: print(f" > {line}")
 
             elif msg_type == EVT_ASK_CONTINUE:
                 print("\nSTORIA AGGIORNATA. Vuoi continuare?")
@@ -171,11 +193,12 @@ def listen_from_server(sock_ref):
 
             elif msg_type == EVT_WELCOME:
                 state.is_leader = msg.get('is_leader')
+                sock_ref.codec = msg.get('codec', CODEC_JSON)
                 print(f"[SERVER] {msg.get('msg')}")
                 if state.is_leader: print("Sei il LEADER. Digita '/start'.")
                 else: print("Attendi l'avvio della partita.")
 
-            elif msg_type == "ERROR":
+            elif msg_type == EVT_ERROR:
                 print(f"\n[ERRORE] {msg.get('msg')}")
 
         except Exception:
@@ -184,36 +207,46 @@ def listen_from_server(sock_ref):
                 reconnect_loop(username_cache)
             break
 
+def print_history_page(msg):
+    stories = msg.get('stories', [])
+    state.history_next = msg.get('next')
+    print("\n--- STORICO ---")
+    if not stories: print("(Nessuna storia archiviata)")
+    for entry in stories:
+        print(f"[{entry['date']}] {entry['theme']} (Narratore: {entry['narrator']})")
+        for line in entry['full_text']: print(f"   > {line}")
+    if state.history_next is not None: print("Scrivi '/altro' per la pagina successiva.")
+
 def connect_to_any_server(username):
     global sock
-    for ip, port in SERVERS:
-        try:
-            print(f"[INFO] Provo {ip}:{port}...")
-            temp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            temp_sock.settimeout(2)
-            temp_sock.connect((ip, port))
-            temp_sock.settimeout(None)
-            sock = temp_sock
-            print(f"[INFO] Connesso!", flush=True)
-            threading.Thread(target=listen_from_server, args=(sock,), daemon=True).start()
-            threading.Thread(target=heartbeat_loop, args=(sock,), daemon=True).start()
-            send_json(sock, {"type": CMD_JOIN, "username": username})
-            return True
-        except: pass
-    return False
+    connected = connector.connect()
+    if not connected: return False
+    temp_sock, (ip, port) = connected
+    try:
+        sock = FramedConnection(temp_sock)
+        sock.accept_compressed = True   # il JOIN chiede la compressione server -> client
+        print(f"[INFO] Connesso a {ip}:{port}!", flush=True)
+        threading.Thread(target=listen_from_server, args=(sock,), daemon=True).start()
+        threading.Thread(target=heartbeat_loop, args=(sock,), daemon=True).start()
+        # Il JOIN viaggia sempre in JSON: il codec binario vale solo se il server lo conferma nel WELCOME
+        sock.send_message({"type": CMD_JOIN, "username": username, "room": room_cache, "codec": CODEC_BINARY, "story_deltas": True, "batch": True, "compress": True,
+                           **state.resume.join_fields()})
+        return True
+    except OSError: return False
 
 def reconnect_loop(username):
     global sock
-    while True:
+    for delay in reconnect_delays():
         if intentional_exit: return
-        time.sleep(2)
         if connect_to_any_server(username): return
         print("[RECONNECT] Nessun server disponibile. Riprovo...", flush=True)
+        time.sleep(delay)
 
 def start_client():
-    global sock, username_cache, intentional_exit
+    global sock, username_cache, room_cache, intentional_exit
     print("--- DISTRIBUTED STORYTELLING CLIENT (CLI) ---")
     username_cache = input("Inserisci Username: ")
+    room_cache = input(f"Stanza (invio per '{DEFAULT_ROOM}'): ").strip() or DEFAULT_ROOM
     
     if not connect_to_any_server(username_cache):
         print("[ERRORE] Impossibile connettersi.")
@@ -235,33 +268,42 @@ def start_client():
             try:
                 if user_input.lower() == "/start":
                     if state.is_leader and not state.game_running: 
-                        send_json(sock, {"type": CMD_START_GAME})
+                        sock.send_message({"type": CMD_START_GAME})
                     else: print("[INFO] Non puoi avviare.")
                     continue
 
+                if user_input.lower() == "/storico":
+                    sock.send_message({"type": CMD_HISTORY})
+                    continue
+                if user_input.lower() == "/altro":
+                    if state.history_next is not None:
+                        sock.send_message({"type": CMD_HISTORY, "before": state.history_next})
+                    else: print("[INFO] Nessuna altra pagina.")
+                    continue
+
                 if state.phase == STATE_VOTING:
                     if user_input.upper() == "S": 
-                        send_json(sock, {"type": CMD_VOTE_RESTART})
+                        sock.send_message({"type": CMD_VOTE_RESTART})
                     elif user_input.upper() == "N": 
-                        send_json(sock, {"type": CMD_VOTE_NO})
+                        sock.send_message({"type": CMD_VOTE_NO})
                         intentional_exit = True
                     else: print("Scrivi 'S' o 'N'.")
                 
                 elif state.phase == STATE_DECIDING_CONTINUE:
                     if user_input.upper() == "C": 
-                        send_json(sock, {"type": CMD_DECIDE_CONTINUE, "action": "CONTINUE"})
+                        sock.send_message({"type": CMD_DECIDE_CONTINUE, "action": "CONTINUE"})
                     elif user_input.upper() == "F": 
-                        send_json(sock, {"type": CMD_DECIDE_CONTINUE, "action": "STOP"})
+                        sock.send_message({"type": CMD_DECIDE_CONTINUE, "action": "STOP"})
                     else: print("Scrivi 'C' o 'F'.")
 
                 elif state.phase == STATE_DECIDING and state.am_i_narrator:
                     try:
                         pid = int(user_input)
-                        send_json(sock, {"type": CMD_SELECT_PROPOSAL, "proposal_id": pid})
+                        sock.send_message({"type": CMD_SELECT_PROPOSAL, "proposal_id": pid})
                     except ValueError: print("Inserisci un numero valido.")
 
                 elif state.phase == STATE_EDITING:
-                     send_json(sock, {"type": CMD_SUBMIT, "text": user_input})
+                     sock.send_message({"type": CMD_SUBMIT, "text": user_input})
                      state.phase = STATE_WAITING
 
                 else:
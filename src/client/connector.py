@@ -0,0 +1,87 @@
+import errno
+import selectors
+import socket
+import time
+
+# ==========================================
+# CONNESSIONE AL MASTER (HAPPY EYEBALLS)
+# ==========================================
+# Solo il master ascolta sulla porta di gioco, ma il client non sa quale nodo lo sia.
+# Invece di provare i nodi uno alla volta, i tentativi partono a breve distanza
+# (CONNECT_STAGGER) e restano in corsa insieme: vince il primo che si connette, gli
+# altri vengono chiusi. Un tentativo rifiutato fa partire subito il successivo.
+# Il nodo che ha risposto per ultimo viene provato per primo alla connessione successiva.
+
+CONNECT_STAGGER = 0.05        # secondi tra l'avvio di due tentativi
+CONNECT_TIMEOUT = 0.5         # secondi concessi a ogni tentativo
+RECONNECT_MIN_DELAY = 0.05    # pausa tra due giri di tentativi, raddoppiata fino al massimo
+RECONNECT_MAX_DELAY = 1.0
+
+IN_PROGRESS = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK)}
+
+class ServerConnector:
+    def __init__(self, servers, stagger=CONNECT_STAGGER, timeout=CONNECT_TIMEOUT):
+        self.servers = list(servers)
+        self.stagger = stagger
+        self.timeout = timeout
+        self.last_master = None   # (ip, porta) dell'ultimo nodo che ha accettato la connessione
+
+    def candidates(self):
+        """Nodi nell'ordine dei tentativi: prima l'ultimo master noto, poi gli altri."""
+        if self.last_master not in self.servers: return list(self.servers)
+        return [self.last_master] + [addr for addr in self.servers if addr != self.last_master]
+
+    def connect(self):
+        """
+        Avvia i tentativi verso tutti i nodi e restituisce (socket bloccante, indirizzo)
+        del primo che si connette, oppure None se nessuno risponde.
+        """
+        queue = self.candidates()
+        selector = selectors.DefaultSelector()
+        pending = {}            # socket -> scadenza del tentativo
+        next_start = time.monotonic()
+        winner = None
+        try:
+            while winner is None and (queue or pending):
+                now = time.monotonic()
+                if queue and (now >= next_start or not pending):
+                    self._start(queue.pop(0), selector, pending, now)
+                    next_start = now + self.stagger
+                    continue
+                wake = min(list(pending.values()) + ([next_start] if queue else []))
+                for key, _ in selector.select(max(0.0, wake - now)):
+                    sock = key.fileobj
+                    selector.unregister(sock)
+                    del pending[sock]
+                    if winner is None and sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0: winner = (sock, key.data)
+                    else: sock.close()
+                now = time.monotonic()
+                for sock in [s for s, deadline in pending.items() if deadline <= now]:
+                    selector.unregister(sock)
+                    del pending[sock]
+                    sock.close()
+        finally:
+            for sock in pending: sock.close()
+            selector.close()
+
+        if winner is None: return None
+        sock, addr = winner
+        sock.setblocking(True)
+        self.last_master = addr
+        return sock, addr
+
+    def _start(self, addr, selector, pending, now):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        if sock.connect_ex(addr) in IN_PROGRESS:
+            selector.register(sock, selectors.EVENT_WRITE, addr)
+            pending[sock] = now + self.timeout
+        else:
+            sock.close()
+
+def reconnect_delays():
+    """Pause tra i giri di tentativi: brevi subito dopo la caduta, poi sempre piu' lunghe."""
+    delay = RECONNECT_MIN_DELAY
+    while True:
+        yield delay
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
@@ -9,6 +9,7 @@ import time
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from common.protocol import *
+from client.connector import ServerConnector, reconnect_delays
 
 # ==========================================
 # CONFIGURAZIONE CLIENT (HA - 4 NODI)
@@ -52,12 +53,17 @@ class StoryClientGUI:
         master.configure(bg=BG_COLOR)
 
         self.sock = None
+        self.connector = ServerConnector(SERVERS)   # ricorda l'ultimo master per le riconnessioni
         self.username = ""
+        self.room = DEFAULT_ROOM
         self.is_leader = False
         self.am_i_narrator = False
         self.is_spectator = False
         self.game_running = False
         self.phase = STATE_VIEWING
+        self.story = []
+        self.history_next = None   # cursore della prossima pagina di /storico
+        self.resume = ResumeCursor()   # token e ultimo evento visto: al rientro arrivano solo gli eventi persi
         
         self.running = True
         self.reconnecting = False 
@@ -107,31 +113,33 @@ class StoryClientGUI:
         if not self.username:
             self.master.destroy()
             return
+        self.room = simpledialog.askstring("Stanza", "Nome della stanza:", initialvalue=DEFAULT_ROOM, parent=self.master) or DEFAULT_ROOM
         self.connect_to_server()
 
-    def connect_to_server(self):
-        """Prova a connettersi ai server disponibili nella lista."""
-        connected = False
-        for ip, port in SERVERS:
-            try:
-                if self.sock: self.sock.close()
-                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.sock.settimeout(2)
-                self.sock.connect((ip, port))
-                self.sock.settimeout(None)
-                self.log(f"[SISTEMA] Connesso a {ip}:{port}", "server")
-                connected = True
-                break
-            except: pass
-        
+    def connect_to_server(self, connected=None):
+        """
+        Si connette al primo server della lista che risponde (tentativi in parallelo),
+        oppure usa la connessione gia' aperta dal ciclo di riconnessione.
+        """
+        connected = connected or self.connector.connect()
         if connected:
+            raw_sock, (ip, port) = connected
+            if self.sock: self.sock.close()
+            self.sock = FramedConnection(raw_sock)
+            self.sock.accept_compressed = True   # il JOIN chiede la compressione server -> client
+            self.log(f"[SISTEMA] Connesso a {ip}:{port}", "server")
+
             self.running = True
             self.reconnecting = False
             self.intentional_exit = False
             threading.Thread(target=self.listen_thread, daemon=True).start()
             threading.Thread(target=self.heartbeat_loop, daemon=True).start()
-            send_json(self.sock, {"type": CMD_JOIN, "username": self.username})
-            self.update_status(f"Connesso come: {self.username}")
+            # Il JOIN viaggia sempre in JSON: il codec binario vale solo se il server lo conferma nel WELCOME
+            # Un nodo appena caduto puo' accettare e chiudere subito: ci pensa il thread di ascolto
+            try: self.sock.send_message({"type": CMD_JOIN, "username": self.username, "room": self.room, "codec": CODEC_BINARY, "story_deltas": True, "batch": True, "compress": True,
+                                         **self.resume.join_fields()})
+            except OSError: pass
+            self.update_status(f"Connesso come: {self.username} (stanza {self.room})")
             self.enable_input()
         else:
             if not self.reconnecting: self.handle_connection_loss()
@@ -147,24 +155,21 @@ class StoryClientGUI:
         threading.Thread(target=self.reconnect_loop, daemon=True).start()
 
     def reconnect_loop(self):
-        while self.reconnecting:
-            for ip, port in SERVERS:
-                try:
-                    temp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    temp_sock.settimeout(1)
-                    temp_sock.connect((ip, port))
-                    temp_sock.close()
-                    self.master.after(0, self.connect_to_server)
-                    return
-                except: pass
-            time.sleep(2)
+        for delay in reconnect_delays():
+            if not self.reconnecting: return
+            connected = self.connector.connect()
+            if connected:
+                self.master.after(0, self.connect_to_server, connected)
+                return
+            time.sleep(delay)
 
     def listen_thread(self):
         while self.running:
             try:
-                msg = recv_json(self.sock)
+                msg = self.sock.recv_message()
                 if not msg: raise Exception("Disconnesso")
-                self.master.after(0, self.process_incoming_message, msg)
+                # Un BATCH viene gestito in un unico giro del loop Tk
+                self.master.after(0, self.process_incoming_messages, unpack_batch(msg))
             except:
                 if self.intentional_exit: break
                 if self.running: self.master.after(0, self.handle_connection_loss)
@@ -174,7 +179,7 @@ class StoryClientGUI:
         while self.running:
             try:
                 time.sleep(3)
-                send_json(self.sock, {"type": CMD_HEARTBEAT})
+                self.sock.send_message({"type": CMD_HEARTBEAT})
             except: break
 
     def start_timer(self, seconds):
@@ -203,20 +208,31 @@ class StoryClientGUI:
                 self.disable_input()
                 self.phase = STATE_WAITING
 
+    def process_incoming_messages(self, messages):
+        for msg in messages: self.process_incoming_message(msg)
+
     def process_incoming_message(self, msg):
+        # Evento gia' visto prima della disconnessione (ripresa della sessione)
+        if not self.resume.accept(msg): return
         msg_type = msg.get('type')
+        if msg_type == EVT_HISTORY:
+            # Non tocca il timer di fase: la consultazione puo' avvenire in qualunque momento
+            self.show_history_page(msg)
+            return
         timeout = msg.get('timeout', 0)
         if timeout: self.start_timer(timeout)
         else: self.stop_timer()
 
         if msg_type == EVT_WELCOME:
             self.is_leader = msg.get('is_leader')
+            self.sock.codec = msg.get('codec', CODEC_JSON)
             self.log(f"Benvenuto, {self.username}.", "server")
             if self.is_leader: self.log(">>> SEI IL LEADER. Scrivi '/start'.", "highlight")
             self.update_status()
 
         elif msg_type == EVT_GAME_STARTED:
             self.game_running = True
+            self.story = []
             self.am_i_narrator = msg.get('am_i_narrator', False)
             self.is_spectator = msg.get('is_spectator', False)
             self.phase = STATE_VIEWING
@@ -253,8 +269,11 @@ class StoryClientGUI:
                 self.update_status()
 
         elif msg_type == EVT_STORY_UPDATE:
+            if not apply_story_update(self.story, msg):
+                self.sock.send_message({"type": CMD_STORY_RESYNC, "version": len(self.story)})
+                return
             self.log("\nAGGIORNAMENTO STORIA:", "server")
-            for line in msg.get('story'): self.log(f"{line}", "story")
+            for line in self.story: self.log(f"{line}", "story")
             self.disable_input()
 
         elif msg_type == EVT_ASK_CONTINUE:
@@ -308,9 +327,19 @@ class StoryClientGUI:
                  except: pass
              self.master.after(2000, self.master.destroy)
 
-        elif msg_type == "ERROR":
+        elif msg_type == EVT_ERROR:
             self.log(f"[ERRORE] {msg.get('msg')}", "error")
 
+    def show_history_page(self, msg):
+        stories = msg.get('stories', [])
+        self.history_next = msg.get('next')
+        self.log("\n--- STORICO ---", "highlight")
+        if not stories: self.log("(Nessuna storia archiviata)", "info")
+        for entry in stories:
+            self.log(f"[{entry['date']}] {entry['theme']} (Narratore: {entry['narrator']})", "narrator")
+            for line in entry['full_text']: self.log(f"   > {line}")
+        if self.history_next is not None: self.log("Scrivi '/altro' per la pagina successiva.", "info")
+
     def send_message_btn(self): self.send_message(None)
     def send_message(self, event):
         text = self.entry_field.get().strip()
@@ -323,12 +352,20 @@ class StoryClientGUI:
             return
         if text.lower() == "/start":
             if self.is_leader and not self.game_running: 
-                send_json(self.sock, {"type": CMD_START_GAME})
+                self.sock.send_message({"type": CMD_START_GAME})
             else: self.log("Non puoi avviare.", "error")
             return
+        if text.lower() == "/storico":
+            self.sock.send_message({"type": CMD_HISTORY})
+            return
+        if text.lower() == "/altro":
+            if self.history_next is not None:
+                self.sock.send_message({"type": CMD_HISTORY, "before": self.history_next})
+            else: self.log("Nessuna altra pagina.", "info")
+            return
 
         if self.phase == STATE_EDITING:
-            send_json(self.sock, {"type": CMD_SUBMIT, "text": text})
+            self.sock.send_message({"type": CMD_SUBMIT, "text": text})
             self.phase = STATE_WAITING
             self.log(f"Tu: {text}", "info")
             self.disable_input()
@@ -338,7 +375,7 @@ class StoryClientGUI:
         elif self.phase == STATE_DECIDING and self.am_i_narrator:
             try:
                 pid = int(text)
-                send_json(self.sock, {"type": CMD_SELECT_PROPOSAL, "proposal_id": pid})
+                self.sock.send_message({"type": CMD_SELECT_PROPOSAL, "proposal_id": pid})
                 self.phase = STATE_VIEWING
                 self.log(f"Scelta #{pid}.", "info")
                 self.disable_input()
@@ -349,10 +386,10 @@ class StoryClientGUI:
         elif self.phase == STATE_DECIDING_CONTINUE:
             t = text.upper()
             if t == "C": 
-                send_json(self.sock, {"type": CMD_DECIDE_CONTINUE, "action": "CONTINUE"})
+                self.sock.send_message({"type": CMD_DECIDE_CONTINUE, "action": "CONTINUE"})
                 self.phase = STATE_VIEWING; self.disable_input(); self.stop_timer()
             elif t == "F": 
-                send_json(self.sock, {"type": CMD_DECIDE_CONTINUE, "action": "STOP"})
+                self.sock.send_message({"type": CMD_DECIDE_CONTINUE, "action": "STOP"})
                 self.phase = STATE_VIEWING; self.disable_input(); self.stop_timer()
             else: self.log("Usa 'C' o 'F'.", "error")
             self.update_status()
@@ -360,10 +397,10 @@ class StoryClientGUI:
         elif self.phase == STATE_VOTING:
             t = text.upper()
             if t == "S": 
-                send_json(self.sock, {"type": CMD_VOTE_RESTART})
+                self.sock.send_message({"type": CMD_VOTE_RESTART})
                 self.log("Voto SÌ.", "info"); self.stop_timer()
             elif t == "N": 
-                send_json(self.sock, {"type": CMD_VOTE_NO})
+                self.sock.send_message({"type": CMD_VOTE_NO})
                 self.log("Voto NO.", "info"); self.stop_timer()
             else: self.log("Usa 'S' o 'N'.", "error")
 
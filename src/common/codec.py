@@ -0,0 +1,162 @@
+import struct
+
+# ==========================================
+# CODEC BINARIO COMPATTO
+# ==========================================
+# Corpo del frame: [Opcode (1 byte)] + [Campi]
+# L'opcode sostituisce la stringa "type"; i campi sono codificati come
+# dizionario con chiavi note ridotte a un indice e valori con tag di 1 byte.
+# Gli opcode restano sotto 0x7B ('{'), cosi' un corpo binario non e' mai
+# confondibile con un corpo JSON sulla stessa porta.
+
+T_NONE = 0
+T_FALSE = 1
+T_TRUE = 2
+T_INT = 3
+T_FLOAT = 4
+T_STR = 5
+T_LIST = 6
+T_DICT = 7
+
+JSON_MARKER = 0x7B
+FLOAT = struct.Struct('!d')
+
+def _write_varint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80: return result, pos
+        shift += 7
+
+class BinaryCodec:
+    """
+    Codifica/decodifica i messaggi {"type": ..., campi...} in forma binaria.
+    'types' e 'fields' sono le tabelle condivise da client e server: l'ordine
+    definisce gli opcode e gli indici dei campi, quindi si estendono solo in coda.
+    """
+    def __init__(self, types, fields):
+        assert len(types) < JSON_MARKER, "Troppi opcode: collisione con il marker JSON"
+        self.types = list(types)
+        self.opcodes = {name: i + 1 for i, name in enumerate(self.types)}
+        self.fields = list(fields)
+        self.field_ids = {name: i for i, name in enumerate(self.fields)}
+
+    def can_encode(self, data):
+        return data.get('type') in self.opcodes
+
+    def encode(self, data, extra_fields=0):
+        """
+        extra_fields: campi che il chiamante accodera' con encode_field
+        (usato per patchare un campo diverso per ogni destinatario).
+        """
+        out = bytearray()
+        out.append(self.opcodes[data['type']])
+        self._write_dict(out, data, skip_type=True, extra_fields=extra_fields)
+        return bytes(out)
+
+    def encode_field(self, key, value):
+        """Codifica una singola coppia chiave/valore da accodare a encode(..., extra_fields=1)."""
+        out = bytearray()
+        self._write_key(out, key)
+        self._write_value(out, value)
+        return bytes(out)
+
+    def decode(self, buf):
+        opcode = buf[0]
+        if not 0 < opcode <= len(self.types): raise ValueError(f"Opcode sconosciuto: {opcode}")
+        msg = {'type': self.types[opcode - 1]}
+        fields, _ = self._read_dict(buf, 1)
+        msg.update(fields)
+        return msg
+
+    # --- Scrittura ---
+    def _write_key(self, out, key):
+        field_id = self.field_ids.get(key)
+        if field_id is not None:
+            _write_varint(out, field_id << 1)
+        else:
+            raw = key.encode('utf-8')
+            _write_varint(out, (len(raw) << 1) | 1)
+            out += raw
+
+    def _write_dict(self, out, data, skip_type=False, extra_fields=0):
+        count = len(data) - (1 if skip_type else 0) + extra_fields
+        _write_varint(out, count)
+        for key, value in data.items():
+            if skip_type and key == 'type': continue
+            self._write_key(out, key)
+            self._write_value(out, value)
+
+    def _write_value(self, out, value):
+        if value is None: out.append(T_NONE)
+        elif value is True: out.append(T_TRUE)
+        elif value is False: out.append(T_FALSE)
+        elif isinstance(value, int):
+            out.append(T_INT)
+            _write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+        elif isinstance(value, float):
+            out.append(T_FLOAT)
+            out += FLOAT.pack(value)
+        elif isinstance(value, str):
+            raw = value.encode('utf-8')
+            out.append(T_STR)
+            _write_varint(out, len(raw))
+            out += raw
+        elif isinstance(value, (list, tuple)):
+            out.append(T_LIST)
+            _write_varint(out, len(value))
+            for item in value: self._write_value(out, item)
+        elif isinstance(value, dict):
+            out.append(T_DICT)
+            self._write_dict(out, value)
+        else:
+            raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+
+    # --- Lettura ---
+    def _read_dict(self, buf, pos):
+        count, pos = _read_varint(buf, pos)
+        result = {}
+        for _ in range(count):
+            key_code, pos = _read_varint(buf, pos)
+            if key_code & 1:
+                end = pos + (key_code >> 1)
+                key = str(buf[pos:end], 'utf-8')
+                pos = end
+            else:
+                key = self.fields[key_code >> 1]
+            result[key], pos = self._read_value(buf, pos)
+        return result, pos
+
+    def _read_value(self, buf, pos):
+        tag = buf[pos]
+        pos += 1
+        if tag == T_STR:
+            length, pos = _read_varint(buf, pos)
+            return str(buf[pos:pos + length], 'utf-8'), pos + length
+        if tag == T_INT:
+            raw, pos = _read_varint(buf, pos)
+            return ((raw >> 1) if not raw & 1 else -((raw + 1) >> 1)), pos
+        if tag == T_TRUE: return True, pos
+        if tag == T_FALSE: return False, pos
+        if tag == T_NONE: return None, pos
+        if tag == T_LIST:
+            count, pos = _read_varint(buf, pos)
+            items = []
+            for _ in range(count):
+                item, pos = self._read_value(buf, pos)
+                items.append(item)
+            return items, pos
+        if tag == T_DICT:
+            return self._read_dict(buf, pos)
+        if tag == T_FLOAT:
+            return FLOAT.unpack_from(buf, pos)[0], pos + FLOAT.size
+        raise ValueError(f"Tag sconosciuto: {tag}")
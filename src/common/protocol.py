@@ -1,5 +1,12 @@
 import json
+import os
+import socket
 import struct
+import threading
+import zlib
+from collections import deque
+
+from common.codec import BinaryCodec, JSON_MARKER
 
 # --- COMMANDS (Client -> Server) ---
 CMD_START_GAME = "START_GAME"
@@ -11,6 +18,8 @@ CMD_SELECT_PROPOSAL = "SELECT_PROPOSAL"
 CMD_DECIDE_CONTINUE = "DECIDE_CONTINUE" 
 CMD_VOTE_RESTART = "VOTE_RESTART"
 CMD_VOTE_NO = "VOTE_NO"
+CMD_STORY_RESYNC = "STORY_RESYNC"
+CMD_HISTORY = "GET_HISTORY"
 
 # --- EVENTS (Server -> Client) ---
 EVT_GAME_STARTED = "GAME_STARTED"
@@ -29,30 +38,253 @@ EVT_RETURN_TO_LOBBY = "RETURN_TO_LOBBY"
 EVT_GOODBYE = "GOODBYE"
 EVT_LEADER_UPDATE = "LEADER_UPDATE"  
 
+EVT_ERROR = "ERROR"
+EVT_BATCH = "BATCH"
+EVT_HISTORY = "HISTORY"
+
+# --- CODECS (negotiated in CMD_JOIN via the "codec" field) ---
+CODEC_JSON = "json"
+CODEC_BINARY = "bin"
+
+# --- ROOMS (chosen in CMD_JOIN via the "room" field) ---
+# Clients that send no room id (legacy clients) join the default room.
+DEFAULT_ROOM = "main"
+
+# --- COMPRESSION (negotiated in CMD_JOIN via the "compress" field) ---
+# The high bit of the length header marks a zlib-compressed body. Each frame is
+# compressed on its own, so a compressed broadcast can still be shared by all recipients.
+COMPRESSED_FLAG = 0x80000000
+LENGTH_MASK = 0x7FFFFFFF
+COMPRESS_THRESHOLD = 512   # bodies below this size are never worth compressing
+COMPRESS_LEVEL = 6
+# Upper bound for a frame body (also after decompression): larger frames are rejected
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# Client -> server commands are small: the server applies this tighter limit
+MAX_COMMAND_SIZE = 64 * 1024
+
+# Opcode table for the binary codec: append only, the order is the wire format.
+MESSAGE_TYPES = [
+    CMD_START_GAME, CMD_JOIN, CMD_SUBMIT, CMD_HEARTBEAT, CMD_DISCONNECT,
+    CMD_SELECT_PROPOSAL, CMD_DECIDE_CONTINUE, CMD_VOTE_RESTART, CMD_VOTE_NO,
+    EVT_GAME_STARTED, EVT_WELCOME, EVT_NEW_ROUND, EVT_NEW_SEGMENT, EVT_UPDATE_PROPOSALS,
+    EVT_NARRATOR_ASSIGNED, EVT_NARRATOR_DECISION_NEEDED, EVT_PROPOSAL_ACK, EVT_STORY_UPDATE,
+    EVT_ASK_CONTINUE, EVT_GAME_ENDED, EVT_VOTE_UPDATE, EVT_RETURN_TO_LOBBY, EVT_GOODBYE,
+    EVT_LEADER_UPDATE, EVT_ERROR, CMD_STORY_RESYNC, EVT_BATCH, CMD_HISTORY, EVT_HISTORY,
+]
+
+# Field names sent as a one-byte index instead of a string: append only.
+MESSAGE_FIELDS = [
+    "msg", "is_leader", "narrator", "theme", "am_i_narrator", "is_spectator",
+    "story", "segment_id", "timeout", "proposals", "id", "author", "text",
+    "count", "needed", "final_story", "username", "proposal_id", "action", "codec",
+    "version", "segment", "story_deltas", "events", "type", "batch", "compress",
+    "before", "limit", "stories", "next", "date", "full_text", "room",
+    "seq", "resume", "last_seq", "resumed",
+]
+
+BINARY = BinaryCodec(MESSAGE_TYPES, MESSAGE_FIELDS)
+
+try: IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError): IOV_MAX = 1024
+
+# !I = Network byte order, unsigned int
+HEADER = struct.Struct('!I')
+HEADER_SIZE = HEADER.size
+
+def encode_body(data, codec=CODEC_JSON):
+    """Serializes a message with the given codec (JSON fallback for unknown types)."""
+    if codec == CODEC_BINARY and BINARY.can_encode(data):
+        return BINARY.encode(data)
+    return json.dumps(data).encode('utf-8')
+
+def frame_body(body, compress=False):
+    """
+    Returns [header, body] for an already encoded body.
+    With compress=True large bodies are zlib-compressed when it actually saves bytes.
+    """
+    if compress and len(body) >= COMPRESS_THRESHOLD:
+        packed = zlib.compress(body, COMPRESS_LEVEL)
+        if len(packed) < len(body):
+            return [HEADER.pack(len(packed) | COMPRESSED_FLAG), packed]
+    return [HEADER.pack(len(body)), body]
+
+def encode_frame(data, codec=CODEC_JSON, compress=False):
+    """Serializes data and prepends the 4-byte length header."""
+    return b"".join(frame_body(encode_body(data, codec), compress))
+
+def decompress_body(raw_msg, max_size=MAX_FRAME_SIZE):
+    """Inflates a compressed body, refusing to produce more than max_size bytes."""
+    inflater = zlib.decompressobj()
+    body = inflater.decompress(raw_msg, max_size + 1)
+    if len(body) > max_size or inflater.unconsumed_tail:
+        raise ValueError("Decompressed frame exceeds the maximum size")
+    return body
+
+def decode_frame(header, raw_msg, allow_compressed=False, max_size=MAX_FRAME_SIZE):
+    """
+    Deserializes a frame body given its raw length header.
+    Compressed bodies are accepted only if the receiver negotiated compression
+    for this direction (allow_compressed); otherwise the frame is rejected.
+    """
+    if header & COMPRESSED_FLAG:
+        if not allow_compressed: raise ValueError("Compressed frame not negotiated")
+        raw_msg = decompress_body(raw_msg, max_size)
+    return decode_body(raw_msg)
+
+class SharedFrame:
+    """
+    Broadcast frame encoded (and compressed) at most once per codec.
+    Every recipient with the same settings receives the very same immutable buffers.
+    """
+    __slots__ = ('msg', '_buffers')
+
+    def __init__(self, msg):
+        self.msg = msg
+        self._buffers = {}
+
+    def buffers_for(self, codec, compress=False):
+        buffers = self._buffers.get((codec, compress))
+        if buffers is None:
+            if compress and (codec, False) in self._buffers:
+                body = self._buffers[(codec, False)][1]
+            else:
+                body = encode_body(self.msg, codec)
+            buffers = self._buffers[(codec, compress)] = frame_body(body, compress)
+        return buffers
+
+
+class PersonalizedFrame:
+    """
+    Broadcast frame where a single field differs per recipient (e.g. "am_i_narrator").
+    The shared part of the body is encoded once per codec; each distinct value only
+    costs a small tail (key + value) and its own length header.
+    Buffers: [header, shared prefix, personal tail].
+    """
+    def __init__(self, msg, key):
+        self.msg = msg
+        self.key = key
+        self._common = {k: v for k, v in msg.items() if k != key}
+        self._prefix = {}
+        self._variants = {}
+
+    def _prefix_for(self, codec):
+        prefix = self._prefix.get(codec)
+        if prefix is None:
+            if codec == CODEC_BINARY and BINARY.can_encode(self._common):
+                prefix = BINARY.encode(self._common, extra_fields=1)
+            else:
+                # '{...}' -> '{..., ' : la coda chiude l'oggetto
+                prefix = json.dumps(self._common).encode('utf-8')[:-1] + (b', ' if self._common else b'')
+            self._prefix[codec] = prefix
+        return prefix
+
+    def buffers_for(self, codec, value):
+        variant = self._variants.get((codec, value))
+        if variant is None:
+            prefix = self._prefix_for(codec)
+            if codec == CODEC_BINARY and BINARY.can_encode(self._common):
+                tail = BINARY.encode_field(self.key, value)
+            else:
+                tail = (json.dumps(self.key) + ': ' + json.dumps(value) + '}').encode('utf-8')
+            variant = self._variants[(codec, value)] = [HEADER.pack(len(prefix) + len(tail)), prefix, tail]
+        return variant
+
+
+def decode_body(raw_msg):
+    """
+    Deserializes a frame body (without header) into a dictionary.
+    JSON bodies always start with '{', binary bodies with an opcode below it.
+    """
+    if raw_msg[0] == JSON_MARKER:
+        return json.loads(bytes(raw_msg).decode('utf-8'))
+    return BINARY.decode(raw_msg)
+
+def make_batch(events):
+    """
+    Wraps an ordered list of events into a single EVT_BATCH message, so they
+    travel in one frame and are handled by the client in one wake-up.
+    Only sent to clients that announced "batch" in CMD_JOIN.
+    """
+    return {"type": EVT_BATCH, "events": list(events)}
+
+def unpack_batch(msg):
+    """Returns the ordered events carried by msg (the message itself if it is not a batch)."""
+    if msg.get('type') == EVT_BATCH: return msg.get('events', [])
+    return [msg]
+
+class ResumeCursor:
+    """
+    Client side of session resume. Room-wide events carry a per-room "seq"; WELCOME
+    carries the room's resume token and the sequence already reflected in the state
+    sent with it. On reconnect the client sends both back in CMD_JOIN ("resume",
+    "last_seq"): the server then replays only the missed events (WELCOME with
+    "resumed") or falls back to the full rejoin state.
+    """
+    def __init__(self):
+        self.token = None
+        self.last_seq = 0
+
+    def join_fields(self):
+        """Extra CMD_JOIN fields: empty until the first WELCOME."""
+        if self.token is None: return {}
+        return {"resume": self.token, "last_seq": self.last_seq}
+
+    def accept(self, msg):
+        """Tracks msg; returns False for a room event already seen (to be skipped)."""
+        if msg.get('type') == EVT_WELCOME:
+            self.token = msg.get('resume')
+            if not msg.get('resumed'): self.last_seq = msg.get('last_seq', 0)
+            return True
+        seq = msg.get('seq')
+        if seq is None: return True
+        if seq <= self.last_seq: return False
+        self.last_seq = seq
+        return True
+
+def apply_story_update(story, msg):
+    """
+    Applies a STORY_UPDATE to the local story copy (in place).
+    Full updates carry "story"; deltas carry the new "segment" and the
+    resulting "version" (= number of segments). Returns False on a version
+    gap: the client must then ask for a resync with CMD_STORY_RESYNC.
+    """
+    if 'story' in msg:
+        story[:] = msg['story']
+        return True
+    version = msg.get('version', 0)
+    if version <= len(story): return True
+    if version == len(story) + 1:
+        story.append(msg.get('segment'))
+        return True
+    return False
+
+def send_msg(sock, data, codec=CODEC_JSON):
+    """Sends a length-prefixed message encoded with the negotiated codec."""
+    sock.sendall(encode_frame(data, codec))
+
 def send_json(sock, data):
     """
     Serializes data to JSON and sends it with a 4-byte length header.
     Format: [Length (4 bytes)] + [JSON Body]
     """
-    msg_body = json.dumps(data).encode('utf-8')
-    # !I = Network byte order, unsigned int
-    msg_len = struct.pack('!I', len(msg_body))
-    sock.sendall(msg_len + msg_body)
+    sock.sendall(encode_frame(data))
 
-def recv_json(sock):
+def recv_json(sock, allow_compressed=False, max_size=MAX_FRAME_SIZE):
     """
-    Receives a length-prefixed JSON message handling TCP fragmentation.
-    Returns the deserialized dictionary or None on error.
+    Receives a length-prefixed message (JSON or binary) handling TCP fragmentation.
+    Returns the deserialized dictionary or None on error or if the announced
+    length exceeds max_size (nothing is buffered for such a frame).
     """
     try:
         # Read header (4 bytes)
-        raw_msglen = recvall(sock, 4)
+        raw_msglen = recvall(sock, HEADER_SIZE)
         if not raw_msglen: return None
-        msglen = struct.unpack('!I', raw_msglen)[0]
+        header = HEADER.unpack(raw_msglen)[0]
+        if header & LENGTH_MASK > max_size: return None
         
         # Read body
-        raw_msg = recvall(sock, msglen)
-        return json.loads(raw_msg.decode('utf-8'))
+        raw_msg = recvall(sock, header & LENGTH_MASK)
+        return decode_frame(header, raw_msg, allow_compressed, max_size)
     except Exception: return None
 
 def recvall(sock, n):
@@ -62,4 +294,182 @@ def recvall(sock, n):
         packet = sock.recv(n - len(data))
         if not packet: return None
         data.extend(packet)
-    return data
\ No newline at end of file
+    return data
+
+
+class FrameTooLarge(ValueError):
+    """The peer announced a frame larger than the receiver's limit."""
+
+
+class FrameBuffer:
+    """
+    Bounded incremental decoder for length-prefixed frames.
+    The socket (or asyncio transport) writes directly into writable_view(), or
+    arbitrary chunks are passed to feed(); parse() then decodes every complete
+    frame through memoryview slices and never blocks.
+    A header announcing more than max_frame_size bytes raises FrameTooLarge
+    before anything is allocated, so a connection never holds more than
+    HEADER_SIZE + max_frame_size bytes (see memory_usage); the buffer returns
+    to its initial size once an oversized frame has been consumed.
+    """
+    def __init__(self, size=64 * 1024, max_frame_size=MAX_FRAME_SIZE):
+        self.allow_compressed = False   # set once the peer negotiated compression towards us
+        self.max_frame_size = max_frame_size
+        self._initial_size = size
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0   # first byte not yet parsed
+        self._end = 0     # end of received data
+
+    @property
+    def memory_usage(self):
+        """Bytes currently allocated for this connection's receive buffer."""
+        return len(self._buf)
+
+    @property
+    def buffered(self):
+        """Bytes received but not yet decoded (a partial frame)."""
+        return self._end - self._start
+
+    def writable_view(self):
+        """Returns the free tail of the buffer, making room if it is full."""
+        if self._end == len(self._buf):
+            # Sposta in testa il frame parziale per liberare spazio in coda
+            pending = self._end - self._start
+            self._buf[:pending] = self._buf[self._start:self._end]
+            self._start, self._end = 0, pending
+        return self._view[self._end:]
+
+    def commit(self, nbytes):
+        self._end += nbytes
+
+    def feed(self, data):
+        """
+        Copies a chunk of input of any size (e.g. from a non-blocking socket)
+        and returns the complete messages it finished: zero or more.
+        """
+        data = memoryview(data)
+        messages = []
+        while len(data):
+            n = self._copy_in(data)
+            data = data[n:]
+            messages.extend(self.parse())
+        return messages
+
+    def _copy_in(self, data):
+        view = self.writable_view()
+        n = min(len(view), len(data))
+        view[:n] = data[:n]
+        self.commit(n)
+        return n
+
+    def parse(self):
+        """Decodes and returns all complete frames currently buffered."""
+        messages = []
+        buf, view = self._buf, self._view
+        while self._end - self._start >= HEADER_SIZE:
+            header = HEADER.unpack_from(buf, self._start)[0]
+            msglen = header & LENGTH_MASK
+            if msglen > self.max_frame_size:
+                raise FrameTooLarge(f"Frame of {msglen} bytes exceeds the limit of {self.max_frame_size}")
+            frame_end = self._start + HEADER_SIZE + msglen
+            if frame_end > self._end:
+                if HEADER_SIZE + msglen > len(buf): self._resize(HEADER_SIZE + msglen)
+                break
+            messages.append(decode_frame(header, view[self._start + HEADER_SIZE:frame_end], self.allow_compressed, self.max_frame_size))
+            self._start = frame_end
+        if self._start == self._end:
+            self._start = self._end = 0
+            if len(self._buf) > self._initial_size: self._resize(self._initial_size)
+        return messages
+
+    def _resize(self, size):
+        """Reallocates the buffer: grows for a frame larger than it, shrinks back once it is consumed."""
+        pending = self._end - self._start
+        if size > len(self._buf):
+            size = min(max(size, len(self._buf) * 2), HEADER_SIZE + self.max_frame_size)
+        new_buf = bytearray(size)
+        new_buf[:pending] = self._view[self._start:self._end]
+        # Niente release(): il trasporto asyncio puo' ancora tenere una slice del vecchio buffer
+        self._buf, self._view = new_buf, memoryview(new_buf)
+        self._start, self._end = 0, pending
+
+
+class FramedConnection:
+    """
+    Buffered framed connection over a socket.
+    Reads large chunks with recv_into into a FrameBuffer and returns every
+    complete frame already present without further syscalls; sends header and
+    body as separate iovecs with a single sendmsg, without concatenating them.
+    """
+    RECV_BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, sock, codec=CODEC_JSON, bufsize=RECV_BUFFER_SIZE, max_frame_size=MAX_FRAME_SIZE):
+        self.sock = sock
+        self.codec = codec
+        self.compress = False
+        self._frames = FrameBuffer(bufsize, max_frame_size)
+        self._inbox = deque()
+        self._send_lock = threading.Lock()
+
+    @property
+    def accept_compressed(self): return self._frames.allow_compressed
+
+    @accept_compressed.setter
+    def accept_compressed(self, value): self._frames.allow_compressed = value
+
+    # --- Socket-like API ---
+    def fileno(self): return self.sock.fileno()
+    def getpeername(self): return self.sock.getpeername()
+    def settimeout(self, value): self.sock.settimeout(value)
+
+    def close(self):
+        # shutdown sveglia un eventuale thread bloccato in recv_into sullo stesso socket
+        try: self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError: pass
+        self.sock.close()
+
+    def sendall(self, data):
+        with self._send_lock:
+            self.sock.sendall(data)
+
+    # --- Sending ---
+    def send_message(self, data):
+        """Encodes data with the connection codec and sends it as one frame."""
+        self.send_buffers(frame_body(encode_body(data, self.codec), self.compress))
+
+    def send_buffers(self, buffers):
+        """Writes a list of buffers with scatter-gather sendmsg, resuming after partial writes."""
+        with self._send_lock:
+            if not hasattr(self.sock, 'sendmsg'):
+                self.sock.sendall(b"".join(buffers))
+                return
+            pending = [memoryview(b) for b in buffers if len(b)]
+            first = 0
+            while first < len(pending):
+                # Al massimo IOV_MAX iovec per chiamata, altrimenti sendmsg fallisce con EMSGSIZE
+                sent = self.sock.sendmsg(pending[first:first + IOV_MAX])
+                while sent:
+                    if sent >= len(pending[first]):
+                        sent -= len(pending[first])
+                        first += 1
+                    else:
+                        pending[first] = pending[first][sent:]
+                        sent = 0
+
+    # --- Receiving ---
+    def feed(self, data):
+        """Queues frames already read from this socket elsewhere (e.g. by the shard router)."""
+        self._inbox.extend(self._frames.feed(data))
+
+    def recv_message(self):
+        """Returns the next decoded message, or None if the peer closed or sent garbage."""
+        try:
+            # FrameTooLarge (header oltre il limite) chiude la connessione come ogni errore di framing
+            while not self._inbox:
+                n = self.sock.recv_into(self._frames.writable_view())
+                if not n: return None
+                self._frames.commit(n)
+                self._inbox.extend(self._frames.parse())
+            return self._inbox.popleft()
+        except Exception: return None
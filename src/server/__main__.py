@@ -1,33 +1,60 @@
 import socket
+import signal
 import threading
 import sys
 import os
 import time
 import random 
-import json
+import itertools
+import functools
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from common.protocol import *
-from gamestate import GameState
+from gamestate import GameState, DATA_DIR, history_store
+from aioserver import AsyncGameServer
+from server.outbound import QueuedConnection
+from server.scheduler import CommitScheduler, thread_schedule
+from server.rooms import Room, RoomRegistry, valid_room_id
+from server.checkpoint import adopt_checkpoint, freshest_checkpoint, node_dir, prune_checkpoint, recovery_file, rooms_dir
+from server.history import DEFAULT_PAGE_SIZE
+from server.replication import (
+    LEASE_RENEW_INTERVAL, LEASE_TIMEOUT, MAX_REPLICA_LAG, RECV_BUFFER_SIZE, ReplicationLog, SlaveLink, SnapshotReader,
+    encode_message, encode_snapshot, is_lease_renewal, make_hello, make_lease, read_hello,
+)
+from server.sharding import recv_handoff, shard_for
+from server.wal import shared_writer
 
 HOST = '127.0.0.1'
 GAME_PORT_MASTER = 65432
 REPLICATION_PORT = 7000  
 REPLICATION_HOST = '127.0.0.1'
 
+# Modalita' del server di gioco: un thread per client oppure un unico event loop asyncio
+MODE_THREADED = "THREADED"
+MODE_ASYNC = "ASYNC"
+SERVER_MODE = MODE_THREADED
+
 TIME_PROPOSAL = 60
 TIME_SELECTION = 30
 TIME_VOTING = 30
 HEARTBEAT_TIMEOUT = 8
+COMMIT_WINDOW = 0.01   # secondi in cui le modifiche vengono accorpate in un unico commit
+REPLICA_STATUS_TICKS = 15   # ogni quanti controlli (da 2 s) si stampa il ritardo degli slave
+CHECKPOINT_INTERVAL = 0     # secondi tra i checkpoint di uno standby (0: solo alla promozione)
 
-game_state = GameState()
-active_connections = {} 
-last_active = {} 
+active_connections = {}            # sessione -> connessione (anche prima del JOIN): heartbeat e invii diretti
+session_ids = itertools.count(1)   # id di sessione interi: chiavi di active_connections e GameState
 lock = threading.RLock()
-game_timer = None 
+async_server = None
 
 AM_I_MASTER = False
-SLAVE_SOCKETS = [] 
+SLAVE_LINKS = [] 
+replication_log = ReplicationLog()   # operazioni numerate: scritto dal master, seguito dallo slave
+NODE_DIR = DATA_DIR          # file di recovery di questo nodo: data/nodes/<porta> (data/ per i worker a shard)
+standby_synced = False       # lo standby ha ricevuto lo stato dal master: la memoria e' piu' recente del disco
+standby_dirty = {}           # room_id -> stanza modificata dall'ultimo checkpoint dello standby
+SHARD_INDEX = None           # worker di un deployment a shard: indice del worker e numero di worker
+SHARD_COUNT = None
 
 # =========================================================
 #  LOGICA DI ELEZIONE E REPLICAZIONE
@@ -41,100 +68,245 @@ def replication_listener_loop(server_sock):
         
         while True:
             conn, addr = server_sock.accept()
-            with lock:
-                SLAVE_SOCKETS.append(conn)
-            send_state_to_single_socket(conn)
+            # L'attesa dell'HELLO non deve bloccare l'accept degli altri slave
+            threading.Thread(target=register_slave, args=(conn,), daemon=True).start()
     except Exception as e:
         print(f"[REPLICA-ERROR] Listener terminato: {e}")
 
-def send_state_to_single_socket(sock):
-    try:
-        state_data = game_state.get_state_dict()
-        msg_body = json.dumps(state_data).encode('utf-8')
-        sock.sendall(msg_body + b'\n__END__\n')
-    except Exception:
-        with lock:
-            if sock in SLAVE_SOCKETS: SLAVE_SOCKETS.remove(sock)
-
-def sync_state_to_all_slaves():
-    if not SLAVE_SOCKETS: return
-    state_data = game_state.get_state_dict()
-    msg_body = json.dumps(state_data).encode('utf-8')
-    payload = msg_body + b'\n__END__\n'
-    to_remove = []
+def register_slave(sock):
+    """
+    Negozia compressione e operazioni, poi accoda il riallineamento: lo invia il thread dello slave.
+    Lo stato completo si copia sotto il lock ma si codifica fuori: la codifica di tutte le
+    stanze fermerebbe il gioco e i rinnovi della lease. Le voci arrivate nel frattempo
+    si accodano subito dopo lo stato, insieme alla registrazione dello slave.
+    """
+    compress, resume, lease = read_hello(sock)
+    link = SlaveLink(sock, compress=compress, ops=resume is not None, lease=lease)
+    with lock:
+        entries = replication_log.resume(*resume) if resume else None
+        if entries is not None:
+            print(f"[REPLICA-MASTER] Slave riallineato con {len(entries)} operazioni dalla sequenza {resume[1]}.")
+            link.send(log_header(*resume) + b"".join(entries), replication_log.seq)
+            SLAVE_LINKS.append(link)
+            return
+        log_id, seq = replication_log.log_id, replication_log.seq
+        states = room_states(copy=True)
+
+    payload = initial_payload(resume, log_id, seq, states)
+    with lock:
+        missed = replication_log.resume(log_id, seq)
+        # Troppe voci nel frattempo, o uno slave legacy (riceve solo snapshot) e stanze cambiate: si ricodifica sotto il lock
+        if missed is None or (resume is None and missed):
+            payload = initial_payload(resume, replication_log.log_id, replication_log.seq, room_states())
+            missed = []
+        link.send(payload + b"".join(missed), replication_log.seq)
+        SLAVE_LINKS.append(link)
+
+def drop_slave(link, reason=None):
+    if link in SLAVE_LINKS: SLAVE_LINKS.remove(link)
+    link.close(reason)
+    print(f"[REPLICA-MASTER] Slave {link.name} scollegato: {link.close_reason}. Si riallineera' al rientro.")
+
+def snapshot_rooms():
+    """Stanze inviate a uno slave nuovo: la principale (come prima) piu' quelle con una partita in corso."""
+    return [rooms.get_or_create(DEFAULT_ROOM)] + [r for r in rooms if r.room_id != DEFAULT_ROOM and r.game_state.is_running]
+
+def room_states(copy=False):
+    """(stanza, stato, eventi) delle stanze per uno slave nuovo; con 'copy' si possono codificare fuori dal lock."""
+    return [(r, copy_state(r.game_state.get_state_dict()) if copy else r.game_state.get_state_dict(), r.events.snapshot())
+            for r in snapshot_rooms()]
+
+def copy_state(state):
+    """Le liste e i dizionari del GameState cambiano con il gioco: se ne copia il primo livello."""
+    return {key: value.copy() if isinstance(value, (list, dict)) else value for key, value in state.items()}
+
+def initial_payload(resume, log_id, seq, states):
+    """Stato completo per uno slave: snapshot legacy se non riceve operazioni, altrimenti intestazione e stanze."""
+    if resume is None: return b"".join(encode_snapshot(legacy_snapshot(room, state)) for room, state, _ in states)
+    return log_header(log_id, seq) + b"".join(
+        encode_message({"room": room.room_id, "state": state, "events": events}) for room, state, events in states)
+
+def log_header(log_id, seq):
+    """Intestazione del flusso: da dove proseguono le voci, durata della lease e pid del master."""
+    return encode_message({"log": log_id, "seq": seq, "lease": LEASE_TIMEOUT, "pid": os.getpid()})
+
+def room_snapshot(room):
+    """Stato replicato di una stanza: la principale resta nel formato storico, le altre portano 'room'."""
+    return legacy_snapshot(room, room.game_state.get_state_dict())
+
+def legacy_snapshot(room, state):
+    if room.room_id != DEFAULT_ROOM: state = dict(state, room=room.room_id)
+    return state
+
+def sync_state_to_all_slaves(payload, legacy_payload=None):
+    """
+    Accoda agli slave la voce numerata ('payload') o lo snapshot per gli slave che non
+    ricevono operazioni ('legacy_payload'). Non blocca: gli invii li fa il thread di ogni slave.
+    """
+    if not SLAVE_LINKS: return
+    with lock:
+        for link in list(SLAVE_LINKS):
+            data = payload if link.ops else legacy_payload
+            if data is not None and not link.send(data, replication_log.seq): drop_slave(link)
+
+def renew_lease():
+    """
+    (Master) Rinnova la lease presso gli slave. Passa dal lock globale: un master
+    bloccato smette di rinnovarla e gli slave lo rilevano entro LEASE_TIMEOUT.
+    """
+    if not AM_I_MASTER: return
+    with lock:
+        payload = make_lease(LEASE_TIMEOUT)
+        for link in list(SLAVE_LINKS):
+            if link.lease and not link.send(payload, replication_log.seq): drop_slave(link)
+
+def lease_renewal_loop():
+    while True:
+        time.sleep(LEASE_RENEW_INTERVAL)
+        renew_lease()
+
+def replication_status():
+    """Ritardo di replica di ogni slave: operazioni non ancora inviate, byte in coda, secondi di attesa."""
+    with lock: return [link.lag(replication_log.seq) for link in SLAVE_LINKS]
+
+def check_replication_lag():
+    """Scollega gli slave in ritardo oltre MAX_REPLICA_LAG (o caduti): non devono frenare il master."""
+    if not AM_I_MASTER: return
     with lock:
-        for sock in SLAVE_SOCKETS:
-            try: sock.sendall(payload)
-            except: to_remove.append(sock)
-        for dead_sock in to_remove:
-            SLAVE_SOCKETS.remove(dead_sock)
+        for link in list(SLAVE_LINKS):
+            status = link.lag(replication_log.seq)
+            if link.closed: drop_slave(link)
+            elif status["seconds"] > MAX_REPLICA_LAG:
+                drop_slave(link, f"in ritardo di {status['entries']} operazioni ({status['seconds']:.1f} s)")
+
+def log_replication_status():
+    for status in replication_status():
+        print(f"[REPLICA-MASTER] Slave {status['slave']}: ritardo {status['entries']} op, {status['bytes']} byte, {status['seconds']:.2f} s")
 
 def attempt_promotion():
-    """Tenta di acquisire la porta 7000 in modo ESCLUSIVO."""
+    """
+    Tenta di acquisire la porta 7000 in modo ESCLUSIVO.
+    SO_REUSEADDR ignora le connessioni del vecchio master in TIME_WAIT ma non un
+    listener attivo: l'esclusivita' la da' listen(), chiamato subito.
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         s.bind((REPLICATION_HOST, REPLICATION_PORT))
+        s.listen(5)
         return s
     except OSError:
+        s.close()
         return None
 
+def fence_master(pid):
+    """
+    Il master non rinnova la lease ma tiene ancora la porta di replica (bloccato, non
+    caduto): lo si ferma, e' sullo stesso host, e si ritenta la promozione finche' il
+    kernel non libera la porta. Il pid viene dall'intestazione del master, vivo
+    fino a una lease fa.
+    """
+    if pid == os.getpid(): return None
+    print(f"[ELECTION] Il master (pid {pid}) non rinnova la lease: lo fermo.")
+    try: os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+    except OSError: pass
+    deadline = time.monotonic() + LEASE_TIMEOUT
+    while time.monotonic() < deadline:
+        rep_socket = attempt_promotion()
+        if rep_socket: return rep_socket
+        time.sleep(0.01)
+    return None
+
 def run_as_slave(my_port):
     """Logica unificata: Tutti partono come Slave e provano a diventare Master."""
-    global AM_I_MASTER, game_state
+    global AM_I_MASTER
     print(f"[ROLE] Inizializzazione nodo su porta {my_port}...")
-    
-    time.sleep(random.random() * 1.5)
-
+    if CHECKPOINT_INTERVAL > 0: threading.Thread(target=standby_checkpoint_loop, daemon=True).start()
     while not AM_I_MASTER:
         connected = False
+        expired = False
+        # Dall'intestazione del master di questa connessione: serve a fermarlo se si blocca.
+        # Senza intestazione (scadenza durante connect o prima del primo messaggio) non si ferma nessuno
+        master_pid = None
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(2)
+            # Finche' non arriva l'intestazione vale la lease locale, poi quella annunciata dal master
+            s.settimeout(LEASE_TIMEOUT)
             s.connect((REPLICATION_HOST, REPLICATION_PORT))
-            s.settimeout(None)
             connected = True
             
             print(f"[SLAVE] Trovato Master! Entro in modalità passiva (Backup per porta {my_port}).")
             
-            buffer = ""
+            with lock: s.sendall(make_hello(replication_log.log_id, replication_log.seq))
+            reader = SnapshotReader()
+            chunk = bytearray(RECV_BUFFER_SIZE)
+            view = memoryview(chunk)
+            first = True
             while True:
-                data = s.recv(4096)
-                if not data: raise Exception("Master closed")
+                n = s.recv_into(chunk)
+                if not n: raise Exception("Master closed")
                 
-                buffer += data.decode('utf-8')
-                while '__END__\n' in buffer:
-                    parts = buffer.split('__END__\n', 1)
-                    json_str = parts[0]
-                    buffer = parts[1]
-                    try:
-                        data = json.loads(json_str)
-                        with lock:
-                            game_state.apply_state_dict(data)
-                            game_state.save_state()
-                    except: pass
-
+                for message in reader.feed(view[:n]):
+                    if is_lease_renewal(message): continue
+                    if first:
+                        # Un master senza lease (versione precedente) non rinnova: si attende senza limite
+                        first = False
+                        if "pid" in message: master_pid = message["pid"]
+                        s.settimeout(message.get("lease") if "log" in message else None)
+                    apply_replica_message(message)
+
+        except socket.timeout:
+            expired = True
+            print(f"[SLAVE] Lease del master scaduta: nessun rinnovo da {s.gettimeout()} s.")
         except (ConnectionRefusedError, OSError, Exception):
             if connected: print("[SLAVE] Master perso/caduto.")
-            
-            print("[ELECTION] Nessun Master rilevato. Tento la promozione...")
-            
-            rep_socket = attempt_promotion()
-            
-            if rep_socket:
-                print(f"[ELECTION] Ho vinto la gara! Divento MASTER.")
-                become_master(my_port, rep_socket)
-                break
-            else:
-                print("[ELECTION] Porta 7000 occupata. Riprovo a connettermi...")
-                for i in range(10):
-                    time.sleep(0.5)
-                    try:
-                        test = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        test.connect((REPLICATION_HOST, REPLICATION_PORT))
-                        test.close()
-                        break
-                    except: pass
-                continue 
+        finally:
+            s.close()
+
+        print("[ELECTION] Nessun Master rilevato. Tento la promozione...")
+        
+        rep_socket = attempt_promotion()
+        if rep_socket is None and expired and master_pid: rep_socket = fence_master(master_pid)
+        
+        if rep_socket:
+            print(f"[ELECTION] Ho vinto la gara! Divento MASTER.")
+            become_master(my_port, rep_socket)
+            break
+        # Un altro nodo ha vinto: ci si collega subito, con un piccolo scarto tra gli standby
+        print("[ELECTION] Porta 7000 occupata. Riprovo a connettermi...")
+        time.sleep(random.random() * LEASE_RENEW_INTERVAL)
+
+def apply_replica_message(msg):
+    """
+    (Slave) Applica un messaggio del master: intestazione del log, voce numerata o
+    snapshot di un master legacy. Una voce fuori sequenza o non applicabile invalida
+    il log locale: la connessione cade e al rientro si riceve lo stato completo.
+    """
+    global standby_synced
+    with lock:
+        if "log" in msg:
+            if (msg["log"], msg["seq"]) != (replication_log.log_id, replication_log.seq):
+                replication_log.reset(msg["log"], msg["seq"])
+            standby_synced = True
+            return
+        try:
+            seq = msg.pop("seq", None)
+            if seq is not None:
+                # Una voce gia' compresa nel riallineamento puo' arrivare di nuovo: si ignora
+                if seq <= replication_log.seq: return
+                if seq != replication_log.seq + 1: raise ValueError(f"sequenza {seq} dopo {replication_log.seq}")
+                replication_log.append(msg)
+            room = rooms.get_or_create(msg.get("room", DEFAULT_ROOM))
+            if "ops" in msg: room.game_state.apply_records(msg["ops"])
+            else: room.game_state.apply_state_dict(msg.get("state", msg))
+            if "events" in msg: room.events.merge(msg["events"])
+            room.game_state.save_state()
+            rooms.discard_if_idle(room)
+            if seq is None: standby_synced = True   # snapshot di un master legacy
+        except Exception as e:
+            print(f"[SLAVE] Replica non applicabile ({e}): richiedo lo stato completo.")
+            replication_log.reset(None, 0)
+            raise
 
 def become_master(port, rep_sock):
     global AM_I_MASTER
@@ -142,117 +314,295 @@ def become_master(port, rep_sock):
     print("\n" + "!"*50)
     print(f"!!! MASTER ATTIVO SU PORTA {port} !!!")
     print("!"*50 + "\n")
+    with lock:
+        # Gli standby possono aver applicato voci del vecchio master che questo nodo non ha
+        replication_log.start_epoch()
+        restore_rooms()
     start_game_server(port, rep_sock)
 
+def restore_rooms():
+    """
+    (Promozione) Uno standby allineato scrive su disco lo stato che ha in memoria;
+    un nodo senza stato replicato (riavvio dell'intero cluster) riparte dai file di
+    recovery piu' recenti, anche se scritti da un altro nodo.
+    """
+    if standby_synced:
+        for room in rooms: room.game_state.checkpoint()
+        prune_checkpoint(NODE_DIR, keep={room.room_id for room in rooms})
+        standby_dirty.clear()
+    else:
+        source = freshest_checkpoint(DATA_DIR)
+        if source and os.path.abspath(source) != os.path.abspath(NODE_DIR):
+            print(f"[RECOVERY] Riparto dai file di recovery piu' recenti: {source}")
+            adopt_checkpoint(source, NODE_DIR)
+    rooms.load_persisted(rooms_dir(NODE_DIR))
+
+def standby_checkpoint_loop():
+    """(Standby) Ogni CHECKPOINT_INTERVAL secondi scrive le stanze modificate nella directory del nodo."""
+    while True:
+        time.sleep(CHECKPOINT_INTERVAL)
+        with lock:
+            if AM_I_MASTER: return
+            if not standby_dirty: continue
+            for room in standby_dirty.values(): room.game_state.checkpoint()
+            standby_dirty.clear()
+            # Le stanze non piu' in memoria sono finite (o ignote al master): niente da recuperare
+            prune_checkpoint(NODE_DIR, keep={room.room_id for room in rooms})
+
+def run_as_worker(channel_fd, index, count):
+    """
+    Worker di un deployment a shard (vedi router.py): master senza elezione ne' replica
+    per le stanze che il router gli assegna. Carica solo i file di recovery delle proprie stanze.
+    """
+    global AM_I_MASTER, SHARD_INDEX, SHARD_COUNT
+    AM_I_MASTER = True
+    SHARD_INDEX, SHARD_COUNT = index, count
+    channel = socket.socket(fileno=channel_fd)
+    print(f"[WORKER] Worker {index}/{count} attivo (pid {os.getpid()})")
+    with lock: rooms.load_persisted(rooms_dir(NODE_DIR), owns=owns_room)
+    if SERVER_MODE == MODE_ASYNC:
+        start_game_server_async(None, channel=channel)
+        return
+    resume_game_timers()
+    threading.Thread(target=monitor_connections, daemon=True).start()
+    handoff_loop(channel, adopt_client)
+
+def owns_room(room_id):
+    """La stanza appartiene a questo processo: sempre, tranne per i worker che non la possiedono."""
+    return SHARD_COUNT is None or shard_for(room_id, SHARD_COUNT) == SHARD_INDEX
+
+def handoff_loop(channel, adopt):
+    """Riceve dal router i socket dei client; se il router cade il worker si chiude."""
+    while True:
+        try: handoff = recv_handoff(channel)
+        except OSError: handoff = None
+        if handoff is None: break
+        adopt(*handoff)
+    print("[WORKER] Router chiuso: arresto.")
+    shared_writer().flush()
+    os._exit(0)
+
+def adopt_client(client_sock, prefix):
+    """(Threaded) Il JOIN gia' letto dal router viene elaborato prima dei frame successivi."""
+    try: addr = client_sock.getpeername()
+    except OSError:
+        client_sock.close()
+        return
+    conn = FramedConnection(client_sock, max_frame_size=MAX_COMMAND_SIZE)
+    conn.feed(prefix)
+    threading.Thread(target=handle_client, args=(QueuedConnection(conn), addr)).start()
+
 # =========================================================
 #  CORE E TIMERS
 # =========================================================
 
-original_save = game_state.save_state
-def hooked_save_state():
-    original_save() 
-    if AM_I_MASTER:
-        sync_state_to_all_slaves() 
-game_state.save_state = hooked_save_state
-
-def send_to_all(msg):
+def create_room(room_id):
+    """Crea una stanza: GameState con il proprio WAL, salvataggi accorpati dal proprio scheduler."""
+    # Lo standby non rilegge il disco: lo stato della stanza arriva solo dal master
+    room = Room(room_id, GameState(save_file=recovery_file(NODE_DIR, room_id), load=AM_I_MASTER))
+
+    def hooked_save_state():
+        # Standby: lo stato resta in memoria e va su disco col checkpoint periodico o alla promozione
+        if not AM_I_MASTER:
+            standby_dirty[room.room_id] = room
+            return
+        # Sul master le modifiche vengono accorpate: un salvataggio e una replica per tick
+        room.scheduler.mark_dirty()
+        # Le transizioni di fase devono essere durevoli e replicate subito
+        if room.game_state.has_durable_changes(): room.scheduler.flush_now()
+    room.game_state.save_state = hooked_save_state
+
+    schedule = async_server.call_later if async_server else thread_schedule
+    room.scheduler = CommitScheduler(functools.partial(commit_tick, room), COMMIT_WINDOW, schedule=schedule, guard=lock)
+    return room
+
+rooms = RoomRegistry(create_room)
+
+def commit_tick(room, state_changed, broadcasts):
+    """Un tick: accoda al WAL i record accumulati, replica una volta, poi i broadcast accorpati."""
+    if state_changed:
+        # Agli slave vanno i record del tick (O(modifica)); lo stato completo solo se mancano
+        records = room.persist()
+        entry = {"room": room.room_id, "ops": records} if records else {"room": room.room_id, "state": room.game_state.get_state_dict()}
+        # Voce e snapshot legacy si catturano qui, sotto il lock; gli invii li fanno i thread degli slave
+        payload = replication_log.append(entry)
+        legacy_payload = encode_snapshot(room_snapshot(room)) if any(not link.ops for link in SLAVE_LINKS) else None
+        sync_state_to_all_slaves(payload, legacy_payload)
+    for msg in broadcasts: send_to_all(room, msg)
+
+def room_event(room, msg):
+    """
+    Numera un evento diretto a tutta la stanza e lo conserva per i rientri; lo replica
+    agli standby perche' la ripresa funzioni anche dopo un failover. Da chiamare sotto il lock.
+    ("ops" vuoto: gli slave delle versioni precedenti applicano la voce senza effetti.)
+    """
+    evt = room.events.append(msg)
+    payload = replication_log.append({"room": room.room_id, "ops": [], "events": {"stream": room.events.stream, "entries": [evt]}})
+    sync_state_to_all_slaves(payload)
+    return evt
+
+def replay_events(events, username, game_state):
+    """
+    Eventi persi da chi rientra; GAME_STARTED torna personalizzato. Chi era uscito prima
+    dell'avvio non fa parte della storia: lo riceve da spettatore.
+    """
+    spectator = username not in game_state.story_usernames
+    return [dict(evt, am_i_narrator=evt.get("narrator") == username, is_spectator=spectator) if evt["type"] == EVT_GAME_STARTED else evt
+            for evt in events]
+
+def send_to_client(user_id, msg):
+    """Invia un messaggio a un singolo client con il codec negoziato al JOIN."""
+    conn = active_connections.get(user_id)
+    if conn: conn.send_message(msg)
+
+def story_snapshot_msg(room):
+    story = room.game_state.story
+    return {"type": EVT_STORY_UPDATE, "version": len(story), "story": story}
+
+def send_events(user_id, events):
+    """Invia piu' eventi in ordine: un unico frame BATCH ai client che lo supportano."""
+    conn = active_connections.get(user_id)
+    if not conn: return
+    if conn.batching and len(events) > 1: conn.send_message(make_batch(events))
+    else:
+        for evt in events: conn.send_message(evt)
+
+def broadcast_story_update(room, *followups):
+    """
+    Invia solo l'ultimo segmento ai client che gestiscono i delta, la storia intera ai client legacy.
+    Gli eventi 'followups' (es. START_SEGMENT) partono nello stesso frame BATCH dove supportato.
+    Ogni variante (delta/completa, batch/singoli) viene serializzata una sola volta.
+    """
+    story = room.game_state.story
+    variants = {}
     with lock:
-        for sock in active_connections.values():
-            try: send_json(sock, msg)
+        delta = room_event(room, {"type": EVT_STORY_UPDATE, "version": len(story), "segment": story[-1]})
+        followups = [room_event(room, evt) for evt in followups]
+        for conn in room.connections.values():
+            key = (conn.story_deltas, conn.batching)
+            frames = variants.get(key)
+            if frames is None:
+                events = [delta if conn.story_deltas else dict(story_snapshot_msg(room), seq=delta["seq"])] + followups
+                if conn.batching and len(events) > 1: events = [make_batch(events)]
+                frames = variants[key] = [SharedFrame(evt) for evt in events]
+            for frame in frames:
+                try: conn.send_buffers(frame.buffers_for(conn.codec, conn.compress))
+                except: pass
+
+def send_to_all(room, msg):
+    """Serializza il messaggio una sola volta per codec e accoda gli stessi buffer a ogni connessione della stanza."""
+    with lock:
+        frame = SharedFrame(room_event(room, msg))
+        for conn in room.connections.values():
+            try: conn.send_buffers(frame.buffers_for(conn.codec, conn.compress))
             except: pass
 
-def start_timer(duration, callback):
-    global game_timer
-    stop_timer() 
-    game_timer = threading.Timer(duration, callback)
-    game_timer.start()
+def start_timer(room, duration, callback):
+    """Timer di fase della stanza: allo scadere chiama callback(room)."""
+    stop_timer(room)
+    callback = functools.partial(callback, room)
+    room.timer = async_server.call_later(duration, callback) if async_server else thread_schedule(duration, callback)
     return duration
 
-def stop_timer():
-    global game_timer
-    if game_timer:
-        game_timer.cancel()
-        game_timer = None
+def stop_timer(room):
+    if room.timer:
+        room.timer.cancel()
+        room.timer = None
 
 def resume_game_timers():
-    if not game_state.is_running: return
-    print(f"[RESUME] Ripristino timer fase: {game_state.phase}")
-    if game_state.phase == "WRITING":
-        start_timer(TIME_PROPOSAL, on_proposal_timeout)
-    elif game_state.phase == "SELECTING":
-        start_timer(TIME_SELECTION, on_narrator_timeout)
-    elif game_state.phase == "VOTING":
-        start_timer(TIME_VOTING, on_voting_timeout)
+    for room in rooms:
+        game_state = room.game_state
+        if not game_state.is_running: continue
+        print(f"[RESUME] Stanza {room.room_id}: ripristino timer fase {game_state.phase}")
+        if game_state.phase == "WRITING":
+            start_timer(room, TIME_PROPOSAL, on_proposal_timeout)
+        elif game_state.phase == "SELECTING":
+            start_timer(room, TIME_SELECTION, on_narrator_timeout)
+        elif game_state.phase == "VOTING":
+            start_timer(room, TIME_VOTING, on_voting_timeout)
 
 def monitor_connections():
+    ticks = 0
     while True:
         time.sleep(2)
-        if not AM_I_MASTER: continue
-        now = time.time()
-        to_kick = []
-        with lock:
-            for addr, last_time in last_active.items():
-                if now - last_time > HEARTBEAT_TIMEOUT:
-                    to_kick.append(addr)
-            for addr in to_kick:
-                sock = active_connections.get(addr)
-                if sock:
-                    try: sock.close()
-                    except: pass
+        check_heartbeats()
+        check_replication_lag()
+        ticks += 1
+        if ticks % REPLICA_STATUS_TICKS == 0: log_replication_status()
+
+def check_heartbeats():
+    if not AM_I_MASTER: return
+    now = time.time()
+    to_kick = []
+    with lock:
+        for conn in active_connections.values():
+            if now - conn.last_active > HEARTBEAT_TIMEOUT:
+                to_kick.append(conn)
+        for conn in to_kick: conn.abort()
 
-def on_proposal_timeout():
+def on_proposal_timeout(room):
+    game_state = room.game_state
     with lock:
         if not game_state.is_running: return
-        print("[TIMEOUT] Tempo scrittura scaduto.")
-        game_state.phase = "SELECTING"
-        game_state.save_state()
+        print(f"[TIMEOUT] Stanza {room.room_id}: tempo scrittura scaduto.")
+        game_state.set_phase_selecting()
         if not game_state.active_proposals:
-            game_state.active_proposals.append({"id": 0, "author": "System", "text": "..."})
-        decision_msg = {"type": EVT_NARRATOR_DECISION_NEEDED, "proposals": game_state.active_proposals, "timeout": TIME_SELECTION}
-        if game_state.narrator in active_connections:
-            send_json(active_connections[game_state.narrator], decision_msg)
-        start_timer(TIME_SELECTION, on_narrator_timeout)
-
-def on_narrator_timeout():
+            game_state.add_system_proposal("...")
+        decision_msg = {"type": EVT_NARRATOR_DECISION_NEEDED, "proposals": game_state.proposals_payload(), "timeout": TIME_SELECTION}
+        if game_state.narrator in room.connections:
+            send_to_client(game_state.narrator, decision_msg)
+        start_timer(room, TIME_SELECTION, on_narrator_timeout)
+
+def on_narrator_timeout(room):
+    game_state = room.game_state
     with lock:
         if not game_state.is_running: return
-        print("[TIMEOUT] Narratore assente.")
+        print(f"[TIMEOUT] Stanza {room.room_id}: narratore assente.")
         if game_state.active_proposals:
             random_prop = random.choice(game_state.active_proposals)
-            game_state.select_proposal(random_prop['id'])
-            send_to_all({"type": EVT_STORY_UPDATE, "story": game_state.story})
+            game_state.select_proposal(random_prop.id)
             new_seg_id = game_state.start_new_segment()
-            send_to_all({"type": EVT_NEW_SEGMENT, "segment_id": new_seg_id, "timeout": TIME_PROPOSAL})
-            start_timer(TIME_PROPOSAL, on_proposal_timeout)
+            broadcast_story_update(room, {"type": EVT_NEW_SEGMENT, "segment_id": new_seg_id, "timeout": TIME_PROPOSAL})
+            start_timer(room, TIME_PROPOSAL, on_proposal_timeout)
 
-def on_voting_timeout():
+def on_voting_timeout(room):
     with lock:
-        print("[TIMEOUT] Voto scaduto.")
-        process_vote_check(force_end=True)
+        print(f"[TIMEOUT] Stanza {room.room_id}: voto scaduto.")
+        process_vote_check(room, force_end=True)
 
-def check_round_completion():
+def auto_continue(room):
+    game_state = room.game_state
+    with lock:
+        if not game_state.is_running: return
+        new_id = game_state.start_new_segment()
+        send_to_all(room, {"type": EVT_NEW_SEGMENT, "segment_id": new_id, "timeout": TIME_PROPOSAL})
+        start_timer(room, TIME_PROPOSAL, on_proposal_timeout)
+
+def check_round_completion(room):
+    game_state = room.game_state
     active_writers = game_state.count_active_writers()
     current_props = len(game_state.active_proposals)
     if current_props >= active_writers and active_writers > 0:
-        stop_timer() 
-        game_state.phase = "SELECTING"
-        game_state.save_state()
-        decision_msg = {"type": EVT_NARRATOR_DECISION_NEEDED, "proposals": game_state.active_proposals, "timeout": TIME_SELECTION}
+        stop_timer(room) 
+        game_state.set_phase_selecting()
+        decision_msg = {"type": EVT_NARRATOR_DECISION_NEEDED, "proposals": game_state.proposals_payload(), "timeout": TIME_SELECTION}
         with lock:
-            if game_state.narrator in active_connections:
-                send_json(active_connections[game_state.narrator], decision_msg)
-        start_timer(TIME_SELECTION, on_narrator_timeout)
+            if game_state.narrator in room.connections:
+                send_to_client(game_state.narrator, decision_msg)
+        start_timer(room, TIME_SELECTION, on_narrator_timeout)
 
-def process_vote_check(force_end=False):
+def process_vote_check(room, force_end=False):
+    game_state = room.game_state
     total_connected = len(game_state.players)
     total_voted = len(game_state.player_votes)
     
-    try:
-        send_to_all({"type": EVT_VOTE_UPDATE, "count": total_voted, "needed": total_connected})
-    except: pass
+    # I conteggi di voti ravvicinati partono una sola volta per tick, con il valore piu' recente
+    room.scheduler.broadcast_latest(EVT_VOTE_UPDATE, {"type": EVT_VOTE_UPDATE, "count": total_voted, "needed": total_connected})
 
     if (total_voted >= total_connected and total_connected > 0) or force_end:
-        stop_timer()
+        # L'ultimo conteggio deve arrivare prima di GOODBYE / RETURN_TO_LOBBY
+        room.scheduler.flush_now()
+        stop_timer(room)
         game_state.is_running = False
         
         users_leaving = []
@@ -261,25 +611,21 @@ def process_vote_check(force_end=False):
         with lock:
             for user_id in all_users:
                 if user_id in game_state.player_votes and not game_state.player_votes[user_id]:
-                    sock = active_connections.get(user_id)
-                    if sock: 
-                        try:
-                            send_json(sock, {"type": EVT_GOODBYE, "msg": "Grazie!"})
-                        except Exception: 
-                            pass 
+                    try:
+                        send_to_client(user_id, {"type": EVT_GOODBYE, "msg": "Grazie!"})
+                    except Exception: 
+                        pass 
                     users_leaving.append(user_id)
                 else:
-                    sock = active_connections.get(user_id)
-                    if sock: 
-                        try:
-                            send_json(sock, {"type": EVT_RETURN_TO_LOBBY})
-                        except Exception:
-                            pass 
-
-        time.sleep(0.2) 
+                    try:
+                        send_to_client(user_id, {"type": EVT_RETURN_TO_LOBBY})
+                    except Exception:
+                        pass 
 
+        # close() e' ordinata in entrambe le modalita': il GOODBYE in coda parte prima della chiusura
         for uid in users_leaving:
             with lock:
+                room.connections.pop(uid, None)
                 if uid in active_connections:
                     try: active_connections[uid].close()
                     except: pass
@@ -291,139 +637,217 @@ def process_vote_check(force_end=False):
                 with lock:
                     if new_leader_addr in active_connections:
                         try:
-                            send_json(active_connections[new_leader_addr], {"type": EVT_LEADER_UPDATE, "msg": "Sei il Leader!"})
+                            send_to_client(new_leader_addr, {"type": EVT_LEADER_UPDATE, "msg": "Sei il Leader!"})
                         except Exception: pass
         
-        game_state.player_votes.clear()
-        game_state.phase = "LOBBY" 
-        game_state.save_state()
+        game_state.return_to_lobby()
+
+def register_client(conn, addr):
+    conn.session_id = next(session_ids)
+    conn.last_active = time.time()
+    print(f"Nuova connessione da {addr} (sessione {conn.session_id})")
+    with lock:
+        active_connections[conn.session_id] = conn
+
+def join_room(conn, user_id, room_id):
+    """Porta la connessione nella stanza richiesta (creandola), lasciando l'eventuale stanza precedente."""
+    with lock:
+        previous = conn.room
+        if previous is not None and previous.room_id != room_id:
+            conn.room = None
+            leave_room(previous, user_id)
+        room = rooms.get_or_create(room_id)
+        room.connections[user_id] = conn
+        conn.room = room
+    return room
+
+def process_message(conn, user_id, msg):
+    """Esegue un comando del client. Restituisce False se la connessione va chiusa."""
+    conn.last_active = time.time()
+    msg_type = msg.get('type')
+    
+    if msg_type == CMD_HEARTBEAT: return True
+    if not AM_I_MASTER: return False
+
+    if msg_type == CMD_JOIN:
+        # I client legacy non indicano la stanza ed entrano nella principale
+        room_id = msg.get('room', DEFAULT_ROOM)
+        if not valid_room_id(room_id):
+            send_to_client(user_id, {"type": EVT_ERROR, "msg": "Nome stanza non valido"})
+            return True
+        # Il router instrada solo il primo JOIN: un cambio di stanza verso un altro worker
+        # aprirebbe lo stesso file di recovery in due processi
+        if not owns_room(room_id):
+            send_to_client(user_id, {"type": EVT_ERROR, "msg": "Stanza su un altro worker: riconnettiti per entrarci"})
+            return True
+        room = join_room(conn, user_id, room_id)
+        game_state = room.game_state
+        # Codec richiesto dal client: i client legacy non lo specificano e restano su JSON
+        codec = msg.get('codec', CODEC_JSON)
+        conn.codec = codec if codec in (CODEC_JSON, CODEC_BINARY) else CODEC_JSON
+        conn.story_deltas = bool(msg.get('story_deltas'))
+        conn.batching = bool(msg.get('batch'))
+        conn.compress = bool(msg.get('compress'))
+        raw_username = msg.get('username', 'Anonimo')
+        username = game_state.add_player(user_id, raw_username)
+        is_leader = (game_state.leader == user_id)
+        # Stato di rientro raccolto in ordine e inviato con una sola scrittura
+        with lock:
+            welcome = {"type": EVT_WELCOME, "msg": f"Benvenuto {username}!", "is_leader": is_leader, "codec": conn.codec, "compress": conn.compress, "room": room.room_id,
+                       "resume": room.events.stream, "last_seq": room.events.seq}
+            # Ripresa: solo gli eventi persi, se la stanza li conserva ancora tutti (i client legacy non la chiedono)
+            missed = room.events.since(msg.get('resume'), msg.get('last_seq')) if conn.story_deltas else None
+        events = [welcome]
+
+        if missed is not None:
+            welcome["resumed"] = True
+            events += replay_events(missed, username, game_state)
+            # Le richieste personali non sono eventi della stanza: si rimandano dallo stato
+            if game_state.is_running and game_state.narrator == user_id and game_state.phase == "SELECTING":
+                events.append({"type": EVT_NARRATOR_DECISION_NEEDED, "proposals": game_state.proposals_payload(), "timeout": TIME_SELECTION})
+        elif game_state.is_running:
+            if username in game_state.story_usernames:
+                narrator_name = game_state.players.get(game_state.narrator, "???")
+                am_i_narrator = (game_state.narrator == user_id)
+                events.append({"type": EVT_GAME_STARTED, "narrator": narrator_name, "theme": game_state.current_theme, "am_i_narrator": am_i_narrator, "is_spectator": False})
+                events.append(story_snapshot_msg(room))
+                if am_i_narrator and game_state.phase == "SELECTING":
+                     events.append({"type": EVT_NARRATOR_DECISION_NEEDED, "proposals": game_state.proposals_payload(), "timeout": TIME_SELECTION})
+                elif not am_i_narrator and game_state.phase == "WRITING" and not game_state.has_user_submitted(username):
+                    events.append({"type": EVT_NEW_SEGMENT, "segment_id": game_state.current_segment_id, "timeout": TIME_PROPOSAL})
+            else:
+                events.append({"type": EVT_GAME_STARTED, "narrator": game_state.players.get(game_state.narrator, "???"), "theme": game_state.current_theme, "am_i_narrator": False, "is_spectator": True})
+                events.append(story_snapshot_msg(room))
+        send_events(user_id, events)
+        return True
+
+    if msg_type == CMD_HISTORY:
+        # Archivio comune a tutte le stanze. 'before' e' il cursore 'next' della pagina precedente
+        try:
+            stories, next_cursor = history_store().page(
+                before=msg.get('before'), limit=msg.get('limit', DEFAULT_PAGE_SIZE),
+                theme=msg.get('theme'), narrator=msg.get('narrator'))
+            send_to_client(user_id, {"type": EVT_HISTORY, "stories": stories, "next": next_cursor})
+        except (ValueError, TypeError):
+            send_to_client(user_id, {"type": EVT_ERROR, "msg": "Richiesta storico non valida"})
+        return True
+
+    # Tutti gli altri comandi agiscono sulla stanza scelta con il JOIN
+    room = conn.room
+    if room is None: return True
+    game_state = room.game_state
+
+    if msg_type == CMD_START_GAME:
+        if game_state.is_running: return True
+        if game_state.leader != user_id: return True
+        success, info = game_state.start_new_story()
+        if success:
+            evt = {"type": EVT_GAME_STARTED, "narrator": info['narrator_name'], "theme": info['theme'], "is_spectator": False}
+            with lock:
+                # Corpo comune codificato una volta: per ogni destinatario cambia solo la coda "am_i_narrator"
+                frame = PersonalizedFrame(room_event(room, evt), "am_i_narrator")
+                for p_addr, p_conn in room.connections.items():
+                    p_conn.send_buffers(frame.buffers_for(p_conn.codec, p_addr == info['narrator_id']))
+            seg_id = game_state.start_new_segment()
+            send_to_all(room, {"type": EVT_NEW_SEGMENT, "segment_id": seg_id, "timeout": TIME_PROPOSAL})
+            start_timer(room, TIME_PROPOSAL, on_proposal_timeout)
+
+    elif msg_type == CMD_SUBMIT:
+        text = msg.get('text')
+        if text == "CRASH_NOW": os._exit(1)
+        success, result = game_state.add_proposal(user_id, text)
+        if success: check_round_completion(room)
+        else: send_to_client(user_id, {"type": EVT_ERROR, "msg": result})
+
+    elif msg_type == CMD_SELECT_PROPOSAL:
+        if user_id != game_state.narrator: return True
+        stop_timer(room)
+        proposal_id = int(msg.get('proposal_id'))
+        success, new_story = game_state.select_proposal(proposal_id)
+        if success:
+            broadcast_story_update(room)
+            send_to_client(user_id, {"type": EVT_ASK_CONTINUE, "timeout": 15})
+            start_timer(room, 15, auto_continue)
+        else: send_to_client(user_id, {"type": EVT_ERROR, "msg": "ID non valido"})
+
+    elif msg_type == CMD_DECIDE_CONTINUE:
+        if user_id != game_state.narrator: return True
+        stop_timer(room)
+        action = msg.get('action')
+        if action == "CONTINUE":
+            new_seg_id = game_state.start_new_segment()
+            send_to_all(room, {"type": EVT_NEW_SEGMENT, "segment_id": new_seg_id, "timeout": TIME_PROPOSAL})
+            start_timer(room, TIME_PROPOSAL, on_proposal_timeout)
+        elif action == "STOP":
+            game_state.save_to_history()
+            game_state.end_story()
+            send_to_all(room, {"type": EVT_GAME_ENDED, "final_story": game_state.story, "timeout": TIME_VOTING})
+            start_timer(room, TIME_VOTING, on_voting_timeout)
+
+    elif msg_type == CMD_STORY_RESYNC:
+        # Il client ha visto un buco nelle versioni: riceve la storia completa
+        send_to_client(user_id, story_snapshot_msg(room))
+
+    elif msg_type == CMD_VOTE_RESTART:
+        game_state.register_vote(user_id, True)
+        process_vote_check(room)
+    elif msg_type == CMD_VOTE_NO:
+        game_state.register_vote(user_id, False)
+        process_vote_check(room)
+    return True
+
+def leave_room(room, user_id):
+    """Il giocatore esce dalla stanza (disconnessione o JOIN in un'altra stanza)."""
+    game_state = room.game_state
+    with lock: room.connections.pop(user_id, None)
+
+    if game_state.is_running and user_id == game_state.narrator:
+        stop_timer(room)
+        send_to_all(room, {"type": EVT_RETURN_TO_LOBBY, "msg": "Narratore caduto."})
+        game_state.abort_game()
+    
+    new_leader = game_state.remove_player(user_id)
+    if new_leader:
+        with lock:
+            if new_leader in room.connections:
+                try:
+                    send_to_client(new_leader, {"type": EVT_LEADER_UPDATE, "msg": "Sei il nuovo Leader!"})
+                except Exception: pass
+
+    if game_state.is_running: check_round_completion(room)
+    elif not game_state.is_running and game_state.player_votes: process_vote_check(room)
 
-def handle_client(conn, addr):
-    print(f"Nuova connessione da {addr}")
     with lock:
-        active_connections[addr] = conn
-        last_active[addr] = time.time()
-    user_id = addr
+        # Stanza vuota e senza partita: esce dal registro (il timer del voto non serve piu')
+        if room.is_idle():
+            stop_timer(room)
+            rooms.discard_if_idle(room)
+
+def unregister_client(conn, user_id):
+    if AM_I_MASTER:
+        with lock:
+            if user_id in active_connections: del active_connections[user_id]
+            room, conn.room = conn.room, None
+        if room is not None: leave_room(room, user_id)
+
+def handle_client(conn, addr):
+    register_client(conn, addr)
+    user_id = conn.session_id
     try:
         while True:
-            msg = recv_json(conn)
+            msg = conn.recv_message()
             if not msg: break
-            with lock: last_active[addr] = time.time()
-            msg_type = msg.get('type')
-            
-            if msg_type == CMD_HEARTBEAT: continue
-            if not AM_I_MASTER: break
-
-            if msg_type == CMD_JOIN:
-                raw_username = msg.get('username', 'Anonimo')
-                username = game_state.add_player(user_id, raw_username)
-                is_leader = (game_state.leader == user_id)
-                send_json(conn, {"type": EVT_WELCOME, "msg": f"Benvenuto {username}!", "is_leader": is_leader})
-
-                if game_state.is_running:
-                    if username in game_state.story_usernames:
-                        narrator_name = game_state.players.get(game_state.narrator, "???")
-                        am_i_narrator = (game_state.narrator == user_id)
-                        send_json(conn, {"type": EVT_GAME_STARTED, "narrator": narrator_name, "theme": game_state.current_theme, "am_i_narrator": am_i_narrator, "is_spectator": False})
-                        send_json(conn, {"type": EVT_STORY_UPDATE, "story": game_state.story})
-                        if am_i_narrator and game_state.phase == "SELECTING":
-                             send_json(conn, {"type": EVT_NARRATOR_DECISION_NEEDED, "proposals": game_state.active_proposals, "timeout": TIME_SELECTION})
-                        elif not am_i_narrator and game_state.phase == "WRITING" and not game_state.has_user_submitted(username):
-                            send_json(conn, {"type": EVT_NEW_SEGMENT, "segment_id": game_state.current_segment_id, "timeout": TIME_PROPOSAL})
-                    else:
-                        send_json(conn, {"type": EVT_GAME_STARTED, "narrator": game_state.players.get(game_state.narrator, "???"), "theme": game_state.current_theme, "am_i_narrator": False, "is_spectator": True})
-                        send_json(conn, {"type": EVT_STORY_UPDATE, "story": game_state.story})
-                game_state.save_state()
-
-            elif msg_type == CMD_START_GAME:
-                if game_state.is_running: continue
-                if game_state.leader != user_id: continue
-                success, info = game_state.start_new_story()
-                if success:
-                    evt = {"type": EVT_GAME_STARTED, "narrator": info['narrator_name'], "theme": info['theme'], "is_spectator": False}
-                    with lock:
-                        for p_addr, p_sock in active_connections.items():
-                            evt_personal = evt.copy()
-                            evt_personal["am_i_narrator"] = (p_addr == info['narrator_id'])
-                            send_json(p_sock, evt_personal)
-                    seg_id = game_state.start_new_segment()
-                    send_to_all({"type": EVT_NEW_SEGMENT, "segment_id": seg_id, "timeout": TIME_PROPOSAL})
-                    start_timer(TIME_PROPOSAL, on_proposal_timeout)
-
-            elif msg_type == CMD_SUBMIT:
-                text = msg.get('text')
-                if text == "CRASH_NOW": os._exit(1)
-                success, result = game_state.add_proposal(user_id, text)
-                if success: check_round_completion()
-                else: send_json(conn, {"type": "ERROR", "msg": result})
-
-            elif msg_type == CMD_SELECT_PROPOSAL:
-                if user_id != game_state.narrator: continue
-                stop_timer()
-                proposal_id = int(msg.get('proposal_id'))
-                success, new_story = game_state.select_proposal(proposal_id)
-                if success:
-                    send_to_all({"type": EVT_STORY_UPDATE, "story": new_story})
-                    send_json(conn, {"type": EVT_ASK_CONTINUE, "timeout": 15})
-                    def auto_continue():
-                        with lock:
-                            if not game_state.is_running: return
-                            new_id = game_state.start_new_segment()
-                            send_to_all({"type": EVT_NEW_SEGMENT, "segment_id": new_id, "timeout": TIME_PROPOSAL})
-                            start_timer(TIME_PROPOSAL, on_proposal_timeout)
-                    start_timer(15, auto_continue)
-                else: send_json(conn, {"type": "ERROR", "msg": "ID non valido"})
-
-            elif msg_type == CMD_DECIDE_CONTINUE:
-                if user_id != game_state.narrator: continue
-                stop_timer()
-                action = msg.get('action')
-                if action == "CONTINUE":
-                    new_seg_id = game_state.start_new_segment()
-                    send_to_all({"type": EVT_NEW_SEGMENT, "segment_id": new_seg_id, "timeout": TIME_PROPOSAL})
-                    start_timer(TIME_PROPOSAL, on_proposal_timeout)
-                elif action == "STOP":
-                    game_state.save_to_history()
-                    game_state.is_running = False 
-                    game_state.phase = "VOTING"
-                    game_state.save_state()
-                    send_to_all({"type": EVT_GAME_ENDED, "final_story": game_state.story, "timeout": TIME_VOTING})
-                    start_timer(TIME_VOTING, on_voting_timeout)
-
-            elif msg_type == CMD_VOTE_RESTART:
-                game_state.register_vote(user_id, True)
-                process_vote_check()
-            elif msg_type == CMD_VOTE_NO:
-                game_state.register_vote(user_id, False)
-                process_vote_check()
-
+            if not process_message(conn, user_id, msg): break
     except Exception: pass 
     finally:
-        if AM_I_MASTER:
-            with lock:
-                if addr in active_connections: del active_connections[addr]
-                if addr in last_active: del last_active[addr]
-            
-            if game_state.is_running and user_id == game_state.narrator:
-                stop_timer()
-                send_to_all({"type": EVT_RETURN_TO_LOBBY, "msg": "Narratore caduto."})
-                game_state.abort_game()
-            
-            new_leader = game_state.remove_player(user_id)
-            if new_leader:
-                with lock:
-                    if new_leader in active_connections:
-                        try:
-                            send_json(active_connections[new_leader], {"type": EVT_LEADER_UPDATE, "msg": "Sei il nuovo Leader!"})
-                        except Exception: pass
-
-            if game_state.is_running: check_round_completion()
-            elif not game_state.is_running and game_state.player_votes: process_vote_check()
-        
+        try: unregister_client(conn, user_id)
+        except Exception: pass
         try: conn.close()
         except: pass
 
 def start_game_server(port, rep_sock):
+    if SERVER_MODE == MODE_ASYNC:
+        return start_game_server_async(port, rep_sock)
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
@@ -434,12 +858,13 @@ def start_game_server(port, rep_sock):
         resume_game_timers()
 
         threading.Thread(target=replication_listener_loop, args=(rep_sock,), daemon=True).start()
+        threading.Thread(target=lease_renewal_loop, daemon=True).start()
         threading.Thread(target=monitor_connections, daemon=True).start()
         
         while True:
             try:
                 conn, addr = server.accept()
-                threading.Thread(target=handle_client, args=(conn, addr)).start()
+                threading.Thread(target=handle_client, args=(QueuedConnection(FramedConnection(conn, max_frame_size=MAX_COMMAND_SIZE)), addr)).start()
             except OSError: break
     except OSError as e:
         print(f"[FATAL] Errore avvio server su porta {port}: {e}")
@@ -447,13 +872,71 @@ def start_game_server(port, rep_sock):
     except KeyboardInterrupt:
         print("\n[SERVER] Arresto richiesto. Chiusura...")
 
+def on_async_message(conn, addr, msg):
+    try: return process_message(conn, conn.session_id, msg)
+    except Exception: return False
+
+def on_async_disconnect(conn, addr):
+    try: unregister_client(conn, conn.session_id)
+    except Exception: pass
+
+def start_game_server_async(port, rep_sock=None, channel=None):
+    """
+    Variante a event loop singolo: connessioni, heartbeat e timer sullo stesso loop asyncio.
+    Con 'channel' (worker a shard) non c'e' listener: i client arrivano dal router.
+    """
+    global async_server
+    async_server = AsyncGameServer(HOST if port else None, port, register_client, on_async_message, on_async_disconnect)
+
+    def on_ready():
+        if port: print(f"[SERVER] Master (asyncio) attivo su {HOST}:{port}")
+        for room in rooms: room.scheduler.schedule = async_server.call_later   # i tick di commit girano sul loop
+        resume_game_timers()
+        async_server.run_periodic(2, check_heartbeats)
+        async_server.run_periodic(2, check_replication_lag)
+        async_server.run_periodic(2 * REPLICA_STATUS_TICKS, log_replication_status)
+        if rep_sock:
+            # Il rinnovo gira sul loop: se il loop si blocca la lease scade
+            async_server.run_periodic(LEASE_RENEW_INTERVAL, renew_lease)
+            threading.Thread(target=replication_listener_loop, args=(rep_sock,), daemon=True).start()
+        if channel: threading.Thread(target=handoff_loop, args=(channel, async_server.adopt), daemon=True).start()
+
+    try:
+        async_server.serve_forever(on_ready)
+    except OSError as e:
+        print(f"[FATAL] Errore avvio server su porta {port}: {e}")
+        if rep_sock: rep_sock.close()
+    except KeyboardInterrupt:
+        print("\n[SERVER] Arresto richiesto. Chiusura...")
+
 if __name__ == "__main__":
     try:
-        target_port = GAME_PORT_MASTER
-        if len(sys.argv) > 2 and sys.argv[1] == "SLAVE":
-            target_port = int(sys.argv[2])
-            
-        AM_I_MASTER = False
-        run_as_slave(target_port)
+        if "--async" in sys.argv:
+            sys.argv.remove("--async")
+            SERVER_MODE = MODE_ASYNC
+        if "--checkpoint-interval" in sys.argv:
+            i = sys.argv.index("--checkpoint-interval")
+            CHECKPOINT_INTERVAL = float(sys.argv[i + 1])
+            del sys.argv[i:i + 2]
+        if "--lease-timeout" in sys.argv:
+            i = sys.argv.index("--lease-timeout")
+            LEASE_TIMEOUT = float(sys.argv[i + 1])
+            del sys.argv[i:i + 2]
+        if "--lease-renew" in sys.argv:
+            i = sys.argv.index("--lease-renew")
+            LEASE_RENEW_INTERVAL = float(sys.argv[i + 1])
+            del sys.argv[i:i + 2]
+
+        if len(sys.argv) > 4 and sys.argv[1] == "WORKER":
+            # Avviato da router.py: WORKER <fd del canale> <indice> <numero di worker>
+            run_as_worker(int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]))
+        else:
+            target_port = GAME_PORT_MASTER
+            if len(sys.argv) > 2 and sys.argv[1] == "SLAVE":
+                target_port = int(sys.argv[2])
+
+            NODE_DIR = node_dir(DATA_DIR, target_port)
+            AM_I_MASTER = False
+            run_as_slave(target_port)
     except KeyboardInterrupt:
         print("\n[MAIN] Uscita.")
\ No newline at end of file
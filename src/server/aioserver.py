@@ -0,0 +1,172 @@
+import asyncio
+
+from common.protocol import CODEC_JSON, MAX_COMMAND_SIZE, FrameBuffer
+from server.outbound import OutboundQueue, OUTBOUND_HIGH_WATER, frame_buffers
+
+# ==========================================
+# SERVER ASYNCIO (SINGOLO EVENT LOOP)
+# ==========================================
+
+class AsyncConnection:
+    """
+    Adattatore 'socket-like' sopra un trasporto asyncio.
+    Espone la stessa interfaccia di QueuedConnection (send_message, codec, close, abort),
+    cosi' la logica di gioco resta identica nelle due modalita'.
+    I frame passano dalla coda di uscita e vengono versati nel trasporto dal loop
+    solo finche' il suo buffer e' sotto soglia (pause_writing/resume_writing).
+    """
+    TRANSPORT_HIGH_WATER = 64 * 1024
+
+    def __init__(self, transport, loop, codec=CODEC_JSON, high_water=OUTBOUND_HIGH_WATER):
+        self.transport = transport
+        self.loop = loop
+        self.codec = codec
+        self.story_deltas = False
+        self.batching = False
+        self.compress = False
+        self.session_id = None     # assegnato dal server alla connessione
+        self.last_active = 0.0
+        self.room = None           # stanza scelta con il JOIN
+        self.outbox = OutboundQueue(high_water)
+        self.paused = False
+        self._drain_scheduled = False
+        transport.set_write_buffer_limits(high=self.TRANSPORT_HIGH_WATER)
+
+    def send_message(self, msg):
+        self.send_buffers(frame_buffers(msg, self.codec, self.compress))
+
+    def send_buffers(self, buffers):
+        if self.transport.is_closing(): return
+        if not self.outbox.put(buffers):
+            print("[OUTBOUND] Client troppo lento: coda piena, disconnessione.")
+            self.abort()
+            return
+        if not self._drain_scheduled:
+            # Thread-safe e accorpa piu' invii dello stesso giro di loop in una sola writelines
+            self._drain_scheduled = True
+            self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        self._drain_scheduled = False
+        while not self.paused and len(self.outbox) and not self.transport.is_closing():
+            self.transport.writelines(self.outbox.take_batch())
+
+    def pause_writing(self): self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self._drain()
+
+    def close(self):
+        """Chiusura ordinata: versa la coda nel trasporto, che la invia prima di chiudere."""
+        if self.transport.is_closing(): return
+        while len(self.outbox): self.transport.writelines(self.outbox.take_batch())
+        self.transport.close()
+
+    def abort(self):
+        self.transport.abort()
+
+    def getpeername(self):
+        return self.transport.get_extra_info('peername')
+
+
+class FramedProtocol(asyncio.BufferedProtocol):
+    """
+    Decodifica i frame [Lunghezza (4 byte)] + [Corpo] e li passa al server.
+    Il loop scrive direttamente nel FrameBuffer preallocato (niente bytes intermedi).
+    """
+    def __init__(self, server, initial=b""):
+        self.server = server
+        self.conn = None
+        self.addr = None
+        self.frames = FrameBuffer(max_frame_size=MAX_COMMAND_SIZE)
+        self.initial = initial     # byte gia' letti da un altro processo (router), elaborati per primi
+
+    def connection_made(self, transport):
+        self.conn = AsyncConnection(transport, asyncio.get_running_loop())
+        self.addr = transport.get_extra_info('peername')[:2]
+        self.server.on_connect(self.conn, self.addr)
+        if self.initial:
+            initial, self.initial = self.initial, b""
+            self._dispatch(lambda: self.frames.feed(initial))
+
+    def get_buffer(self, sizehint):
+        return self.frames.writable_view()
+
+    def buffer_updated(self, nbytes):
+        self.frames.commit(nbytes)
+        self._dispatch(self.frames.parse)
+
+    def _dispatch(self, decode):
+        try:
+            messages = decode()
+        except Exception:
+            self.conn.close()
+            return
+        for msg in messages:
+            if self.server.on_message(self.conn, self.addr, msg) is False:
+                self.conn.close()
+                return
+
+    def pause_writing(self): self.conn.pause_writing()
+    def resume_writing(self): self.conn.resume_writing()
+
+    def connection_lost(self, exc):
+        self.server.on_disconnect(self.conn, self.addr)
+
+
+class AsyncGameServer:
+    """
+    Server a event loop singolo: tutte le connessioni, il controllo heartbeat
+    e i timer di fase girano sullo stesso loop, senza un thread per client.
+    Le callback ricevono (conn, addr[, msg]) come in modalita' threaded.
+    """
+    def __init__(self, host, port, on_connect, on_message, on_disconnect):
+        self.host = host
+        self.port = port
+        self.on_connect = on_connect
+        self.on_message = on_message
+        self.on_disconnect = on_disconnect
+        self.loop = None
+        self._stopped = None
+
+    def call_later(self, delay, callback):
+        """Pianifica una callback sul loop. Restituisce un handle con .cancel()."""
+        return self.loop.call_later(delay, callback)
+
+    def run_periodic(self, interval, callback):
+        """Esegue callback ogni 'interval' secondi sul loop."""
+        def tick():
+            try: callback()
+            finally: self.loop.call_later(interval, tick)
+        self.loop.call_later(interval, tick)
+
+    def adopt(self, sock, initial=b""):
+        """
+        Serve un socket accettato altrove (passato dal router), thread-safe.
+        'initial' sono i byte gia' letti dal socket: vengono elaborati prima di quelli nuovi.
+        """
+        async def attach():
+            try: await self.loop.connect_accepted_socket(lambda: FramedProtocol(self, initial), sock)
+            except OSError: sock.close()
+        asyncio.run_coroutine_threadsafe(attach(), self.loop)
+
+    async def _serve(self, on_ready):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if self.port is None:
+            # Worker di un deployment a shard: nessun listener, le connessioni arrivano con adopt()
+            if on_ready: on_ready()
+            await self._stopped.wait()
+            return
+        server = await self.loop.create_server(lambda: FramedProtocol(self), self.host, self.port, reuse_address=True)
+        if on_ready: on_ready()
+        async with server:
+            await self._stopped.wait()
+
+    def serve_forever(self, on_ready=None):
+        asyncio.run(self._serve(on_ready))
+
+    def stop(self):
+        """Arresta il loop (thread-safe)."""
+        if self.loop: self.loop.call_soon_threadsafe(self._stopped.set)
@@ -0,0 +1,74 @@
+import os
+import shutil
+
+from common.protocol import DEFAULT_ROOM
+from server.rooms import room_save_file, valid_room_id
+
+# ==========================================
+# FILE DI RECOVERY PER NODO
+# ==========================================
+# Ogni nodo (master o standby) scrive nella propria directory data/nodes/<porta>:
+# recovery.json per la stanza principale e rooms/<stanza>.json per le altre.
+# Il master vi scrive il WAL a ogni commit; gli standby tengono lo stato replicato
+# in memoria e lo scrivono solo a intervalli o alla promozione. Dopo un riavvio
+# dell'intero cluster il primo nodo promosso riparte dai file scritti piu' di recente,
+# di qualunque nodo siano (anche dal vecchio layout condiviso in data/).
+
+NODES_DIR_NAME = "nodes"
+RECOVERY_FILE_NAME = "recovery.json"
+
+def node_dir(data_dir, port):
+    return os.path.join(data_dir, NODES_DIR_NAME, str(port))
+
+def rooms_dir(directory):
+    return os.path.join(directory, "rooms")
+
+def recovery_file(directory, room_id):
+    """File di recovery di una stanza nella directory di un nodo."""
+    return room_save_file(rooms_dir(directory), room_id) or os.path.join(directory, RECOVERY_FILE_NAME)
+
+def recovery_files(directory):
+    """room_id -> file di recovery presenti nella directory."""
+    files = {}
+    main_file = os.path.join(directory, RECOVERY_FILE_NAME)
+    if os.path.exists(main_file): files[DEFAULT_ROOM] = main_file
+    if os.path.isdir(rooms_dir(directory)):
+        for name in os.listdir(rooms_dir(directory)):
+            room_id, ext = os.path.splitext(name)
+            if ext == ".json" and valid_room_id(room_id): files[room_id] = os.path.join(rooms_dir(directory), name)
+    return files
+
+def last_written(directory, include_dirs=True):
+    """
+    Istante dell'ultima scrittura: anche la rimozione di un file (partita finita)
+    conta, tramite l'mtime delle directory. 0 se non c'e' nulla.
+    """
+    paths = list(recovery_files(directory).values())
+    if include_dirs: paths += [directory, rooms_dir(directory)]
+    return max((os.path.getmtime(p) for p in paths if os.path.exists(p)), default=0)
+
+def freshest_checkpoint(data_dir):
+    """Directory con i file di recovery piu' recenti tra quelle dei nodi e il vecchio layout condiviso."""
+    candidates = []
+    nodes = os.path.join(data_dir, NODES_DIR_NAME)
+    if os.path.isdir(nodes):
+        candidates += [(last_written(os.path.join(nodes, name)), os.path.join(nodes, name)) for name in os.listdir(nodes)]
+    # In data/ ci sono anche archivio e temi: contano solo i file di recovery
+    if recovery_files(data_dir): candidates.append((last_written(data_dir, include_dirs=False), data_dir))
+    candidates = [c for c in candidates if c[0] > 0]
+    return max(candidates)[1] if candidates else None
+
+def adopt_checkpoint(source, target):
+    """Sostituisce i file di recovery di 'target' con una copia di quelli di 'source'."""
+    prune_checkpoint(target, keep=())
+    for room_id, path in recovery_files(source).items():
+        destination = recovery_file(target, room_id)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(path, destination)
+
+def prune_checkpoint(directory, keep):
+    """Rimuove i file di recovery delle stanze che non sono in 'keep'."""
+    for room_id, path in recovery_files(directory).items():
+        if room_id not in keep:
+            try: os.remove(path)
+            except OSError: pass
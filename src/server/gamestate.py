@@ -1,16 +1,23 @@
 import random
 import json
 import os
+import threading
 from datetime import datetime
 
+from server.wal import StateLog, read_log, COMPACT_EVERY
+from server.history import HistoryStore
+from server.records import Proposal, intern_name
+
 # ==========================================
 # CONFIGURAZIONE PATH & COSTANTI
 # ==========================================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, '..', '..', 'data')
 SAVE_FILE = os.path.join(DATA_DIR, 'recovery.json')
-HISTORY_FILE = os.path.join(DATA_DIR, 'history.json')
+HISTORY_DB = os.path.join(DATA_DIR, 'history.db')
+HISTORY_FILE = os.path.join(DATA_DIR, 'history.json')   # vecchio formato, migrato in HISTORY_DB
 THEMES_FILE = os.path.join(DATA_DIR, 'themes.json')
+ROOMS_DIR = os.path.join(DATA_DIR, 'rooms')   # file di recovery delle stanze diverse da quella principale
 
 # Fasi del Gioco
 PHASE_LOBBY = "LOBBY"
@@ -18,16 +25,48 @@ PHASE_WRITING = "WRITING"
 PHASE_SELECTING = "SELECTING"  
 PHASE_VOTING = "VOTING"         
 
+# Record che non vanno ritardati dall'accorpamento dei commit (transizioni di fase)
+DURABLE_OPS = {"story_started", "segment_started", "phase", "proposal_selected",
+               "game_aborted", "story_ended", "returned_to_lobby"}
+
+# Risorse condivise da tutte le stanze del processo: lette/aperte una sola volta
+_themes_cache = {}      # path -> lista dei temi
+_history_stores = {}    # path -> HistoryStore
+_shared_lock = threading.Lock()
+
+def history_store():
+    """Archivio storico condiviso, aperto al primo uso (migra il vecchio history.json una sola volta)."""
+    with _shared_lock:
+        store = _history_stores.get(HISTORY_DB)
+        if store is None:
+            store = _history_stores[HISTORY_DB] = HistoryStore(HISTORY_DB)
+            try:
+                imported = store.migrate_json(HISTORY_FILE)
+                if imported: print(f"[ARCHIVIO] Migrate {imported} storie da {HISTORY_FILE}")
+            except Exception as e:
+                print(f"[ERRORE] Migrazione storico fallita: {e}")
+    return store
+
 class GameState:
     """
     Gestisce la logica centrale, lo stato della partita e la persistenza dei dati.
     Agisce come 'Single Source of Truth' per il server.
     """
-    def __init__(self, persistence=True):
+    def __init__(self, persistence=True, save_file=None, load=True):
         self.persistence = persistence
+        self.save_file = save_file      # None: il SAVE_FILE della stanza principale
         
-        self.players = {}           
-        self.player_votes = {}      
+        # Indici mantenuti a ogni modifica: le verifiche sul percorso caldo sono O(1)
+        self._addrs_by_name = {}        # username -> insieme di addr connessi con quel nome
+        self._story_set = set()         # story_usernames come insieme
+        self._writers = set()           # addr dei partecipanti connessi che non sono il narratore
+        self._submitted = set()         # autori con una proposta nel segmento corrente
+        self._proposals_by_id = {}      # id -> proposta del segmento corrente
+        self._narrator_username = None
+
+        # Chiavi: id di sessione interi assegnati dal server (i test usano anche tuple addr)
+        self.players = {}               # sessione -> username internato, in ordine di ingresso (coda per il leader)
+        self.player_votes = {}          # sessione -> voto (bool)
         self.active_proposals = []  
         
         self.leader = None          
@@ -42,20 +81,79 @@ class GameState:
         
         self.available_themes = []
         self._load_themes()
+
+        self._pending = []      # record di mutazione non ancora consegnati al WAL
+        self._snapshot_due = True   # (standby) il prossimo checkpoint deve scrivere lo stato completo
+        self._log = None
         
-        if self.persistence:
+        # Gli standby non ripartono dal disco: il loro stato arriva solo dal master
+        if self.persistence and load:
             self.load_state()
 
     def _load_themes(self):
-        """Carica i temi dal file JSON o usa un default."""
-        try:
-            if os.path.exists(THEMES_FILE):
-                with open(THEMES_FILE, 'r', encoding='utf-8') as f:
-                    self.available_themes = json.load(f)
-            else:
-                self.available_themes = ["Tema Default"]
-        except Exception:
-            self.available_themes = ["Tema di Emergenza"]
+        """Carica i temi dal file JSON o usa un default (letto una volta per processo)."""
+        with _shared_lock:
+            themes = _themes_cache.get(THEMES_FILE)
+            if themes is None:
+                try:
+                    if os.path.exists(THEMES_FILE):
+                        with open(THEMES_FILE, 'r', encoding='utf-8') as f:
+                            themes = json.load(f)
+                    else:
+                        themes = ["Tema Default"]
+                except Exception:
+                    themes = ["Tema di Emergenza"]
+                _themes_cache[THEMES_FILE] = themes
+        self.available_themes = themes
+
+    # ==========================================
+    # INDICI
+    # ==========================================
+    # story_usernames, narrator_username e active_proposals restano attributi
+    # assegnabili (replay, apply_state_dict, test): il setter ricostruisce l'indice.
+
+    @property
+    def story_usernames(self): return self._story_usernames
+
+    @story_usernames.setter
+    def story_usernames(self, names):
+        self._story_usernames = names
+        self._story_set = set(names)
+        self._writers = {addr for addr, name in self.players.items() if self._is_writer(name)}
+
+    @property
+    def narrator_username(self): return self._narrator_username
+
+    @narrator_username.setter
+    def narrator_username(self, name):
+        old, self._narrator_username = self._narrator_username, name
+        # Solo gli addr del vecchio e del nuovo narratore cambiano ruolo
+        for changed in (old, name):
+            for addr in self._addrs_by_name.get(changed, ()):
+                if self._is_writer(changed): self._writers.add(addr)
+                else: self._writers.discard(addr)
+
+    @property
+    def active_proposals(self): return self._active_proposals
+
+    @active_proposals.setter
+    def active_proposals(self, proposals):
+        proposals = [p if isinstance(p, Proposal) else Proposal.from_dict(p) for p in proposals]
+        self._active_proposals = proposals
+        self._proposals_by_id = {p.id: p for p in proposals}
+        self._submitted = {p.author for p in proposals}
+
+    def _is_writer(self, name):
+        return name in self._story_set and name != self._narrator_username
+
+    def proposals_payload(self):
+        """Proposte del segmento nel formato dei messaggi."""
+        return [p.to_dict() for p in self._active_proposals]
+
+    def _index_proposal(self, proposal):
+        self._active_proposals.append(proposal)
+        self._proposals_by_id[proposal.id] = proposal
+        self._submitted.add(proposal.author)
 
     # ==========================================
     # DATI & REPLICAZIONE 
@@ -67,7 +165,7 @@ class GameState:
             "story_usernames": self.story_usernames,
             "narrator_username": self.narrator_username,
             "current_theme": self.current_theme,
-            "active_proposals": self.active_proposals,
+            "active_proposals": self.proposals_payload(),
             "current_segment_id": self.current_segment_id,
             "is_running": self.is_running,
             "phase": self.phase,
@@ -75,9 +173,11 @@ class GameState:
         }
 
     def apply_state_dict(self, data):
-        """Applica uno stato ricevuto (es. dallo Slave)."""
+        """Applica uno stato ricevuto (es. dallo Slave): sostituisce anche i record non ancora salvati."""
+        self._pending = []
+        self._snapshot_due = True
         self.story = data.get("story", [])
-        self.story_usernames = data.get("story_usernames", [])
+        self.story_usernames = [intern_name(n) for n in data.get("story_usernames", [])]
         self.narrator_username = data.get("narrator_username")
         self.current_theme = data.get("current_theme", "")
         self.active_proposals = data.get("active_proposals", [])
@@ -90,47 +190,152 @@ class GameState:
     # PERSISTENZA & RECOVERY
     # ==========================================
     def save_state(self):
-        """Salva lo stato corrente su disco per crash recovery."""
+        """
+        Rende persistenti le modifiche senza riscrivere tutto lo stato: i record
+        prodotti dai metodi di gioco vengono accodati al WAL (scritto da un thread
+        dedicato). Senza record (stato modificato direttamente dal chiamante) o quando
+        il log e' da compattare si scrive uno snapshot completo.
+        Restituisce i record consegnati (vuoto: stato modificato senza record), che il
+        master replica agli slave come operazioni.
+        """
+        records, self._pending = self._pending, []
+        if not self.persistence: return records
+        log = self._state_log()
+
+        if not self.is_running:
+            log.clear()
+        elif records and log.has_snapshot and log.records_since_snapshot < COMPACT_EVERY:
+            log.append(records)
+        else:
+            # Snapshot esplicito: attende il disco, come il vecchio salvataggio sincrono
+            log.snapshot(self.get_state_dict(), wait=not records)
+        return records
+
+    def checkpoint(self):
+        """
+        (Standby) Porta su disco lo stato replicato tenuto in memoria: i record ricevuti
+        dall'ultimo checkpoint in un'unica scrittura, oppure uno snapshot se il file non
+        ne ha uno valido, se e' arrivato uno stato completo o se i record sono troppi.
+        """
+        records, self._pending = self._pending, []
+        snapshot_due, self._snapshot_due = self._snapshot_due, False
         if not self.persistence: return
+        log = self._state_log()
 
         if not self.is_running:
-            if os.path.exists(SAVE_FILE):
-                try: os.remove(SAVE_FILE)
-                except: pass
-            return
+            log.clear()
+        elif records and not snapshot_due and log.has_snapshot and log.records_since_snapshot + len(records) <= COMPACT_EVERY:
+            log.append(records)
+        elif records or snapshot_due:
+            log.snapshot(self.get_state_dict())
 
-        data = self.get_state_dict()
-        try:
-            os.makedirs(DATA_DIR, exist_ok=True)
-            with open(SAVE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4)
-        except Exception as e:
-            print(f"[ERRORE] Salvataggio fallito: {e}")
+    def has_durable_changes(self):
+        """True se le modifiche non salvate includono una transizione di fase (o uno snapshot esplicito)."""
+        return not self._pending or any(r["op"] in DURABLE_OPS for r in self._pending)
+
+    def _state_log(self):
+        if self._log is None: self._log = StateLog(self._save_path())
+        return self._log
+
+    def _save_path(self):
+        return self.save_file or SAVE_FILE
 
     def load_state(self):
-        """Ripristina lo stato precedente in caso di riavvio del server."""
-        if not os.path.exists(SAVE_FILE): return
+        """Ripristina lo stato precedente in caso di riavvio del server (snapshot + coda del WAL)."""
+        save_file = self._save_path()
+        if not os.path.exists(save_file): return
 
         try:
-            with open(SAVE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            self.apply_state_dict(data)
-            print(f"[RECOVERY] Ripristinato. Fase: {self.phase}, Narratore: {self.narrator_username}")
+            state, records, compacted = read_log(save_file)
+            self.apply_state_dict(state)
+            for record in records: self._apply(record)
+            log = self._state_log()
+            log.has_snapshot = compacted
+            log.records_since_snapshot = len(records)
+            print(f"[RECOVERY] Ripristinato ({len(records)} record dal WAL). Fase: {self.phase}, Narratore: {self.narrator_username}")
         except Exception as e:
             print(f"[ERRORE] Recovery fallito: {e}")
-            if os.path.exists(SAVE_FILE):
-                try: os.remove(SAVE_FILE)
+            if os.path.exists(save_file):
+                try: os.remove(save_file)
                 except: pass
 
+    # ==========================================
+    # RECORD DI MUTAZIONE (WAL)
+    # ==========================================
+    def _commit(self, op, **fields):
+        """Applica una mutazione e la registra per il WAL: il replay usa lo stesso codice."""
+        record = {"op": op, **fields}
+        self._apply(record)
+        self._pending.append(record)
+        self.save_state()
+
+    def _apply(self, record):
+        getattr(self, "_apply_" + record["op"])(record)
+
+    def apply_records(self, records):
+        """(Slave) Applica i record ricevuti dal master: restano in memoria fino al checkpoint."""
+        for record in records: self._apply(record)
+        if self._snapshot_due: return
+        self._pending.extend(records)
+        # Oltre la soglia di compattazione conviene lo snapshot: inutile tenere i record
+        if len(self._pending) > COMPACT_EVERY:
+            self._pending = []
+            self._snapshot_due = True
+
+    def _apply_story_started(self, r):
+        self.player_votes.clear()
+        self.is_running = True
+        self.story_usernames = [intern_name(n) for n in r["story_usernames"]]
+        self.narrator_username = r["narrator_username"]
+        self.current_theme = r["theme"]
+        self.story = []
+        self.current_segment_id = 0
+        self.phase = PHASE_LOBBY
+
+    def _apply_segment_started(self, r):
+        self.current_segment_id = r["segment_id"]
+        self.active_proposals = []
+        self.phase = PHASE_WRITING
+
+    def _apply_proposal_added(self, r):
+        self._index_proposal(Proposal.from_dict(r["proposal"]))
+
+    def _apply_phase(self, r):
+        self.phase = r["phase"]
+
+    def _apply_proposal_selected(self, r):
+        selected = self._proposals_by_id[r["proposal_id"]]
+        self.story.append(selected.text)
+        self.active_proposals = []
+        self.phase = PHASE_LOBBY
+
+    def _apply_game_aborted(self, r):
+        self.is_running = False
+        self.phase = PHASE_LOBBY
+        self.active_proposals = []
+        self.player_votes.clear()
+        self.story_usernames = []
+
+    def _apply_story_ended(self, r):
+        self.is_running = False
+        self.phase = PHASE_VOTING
+
+    def _apply_returned_to_lobby(self, r):
+        self.is_running = False
+        self.player_votes.clear()
+        self.phase = PHASE_LOBBY
+
     # ==========================================
     # GESTIONE GIOCATORI
     # ==========================================
     def add_player(self, addr, username):
-        clean_name = username.strip()
+        clean_name = intern_name(username.strip())
         if not self.players:
             self.leader = addr 
+        if addr in self.players: self._unindex_player(addr)
         self.players[addr] = clean_name
+        self._addrs_by_name.setdefault(clean_name, set()).add(addr)
+        if self._is_writer(clean_name): self._writers.add(addr)
         
         if self.is_running and clean_name == self.narrator_username:
             self.narrator = addr
@@ -142,10 +347,12 @@ class GameState:
         new_leader_addr = None 
         if addr in self.players:
             if self.persistence: print(f"[INFO] Rimozione giocatore: {self.players[addr]}")
+            self._unindex_player(addr)
             del self.players[addr]
             
             if addr == self.leader:
-                self.leader = list(self.players.keys())[0] if self.players else None
+                # Il dizionario conserva l'ordine di ingresso: il primo rimasto e' il nuovo leader
+                self.leader = next(iter(self.players), None)
                 new_leader_addr = self.leader
             
             if addr in self.player_votes:
@@ -156,6 +363,14 @@ class GameState:
         
         return new_leader_addr
 
+    def _unindex_player(self, addr):
+        name = self.players[addr]
+        addrs = self._addrs_by_name.get(name)
+        if addrs:
+            addrs.discard(addr)
+            if not addrs: del self._addrs_by_name[name]
+        self._writers.discard(addr)
+
     # ==========================================
     # LOGICA DI GIOCO (GAME LOOP)
     # ==========================================
@@ -163,20 +378,13 @@ class GameState:
         self.player_votes.clear()
         if len(self.players) < 2: return False, "Servono 2 giocatori."
         
-        self.is_running = True
-        self.story_usernames = list(self.players.values())
-        
         self.narrator = random.choice(list(self.players.keys()))
-        self.narrator_username = self.players[self.narrator]
         
-        if self.available_themes: self.current_theme = random.choice(self.available_themes)
-        else: self.current_theme = "Tema misterioso"
+        if self.available_themes: theme = random.choice(self.available_themes)
+        else: theme = "Tema misterioso"
             
-        self.story = []
-        self.current_segment_id = 0
-        self.phase = PHASE_LOBBY 
-        
-        self.save_state()
+        self._commit("story_started", story_usernames=list(self.players.values()),
+                     narrator_username=self.players[self.narrator], theme=theme)
         return True, {
             "narrator_id": self.narrator, 
             "narrator_name": self.narrator_username,
@@ -184,10 +392,7 @@ class GameState:
         }
 
     def start_new_segment(self):
-        self.current_segment_id += 1
-        self.active_proposals = []
-        self.phase = PHASE_WRITING 
-        self.save_state()
+        self._commit("segment_started", segment_id=self.current_segment_id + 1)
         return self.current_segment_id
 
     def add_proposal(self, user_id, text):
@@ -199,55 +404,47 @@ class GameState:
         if current_user_name == self.narrator_username:
             return False, "Il narratore non può inviare proposte."
         
-        if current_user_name not in self.story_usernames:
+        if current_user_name not in self._story_set:
              return False, "Gli spettatori non possono scrivere."
 
-        proposal = {
-            "id": len(self.active_proposals),
-            "author": current_user_name,
-            "text": text
-        }
-        self.active_proposals.append(proposal)
-        self.save_state()
-        return True, proposal
+        self._commit("proposal_added", proposal={"id": len(self.active_proposals), "author": current_user_name, "text": text})
+        return True, self._active_proposals[-1]
+
+    def add_system_proposal(self, text="..."):
+        """Proposta di riserva quando nessuno ha scritto entro il tempo."""
+        self._commit("proposal_added", proposal={"id": len(self.active_proposals), "author": "System", "text": text})
 
     def set_phase_selecting(self):
-        self.phase = PHASE_SELECTING
-        self.save_state()
+        self._commit("phase", phase=PHASE_SELECTING)
 
     def select_proposal(self, proposal_id):
-        selected = next((p for p in self.active_proposals if p['id'] == proposal_id), None)
-        if selected:
-            self.story.append(selected['text'])
-            self.active_proposals = []
-            self.phase = PHASE_LOBBY 
-            self.save_state()
+        if proposal_id in self._proposals_by_id:
+            self._commit("proposal_selected", proposal_id=proposal_id)
             return True, self.story
         return False, None
 
     def abort_game(self):
-        self.is_running = False
-        self.phase = PHASE_LOBBY
-        self.active_proposals = []
-        self.player_votes.clear()
-        self.story_usernames = []
-        self.save_state() 
+        self._commit("game_aborted")
+
+    def end_story(self):
+        """Il narratore chiude la storia: si passa al voto per una nuova partita."""
+        self._commit("story_ended")
+
+    def return_to_lobby(self):
+        self._commit("returned_to_lobby")
 
     def register_vote(self, user_id, is_yes):
         self.player_votes[user_id] = is_yes
         return len(self.player_votes)
 
     def count_active_writers(self):
-        count = 0
-        for addr, name in self.players.items():
-            if name in self.story_usernames and name != self.narrator_username:
-                count += 1
-        return count
+        return len(self._writers)
     
     def has_user_submitted(self, username):
-        for p in self.active_proposals:
-            if p['author'] == username: return True
-        return False
+        return username in self._submitted
+
+    def history(self):
+        return history_store()
 
     def save_to_history(self):
         if not self.story: return
@@ -259,19 +456,8 @@ class GameState:
             "full_text": self.story
         }
 
-        history_data = []
-        if os.path.exists(HISTORY_FILE):
-            try:
-                with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                    history_data = json.load(f)
-            except Exception: pass
-
-        history_data.append(story_entry)
-
         try:
-            os.makedirs(DATA_DIR, exist_ok=True)
-            with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-                json.dump(history_data, f, indent=4)
-            print(f"[ARCHIVIO] Storia salvata in {HISTORY_FILE}")
+            self.history().append(story_entry)
+            print(f"[ARCHIVIO] Storia salvata in {HISTORY_DB}")
         except Exception as e:
             print(f"[ERRORE] Impossibile salvare storico: {e}")
\ No newline at end of file
@@ -0,0 +1,96 @@
+import json
+import os
+import sqlite3
+import threading
+
+# ==========================================
+# ARCHIVIO STORICO DELLE STORIE (SQLITE)
+# ==========================================
+# Ogni storia conclusa e' una riga: l'inserimento costa O(1) indipendentemente
+# dalla dimensione dell'archivio, e le letture sono pagine con cursore sull'id
+# (keyset pagination) servite dagli indici, senza caricare tutto in memoria.
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    theme TEXT,
+    narrator TEXT,
+    full_text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stories_date ON stories(date);
+CREATE INDEX IF NOT EXISTS idx_stories_theme ON stories(theme, id);
+CREATE INDEX IF NOT EXISTS idx_stories_narrator ON stories(narrator, id);
+"""
+
+class HistoryStore:
+    """
+    Archivio delle storie su SQLite in modalita' WAL.
+    Una sola connessione protetta da lock: server threaded e asyncio la condividono.
+    """
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def append(self, entry):
+        """entry: {"date", "theme", "narrator", "full_text"}. Restituisce l'id assegnato."""
+        with self._lock, self._db:
+            cur = self._db.execute(
+                "INSERT INTO stories (date, theme, narrator, full_text) VALUES (?, ?, ?, ?)",
+                (entry["date"], entry.get("theme"), entry.get("narrator"), json.dumps(entry["full_text"])))
+            return cur.lastrowid
+
+    def page(self, before=None, limit=DEFAULT_PAGE_SIZE, theme=None, narrator=None, since=None, until=None):
+        """
+        Storie dalla piu' recente alla piu' vecchia. 'before' e' il cursore restituito
+        dalla pagina precedente (None per la prima). Restituisce (storie, cursore_successivo):
+        il cursore e' None quando non ci sono altre pagine.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        clauses, params = [], []
+        if before is not None: clauses.append("id < ?"); params.append(int(before))
+        if theme is not None: clauses.append("theme = ?"); params.append(theme)
+        if narrator is not None: clauses.append("narrator = ?"); params.append(narrator)
+        if since is not None: clauses.append("date >= ?"); params.append(since)
+        if until is not None: clauses.append("date <= ?"); params.append(until)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        # Una riga in piu' dice se esiste una pagina successiva senza un COUNT(*)
+        query = f"SELECT id, date, theme, narrator, full_text FROM stories {where} ORDER BY id DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(query, params + [limit + 1]).fetchall()
+        stories = [{"id": r[0], "date": r[1], "theme": r[2], "narrator": r[3], "full_text": json.loads(r[4])}
+                   for r in rows[:limit]]
+        next_cursor = stories[-1]["id"] if len(rows) > limit else None
+        return stories, next_cursor
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM stories").fetchone()[0]
+
+    def migrate_json(self, json_path):
+        """
+        Importa una sola volta il vecchio history.json (lista di storie), poi lo rinomina
+        in '.migrated' cosi' l'import non si ripete. Restituisce il numero di storie importate.
+        """
+        if not os.path.exists(json_path): return 0
+        with open(json_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO stories (date, theme, narrator, full_text) VALUES (?, ?, ?, ?)",
+                [(e.get("date", ""), e.get("theme"), e.get("narrator"), json.dumps(e.get("full_text", [])))
+                 for e in entries])
+        os.replace(json_path, json_path + ".migrated")
+        return len(entries)
+
+    def close(self):
+        with self._lock: self._db.close()
@@ -0,0 +1,125 @@
+import threading
+from collections import deque
+
+from common.protocol import IOV_MAX, encode_body, frame_body
+
+# ==========================================
+# CODE DI USCITA PER CONNESSIONE
+# ==========================================
+OUTBOUND_HIGH_WATER = 1024 * 1024   # byte in coda oltre i quali il client viene disconnesso
+MAX_BATCH_BYTES = 256 * 1024        # byte scritti al massimo con una singola sendmsg
+MAX_BATCH_BUFFERS = IOV_MAX         # buffer per batch: oltre IOV_MAX sendmsg fallisce
+
+def frame_buffers(msg, codec, compress=False):
+    return frame_body(encode_body(msg, codec), compress)
+
+
+class OutboundQueue:
+    """
+    Coda di uscita limitata: i frame escono nell'ordine di accodamento.
+    put() non blocca mai: se la coda supera la soglia restituisce False
+    e il chiamante deve scollegare il client lento.
+    """
+    def __init__(self, high_water=OUTBOUND_HIGH_WATER):
+        self.high_water = high_water
+        self.frames = deque()
+        self.queued_bytes = 0
+        self.cond = threading.Condition()
+
+    def put(self, buffers):
+        size = sum(len(b) for b in buffers)
+        with self.cond:
+            if self.queued_bytes + size > self.high_water: return False
+            self.frames.append((buffers, size))
+            self.queued_bytes += size
+            self.cond.notify()
+        return True
+
+    def take_batch(self, max_bytes=MAX_BATCH_BYTES, max_buffers=MAX_BATCH_BUFFERS):
+        """Preleva (senza attendere) i frame da scrivere, nell'ordine di accodamento."""
+        batch = []
+        taken = 0
+        with self.cond:
+            frames = self.frames
+            while frames and (not batch or (taken + frames[0][1] <= max_bytes and len(batch) + len(frames[0][0]) <= max_buffers)):
+                buffers, size = frames.popleft()
+                batch.extend(buffers)
+                taken += size
+            self.queued_bytes -= taken
+        return batch
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class QueuedConnection:
+    """
+    FramedConnection con coda di uscita svuotata da un thread writer dedicato.
+    send_message non blocca: un client lento fa crescere solo la propria coda
+    e viene chiuso quando supera la soglia, senza rallentare la stanza.
+    """
+    def __init__(self, conn, high_water=OUTBOUND_HIGH_WATER):
+        self.conn = conn
+        self.outbox = OutboundQueue(high_water)
+        self.story_deltas = False
+        self.batching = False
+        self.compress = False
+        self.session_id = None     # assegnato dal server alla connessione
+        self.last_active = 0.0
+        self.room = None           # stanza scelta con il JOIN
+        self.closing = False
+        self.closed = False
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+    @property
+    def codec(self): return self.conn.codec
+
+    @codec.setter
+    def codec(self, value): self.conn.codec = value
+
+    def recv_message(self):
+        return self.conn.recv_message()
+
+    def send_message(self, msg):
+        self.send_buffers(frame_buffers(msg, self.conn.codec, self.compress))
+
+    def send_buffers(self, buffers):
+        if self.closing: return
+        if not self.outbox.put(buffers):
+            print("[OUTBOUND] Client troppo lento: coda piena, disconnessione.")
+            self.abort()
+
+    def close(self):
+        """Chiusura ordinata: il writer invia quanto gia' in coda, poi chiude il socket."""
+        with self.outbox.cond:
+            self.closing = True
+            self.outbox.cond.notify()
+
+    def abort(self):
+        """Chiusura immediata: scarta la coda (client bloccato o morto)."""
+        with self.outbox.cond:
+            self.closing = True
+            self.outbox.frames.clear()
+            self.outbox.queued_bytes = 0
+            self.outbox.cond.notify()
+        self._close_socket()
+
+    def _close_socket(self):
+        if self.closed: return
+        self.closed = True
+        try: self.conn.close()
+        except OSError: pass
+
+    def _writer_loop(self):
+        try:
+            while True:
+                with self.outbox.cond:
+                    while not len(self.outbox) and not self.closing:
+                        self.outbox.cond.wait()
+                    if not len(self.outbox) and self.closing: break
+                batch = self.outbox.take_batch()
+                if batch: self.conn.send_buffers(batch)
+        except OSError: pass
+        finally:
+            self._close_socket()
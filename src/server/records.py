@@ -0,0 +1,36 @@
+import sys
+
+# ==========================================
+# RECORD COMPATTI DELLO STATO DI GIOCO
+# ==========================================
+# In memoria le proposte sono oggetti con __slots__ (niente dizionario per istanza,
+# niente chiavi ripetute); i nomi dei giocatori sono internati, quindi players,
+# story_usernames e gli autori delle proposte condividono la stessa stringa.
+# Il formato a dizionario esiste solo ai bordi: messaggi, WAL e replica.
+
+def intern_name(name):
+    return sys.intern(name) if isinstance(name, str) else name
+
+
+class Proposal:
+    __slots__ = ("id", "author", "text")
+
+    def __init__(self, id, author, text):
+        self.id = id
+        self.author = intern_name(author)
+        self.text = text
+
+    def __getitem__(self, key):
+        """Accesso in stile dizionario (p['text']) per il codice scritto sulle vecchie proposte."""
+        try: return getattr(self, key)
+        except (AttributeError, TypeError): raise KeyError(key)
+
+    def to_dict(self):
+        return {"id": self.id, "author": self.author, "text": self.text}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["id"], data["author"], data["text"])
+
+    def __repr__(self):
+        return f"Proposal({self.id!r}, {self.author!r}, {self.text!r})"
@@ -0,0 +1,275 @@
+import itertools
+import json
+import socket
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+
+from common.protocol import COMPRESS_LEVEL, FrameBuffer, JSON_MARKER, encode_frame
+
+# ==========================================
+# CANALE DI REPLICA MASTER -> SLAVE
+# ==========================================
+# Appena connesso lo slave invia una riga HELLO: solo gli slave che lo annunciano
+# ricevono un unico flusso zlib persistente (la ripetizione tra messaggi costa poco).
+# Gli slave legacy non inviano nulla e continuano a ricevere il flusso in chiaro,
+# con ogni snapshot in JSON seguito da '\n__END__\n'.
+#
+# Gli slave che annunciano 'ops' (con l'ultimo log e numero di sequenza applicati)
+# ricevono frame [Lunghezza (4 byte)] + [JSON] come in common/protocol.py, con un
+# flusso di operazioni numerate invece degli snapshot completi:
+#   {"log": id, "seq": n}                      intestazione: le voci proseguono da n
+#   {"seq": n, "room": r, "ops": [record]}     record di mutazione del GameState (come nel WAL)
+#   {"seq": n, "room": r, "state": {...}}      stato completo di una stanza
+#   {"room": r, "state": {...}}                stato iniziale (dopo l'intestazione)
+# Uno slave che si riconnette riceve solo le voci successive alla sua sequenza;
+# lo stato completo viaggia solo se il master non le conserva piu' (o e' un altro log).
+# Uno standby promosso apre un log nuovo: gli standby possono aver applicato voci
+# diverse del vecchio master, e lo stesso (log, seq) non deve indicare voci diverse.
+#
+# Lease del master: l'intestazione porta anche {"lease": secondi, "pid": pid} e agli
+# slave che annunciano 'lease' nell'HELLO il master rinnova la lease ogni
+# LEASE_RENEW_INTERVAL con il messaggio {"lease": secondi} (non numerato). Il rinnovo
+# passa dal lock globale, quindi si ferma anche se il master e' bloccato ma vivo:
+# uno slave che non riceve nulla per la durata della lease considera il master perso.
+
+SNAPSHOT_DELIMITER = b'\n__END__\n'
+REPLICA_HELLO = b'HELLO zlib\n'
+HELLO_TIMEOUT = 1.0
+MAX_HELLO_SIZE = 128
+RETAINED_ENTRIES = 4096   # voci conservate dal master per il recupero degli slave
+MAX_REPLICA_FRAME = 256 * 1024 * 1024   # lo stato completo di un processo puo' superare i frame dei client
+RECV_BUFFER_SIZE = 64 * 1024
+REPLICA_HIGH_WATER = 16 * 1024 * 1024   # byte in coda per slave oltre i quali lo slave viene scollegato
+SEND_CHUNK = 256 * 1024                 # byte compressi e scritti per volta dal thread di invio
+MAX_REPLICA_LAG = 5.0                   # secondi di ritardo oltre i quali lo slave viene scollegato
+LEASE_TIMEOUT = 0.5                     # secondi senza messaggi dopo i quali il master e' considerato perso
+LEASE_RENEW_INTERVAL = 0.1              # secondi tra due rinnovi della lease
+ZLIB_MAGIC = 0x78   # primo byte di un flusso zlib; uno snapshot in chiaro inizia con '{'
+
+def encode_snapshot(state_dict):
+    """Snapshot per gli slave legacy: JSON seguito dal delimitatore."""
+    return json.dumps(state_dict).encode('utf-8') + SNAPSHOT_DELIMITER
+
+def encode_message(msg):
+    """Messaggio del flusso a operazioni: frame con lunghezza, nessuna scansione in ricezione."""
+    return encode_frame(msg)
+
+def make_hello(log_id, seq):
+    """(Slave) HELLO con compressione, richiesta delle operazioni successive a (log_id, seq) e rinnovi della lease."""
+    return f"HELLO zlib ops {log_id} {seq} lease\n".encode('ascii')
+
+def make_lease(timeout):
+    """(Master) Rinnovo della lease: il master resta valido per altri 'timeout' secondi."""
+    return encode_message({"lease": timeout})
+
+def is_lease_renewal(msg):
+    return "lease" in msg and "log" not in msg
+
+def read_hello(sock, timeout=HELLO_TIMEOUT):
+    """
+    (Master) Legge la riga HELLO dello slave entro il timeout.
+    Restituisce (compressione, resume, lease): resume e' (log_id, seq) per gli slave che
+    ricevono le operazioni, None per quelli che ricevono snapshot completi; lease e'
+    True se lo slave vuole i rinnovi della lease.
+    """
+    data = b""
+    try:
+        sock.settimeout(timeout)
+        while not data.endswith(b"\n") and len(data) < MAX_HELLO_SIZE:
+            chunk = sock.recv(1)
+            if not chunk: break
+            data += chunk
+        sock.settimeout(None)
+    except OSError: pass
+    fields = data.split()
+    compress = fields[:2] == [b"HELLO", b"zlib"]
+    resume = None
+    if compress and len(fields) in (5, 6) and fields[2] == b"ops":
+        try: resume = (fields[3].decode('ascii'), int(fields[4]))
+        except ValueError: pass
+    lease = resume is not None and fields[5:] == [b"lease"]
+    return compress, resume, lease
+
+
+class ReplicationLog:
+    """
+    Voci di replica numerate in ordine. Il master ne conserva le ultime 'retain'
+    gia' codificate, per riallineare uno slave senza inviare lo stato completo;
+    lo slave tiene lo stesso log e alla promozione ne apre uno nuovo (start_epoch).
+    """
+    def __init__(self, retain=RETAINED_ENTRIES):
+        self.log_id = uuid.uuid4().hex
+        self.seq = 0
+        self.entries = deque(maxlen=retain)   # (seq, payload codificato)
+
+    def append(self, entry):
+        """Assegna il numero successivo a 'entry' e restituisce il payload da inviare."""
+        self.seq += 1
+        payload = encode_message({"seq": self.seq, **entry})
+        self.entries.append((self.seq, payload))
+        return payload
+
+    def reset(self, log_id, seq):
+        """Adotta il log del master a partire da 'seq' (dopo uno stato completo)."""
+        self.log_id, self.seq = log_id, seq
+        self.entries.clear()
+
+    def start_epoch(self):
+        """(Promozione) Nuovo id di log: gli slave del vecchio master si riallineano con lo stato completo."""
+        self.reset(uuid.uuid4().hex, self.seq)
+
+    def resume(self, log_id, seq):
+        """Voci successive a (log_id, seq) se appartengono a questo log, altrimenti None."""
+        return self.since(seq) if log_id == self.log_id else None
+
+    def since(self, seq):
+        """Payload delle voci successive a 'seq', o None se non sono piu' tutte conservate."""
+        if seq > self.seq: return None
+        if seq == self.seq: return []
+        if not self.entries or self.entries[0][0] > seq + 1: return None
+        start = seq + 1 - self.entries[0][0]
+        return [payload for _, payload in itertools.islice(self.entries, start, None)]
+
+
+class SlaveLink:
+    """
+    Connessione master -> slave con coda e thread di invio dedicati.
+    send() accoda e ritorna subito: il master non aspetta mai la rete ne' tiene il
+    lock globale durante gli invii, e uno slave lento fa crescere solo la propria coda.
+    Il thread di invio comprime e scrive la coda a blocchi di SEND_CHUNK byte: anche uno
+    stato completo di molti MB arriva a pezzi, e lo slave vede dati (e la lease viva) di continuo.
+    Oltre 'high_water' byte in coda lo slave viene scollegato: al rientro si
+    riallinea dal log delle operazioni o dallo stato completo.
+    """
+    def __init__(self, sock, compress=False, ops=False, lease=False, high_water=REPLICA_HIGH_WATER):
+        self.sock = sock
+        self.ops = ops      # riceve le operazioni numerate invece degli snapshot completi
+        self.lease = lease  # riceve i rinnovi della lease
+        self.compressor = zlib.compressobj(COMPRESS_LEVEL) if compress else None
+        self.high_water = high_water
+        try: self.name = "%s:%s" % sock.getpeername()[:2]
+        except (OSError, TypeError): self.name = "slave"
+        self.cond = threading.Condition()
+        self.queue = deque()        # (seq, istante di accodamento, payload), compresi quelli in invio
+        self.queued_bytes = 0
+        self.sent_seq = 0           # sequenza dell'ultimo payload scritto sul socket
+        self.sent_bytes = 0
+        self.closed = False
+        self.close_reason = None
+        self._sender = threading.Thread(target=self._sender_loop, daemon=True)
+        self._sender.start()
+
+    def send(self, payload, seq=0):
+        """Accoda un payload (non blocca). False se lo slave e' scollegato."""
+        with self.cond:
+            if self.closed: return False
+            # Un solo payload piu' grande della soglia (stato completo iniziale) passa a coda vuota
+            if self.queue and self.queued_bytes + len(payload) > self.high_water: overflow = True
+            else:
+                overflow = False
+                self.queue.append((seq, time.monotonic(), payload))
+                self.queued_bytes += len(payload)
+                self.cond.notify()
+        if overflow: self.close("coda di replica piena")
+        return not overflow
+
+    def lag(self, head_seq):
+        """Ritardo dello slave rispetto alla sequenza 'head_seq' del master: operazioni, byte e secondi in coda."""
+        with self.cond:
+            oldest = self.queue[0][1] if self.queue else None
+            return {
+                "slave": self.name,
+                "entries": max(0, head_seq - self.sent_seq),
+                "bytes": self.queued_bytes,
+                "seconds": time.monotonic() - oldest if oldest is not None else 0.0,
+            }
+
+    def close(self, reason=None):
+        with self.cond:
+            if self.closed: return
+            self.closed = True
+            self.close_reason = reason
+            self.queue.clear()
+            self.queued_bytes = 0
+            self.cond.notify()
+        # shutdown sveglia il thread di invio se e' bloccato in sendall
+        try: self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError: pass
+        try: self.sock.close()
+        except OSError: pass
+
+    def _sender_loop(self):
+        try:
+            while True:
+                with self.cond:
+                    while not self.queue and not self.closed: self.cond.wait()
+                    if self.closed: return
+                    batch, size = [], 0
+                    for item in self.queue:
+                        batch.append(item)
+                        size += len(item[2])
+                        if size >= SEND_CHUNK: break
+                data = memoryview(b"".join(payload for _, _, payload in batch))
+                sent = 0
+                for start in range(0, len(data), SEND_CHUNK):
+                    piece = data[start:start + SEND_CHUNK]
+                    if self.compressor:
+                        # Z_SYNC_FLUSH: ogni blocco e' decodificabile subito, il contesto resta condiviso
+                        piece = self.compressor.compress(piece) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+                    self.sock.sendall(piece)
+                    sent += len(piece)
+                with self.cond:
+                    if self.closed: return
+                    for _ in batch: self.queue.popleft()
+                    self.queued_bytes -= size
+                    self.sent_seq = max(self.sent_seq, batch[-1][0])
+                    self.sent_bytes += sent
+        except OSError:
+            self.close("connessione persa")
+
+
+class SnapshotReader:
+    """
+    (Slave) Ricompone i messaggi dal flusso del master.
+    Compressione e formato si riconoscono dai primi byte, quindi funziona anche con
+    un master legacy: i suoi snapshot iniziano con '{' e sono separati dal delimitatore,
+    il flusso a frame inizia con l'header di lunghezza e viene decodificato da un
+    FrameBuffer riutilizzato, senza concatenare i chunk ricevuti.
+    """
+    def __init__(self, max_frame_size=MAX_REPLICA_FRAME):
+        self.inflater = None
+        self.started = False
+        self.frames = None          # FrameBuffer del flusso a frame; None finche' il formato non e' noto
+        self.legacy = False         # flusso legacy con delimitatore
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+        self._scanned = 0
+
+    def feed(self, data):
+        """Accoda i byte ricevuti e restituisce i messaggi completi (dizionari) nell'ordine."""
+        if not self.started and data:
+            self.started = True
+            if data[0] == ZLIB_MAGIC: self.inflater = zlib.decompressobj()
+        if self.inflater: data = self.inflater.decompress(data)
+        if not data: return []
+        if self.frames is None and not self.legacy:
+            if data[0] == JSON_MARKER: self.legacy = True
+            else: self.frames = FrameBuffer(RECV_BUFFER_SIZE, self.max_frame_size)
+        if self.frames is not None: return self.frames.feed(data)
+        return self._feed_legacy(data)
+
+    def _feed_legacy(self, data):
+        self.buffer += data
+        snapshots = []
+        while True:
+            end = self.buffer.find(SNAPSHOT_DELIMITER, self._scanned)
+            if end < 0:
+                self._scanned = max(0, len(self.buffer) - len(SNAPSHOT_DELIMITER) + 1)
+                return snapshots
+            try: snapshots.append(json.loads(bytes(self.buffer[:end])))
+            except ValueError: pass
+            del self.buffer[:end + len(SNAPSHOT_DELIMITER)]
+            self._scanned = 0
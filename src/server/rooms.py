@@ -0,0 +1,124 @@
+import os
+import re
+import uuid
+from collections import deque
+
+from common.protocol import DEFAULT_ROOM
+
+# ==========================================
+# REGISTRO DELLE STANZE
+# ==========================================
+# Ogni stanza ha il proprio GameState (con il proprio WAL), il proprio timer di fase,
+# il proprio scheduler dei commit e l'insieme delle connessioni entrate con CMD_JOIN.
+# Le risorse pesanti (thread di scrittura, temi, archivio storico) sono condivise dal
+# processo, quindi una stanza inattiva costa solo i suoi oggetti in memoria; una stanza
+# vuota e senza partita in corso viene rimossa dal registro.
+
+ROOM_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+REPLAY_EVENTS = 128   # eventi conservati per stanza: oltre, chi rientra riceve lo stato completo
+
+def valid_room_id(room_id):
+    return isinstance(room_id, str) and ROOM_ID_PATTERN.match(room_id) is not None
+
+def room_save_file(rooms_dir, room_id):
+    """File di recovery di una stanza; None per la principale (usa il SAVE_FILE storico)."""
+    if room_id == DEFAULT_ROOM: return None
+    return os.path.join(rooms_dir, f"{room_id}.json")
+
+
+class RoomEvents:
+    """
+    Eventi inviati a tutta la stanza, numerati in ordine ("seq"). Gli ultimi 'retain'
+    restano per i client che rientrano con il token di ripresa ('stream', diverso per
+    ogni stanza ricreata) e l'ultima sequenza vista: ricevono solo quelli persi.
+    Lo standby riceve gli stessi eventi dal master, quindi la ripresa vale anche dopo un failover.
+    """
+    def __init__(self, retain=REPLAY_EVENTS):
+        self.stream = uuid.uuid4().hex
+        self.seq = 0
+        self.entries = deque(maxlen=retain)
+
+    def append(self, msg):
+        """Assegna il numero successivo all'evento e lo conserva; restituisce l'evento numerato."""
+        self.seq += 1
+        evt = {**msg, "seq": self.seq}
+        self.entries.append(evt)
+        return evt
+
+    def since(self, stream, seq):
+        """Eventi successivi a 'seq' dello stesso stream, o None se non sono piu' tutti conservati."""
+        if stream != self.stream or not isinstance(seq, int) or seq < 0 or seq > self.seq: return None
+        if seq == self.seq: return []
+        if not self.entries or self.entries[0]["seq"] > seq + 1: return None
+        return [evt for evt in self.entries if evt["seq"] > seq]
+
+    def snapshot(self):
+        return {"stream": self.stream, "seq": self.seq, "entries": list(self.entries)}
+
+    def merge(self, data):
+        """(Standby) Eventi replicati dal master: si accodano se contigui, altrimenti sostituiscono i conservati."""
+        entries = data.get("entries", [])
+        if data.get("stream") != self.stream or not entries or entries[0]["seq"] != self.seq + 1:
+            self.stream = data.get("stream")
+            self.entries.clear()
+        self.entries.extend(entries)
+        self.seq = entries[-1]["seq"] if entries else data.get("seq", 0)
+
+
+class Room:
+    __slots__ = ("room_id", "game_state", "connections", "timer", "scheduler", "persist", "events")
+
+    def __init__(self, room_id, game_state):
+        self.room_id = room_id
+        self.game_state = game_state
+        self.connections = {}       # sessione -> connessione dei client entrati nella stanza
+        self.timer = None           # timer della fase corrente
+        self.scheduler = None       # CommitScheduler della stanza
+        self.persist = game_state.save_state   # salvataggio originale (prima dell'hook del server)
+        self.events = RoomEvents()             # eventi della stanza per la ripresa delle sessioni
+
+    def is_idle(self):
+        return not self.connections and not self.game_state.is_running
+
+    def __repr__(self):
+        return f"Room({self.room_id!r}, {len(self.connections)} connessioni)"
+
+
+class RoomRegistry:
+    """
+    room_id -> Room. 'factory(room_id)' crea la stanza (GameState, hook, scheduler):
+    il registro non conosce i dettagli del server. Il chiamante tiene il lock globale.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.rooms = {}
+
+    def get(self, room_id):
+        return self.rooms.get(room_id)
+
+    def get_or_create(self, room_id):
+        room = self.rooms.get(room_id)
+        if room is None: room = self.rooms[room_id] = self.factory(room_id)
+        return room
+
+    def discard_if_idle(self, room):
+        if room.is_idle() and self.rooms.get(room.room_id) is room:
+            del self.rooms[room.room_id]
+
+    def load_persisted(self, rooms_dir, owns=None):
+        """
+        Ricrea le stanze con un file di recovery (riavvio o promozione a master).
+        'owns(room_id)' limita il caricamento alle stanze di questo processo (worker a shard).
+        """
+        owns = owns or (lambda room_id: True)
+        if owns(DEFAULT_ROOM): self.get_or_create(DEFAULT_ROOM)
+        if not os.path.isdir(rooms_dir): return
+        for name in sorted(os.listdir(rooms_dir)):
+            room_id, ext = os.path.splitext(name)
+            if ext == ".json" and valid_room_id(room_id) and owns(room_id): self.get_or_create(room_id)
+
+    def __iter__(self):
+        return iter(list(self.rooms.values()))
+
+    def __len__(self):
+        return len(self.rooms)
@@ -0,0 +1,95 @@
+import argparse
+import socket
+import subprocess
+import threading
+import time
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from gamestate import history_store
+from server.sharding import HANDOFF_TIMEOUT, handoff_channel, read_routing_prefix, send_handoff, shard_for
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(__file__), "__main__.py")
+HOST = '127.0.0.1'
+GAME_PORT = 65432
+
+# ==========================================
+# ROUTER DEL DEPLOYMENT A SHARD
+# ==========================================
+# Un processo worker per core: ognuno e' un master con le proprie stanze, il proprio
+# lock e il proprio GIL. Il router accetta i client, legge il JOIN, passa il socket
+# al worker della stanza e non tocca piu' il traffico. I worker caduti vengono
+# riavviati (come fa runner.py) e ritrovano i passaggi rimasti in coda sul canale.
+
+class WorkerProcess:
+    def __init__(self, index, count, server_args):
+        self.index = index
+        self.count = count
+        self.server_args = server_args
+        self.channel, self.worker_end = handoff_channel()
+        self.process = None
+
+    def start(self):
+        fd = self.worker_end.fileno()
+        cmd = [sys.executable, SERVER_SCRIPT, "WORKER", str(fd), str(self.index), str(self.count)] + self.server_args
+        self.process = subprocess.Popen(cmd, pass_fds=(fd,))
+        print(f"--- [ROUTER] Worker {self.index} avviato (pid {self.process.pid}) ---")
+
+    def stop(self):
+        if self.process and self.process.poll() is None: self.process.terminate()
+
+
+def route_client(client_sock, addr, workers):
+    try:
+        client_sock.settimeout(HANDOFF_TIMEOUT)
+        routed = read_routing_prefix(client_sock)
+        if routed is None: return
+        prefix, room_id = routed
+        client_sock.settimeout(None)
+        send_handoff(workers[shard_for(room_id, len(workers))].channel, client_sock, prefix)
+    except OSError as e:
+        print(f"[ROUTER] Passaggio di {addr} fallito: {e}")
+    finally:
+        # Il worker ha la propria copia del descrittore
+        client_sock.close()
+
+def supervise(workers):
+    """Riavvia i worker terminati in modo anomalo."""
+    while True:
+        time.sleep(1)
+        for worker in workers:
+            code = worker.process.poll()
+            if code is not None:
+                print(f"--- [ROUTER] Worker {worker.index} terminato con codice {code}: riavvio ---")
+                worker.start()
+
+def run_router(port, count, server_args):
+    # Migrazione dell'archivio storico fatta una volta qui, non in concorrenza dai worker
+    history_store()
+    workers = [WorkerProcess(i, count, server_args) for i in range(count)]
+    for worker in workers: worker.start()
+    threading.Thread(target=supervise, args=(workers,), daemon=True).start()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        server.bind((HOST, port))
+        server.listen(128)
+        print(f"[ROUTER] In ascolto su {HOST}:{port} con {count} worker")
+        while True:
+            client_sock, addr = server.accept()
+            threading.Thread(target=route_client, args=(client_sock, addr, workers), daemon=True).start()
+    except KeyboardInterrupt:
+        print("\n[ROUTER] Arresto richiesto. Chiusura...")
+    finally:
+        server.close()
+        for worker in workers: worker.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server a shard: un router e N processi worker")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--port", type=int, default=GAME_PORT)
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    args = parser.parse_args()
+    run_router(args.port, max(1, args.workers), ["--async"] if args.use_async else [])
@@ -0,0 +1,66 @@
+import threading
+
+from server.timers import shared_timers
+
+# ==========================================
+# COMMIT A TICK (ACCORPAMENTO DELLE MODIFICHE)
+# ==========================================
+
+def thread_schedule(delay, callback):
+    return shared_timers().call_later(delay, callback)
+
+
+class CommitScheduler:
+    """
+    Accorpa le modifiche arrivate in una finestra breve (window secondi) in un
+    unico commit: un salvataggio, una replica e un giro di broadcast per tick.
+    commit(state_changed, broadcasts) riceve gli ultimi messaggi registrati con
+    broadcast_latest, uno per chiave e nell'ordine di prima registrazione;
+    state_changed e' False se nel tick ci sono solo broadcast (niente da salvare).
+    flush_now() esegue subito il commit (transizioni che devono essere durevoli).
+    'schedule(delay, callback)' pianifica il tick: il thread dei timer condiviso oppure il loop asyncio.
+    'guard' e' il lock del gioco: il commit gira sempre sotto di esso, quindi i commit
+    non si sovrappongono e flush_now() si puo' chiamare tenendolo gia' (RLock).
+    """
+    def __init__(self, commit, window=0.01, schedule=thread_schedule, guard=None):
+        self.commit = commit
+        self.window = window
+        self.schedule = schedule
+        self.guard = guard or threading.RLock()
+        self.ticks = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._scheduled = False
+        self._broadcasts = {}
+
+    def mark_dirty(self):
+        with self._lock: self._dirty = True
+        self._request_tick()
+
+    def broadcast_latest(self, key, msg):
+        """Registra un broadcast per il prossimo tick; un messaggio successivo con la stessa chiave lo sostituisce."""
+        with self._lock: self._broadcasts[key] = msg
+        self._request_tick()
+
+    def flush_now(self):
+        self._run()
+
+    def _request_tick(self):
+        with self._lock:
+            if self._scheduled: return
+            self._scheduled = True
+        self.schedule(self.window, self._tick)
+
+    def _tick(self):
+        with self._lock: self._scheduled = False
+        self._run()
+
+    def _run(self):
+        with self.guard:
+            with self._lock:
+                if not self._dirty and not self._broadcasts: return
+                state_changed, self._dirty = self._dirty, False
+                broadcasts = list(self._broadcasts.values())
+                self._broadcasts.clear()
+            self.ticks += 1
+            self.commit(state_changed, broadcasts)
@@ -0,0 +1,69 @@
+import socket
+import zlib
+
+from common.protocol import (
+    CMD_HEARTBEAT, CMD_JOIN, DEFAULT_ROOM, HEADER, HEADER_SIZE, LENGTH_MASK, MAX_COMMAND_SIZE,
+    decode_frame, recvall,
+)
+
+# ==========================================
+# SHARDING DELLE STANZE SU PIU' PROCESSI
+# ==========================================
+# Il router accetta i client sulla porta di gioco, legge i primi frame fino al JOIN
+# (heartbeat compresi), sceglie il worker che possiede la stanza e gli passa il socket.
+# Protocollo router -> worker, su una coppia AF_UNIX SOCK_SEQPACKET per worker:
+# un datagramma per client, con il descrittore del socket come SCM_RIGHTS e come
+# dati i byte gia' letti dal router (frame completi, da rielaborare nell'ordine).
+# Il worker e' un master a tutti gli effetti per le proprie stanze; il client non
+# si accorge del passaggio. La stessa stanza finisce sempre sullo stesso worker.
+
+MAX_HANDOFF_BYTES = MAX_COMMAND_SIZE   # sta sempre in un datagramma SEQPACKET
+MAX_PREFIX_FRAMES = 8                  # heartbeat tollerati prima del JOIN
+HANDOFF_TIMEOUT = 5                    # secondi concessi al client per inviare il JOIN
+
+def shard_for(room_id, workers):
+    """Indice del worker che possiede la stanza: stabile tra riavvii e tra processi."""
+    return zlib.crc32(room_id.encode('utf-8')) % workers
+
+def room_of(msg):
+    """Stanza di destinazione del primo comando; i client legacy e i comandi senza JOIN vanno nella principale."""
+    if msg and msg.get('type') == CMD_JOIN:
+        room_id = msg.get('room', DEFAULT_ROOM)
+        if isinstance(room_id, str): return room_id
+    return DEFAULT_ROOM
+
+def read_routing_prefix(sock):
+    """
+    Legge dal client i frame fino al primo comando diverso da HEARTBEAT.
+    Restituisce (byte letti, stanza) oppure None se il client chiude o invia frame non validi.
+    Il JOIN viaggia sempre in JSON non compresso, quindi il router non negozia nulla.
+    """
+    consumed = bytearray()
+    for _ in range(MAX_PREFIX_FRAMES):
+        raw_header = recvall(sock, HEADER_SIZE)
+        if not raw_header: return None
+        header = HEADER.unpack(raw_header)[0]
+        if len(consumed) + HEADER_SIZE + (header & LENGTH_MASK) > MAX_HANDOFF_BYTES: return None
+        body = recvall(sock, header & LENGTH_MASK)
+        if body is None: return None
+        try: msg = decode_frame(header, body)
+        except Exception: return None
+        consumed += raw_header
+        consumed += body
+        if not isinstance(msg, dict): return None
+        if msg.get('type') != CMD_HEARTBEAT: return bytes(consumed), room_of(msg)
+    return None
+
+def handoff_channel():
+    """(lato router, lato worker) della coppia di socket usata per i passaggi."""
+    return socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+def send_handoff(channel, client_sock, prefix):
+    """Passa il socket del client al worker insieme ai byte gia' letti."""
+    socket.send_fds(channel, [prefix], [client_sock.fileno()])
+
+def recv_handoff(channel):
+    """Riceve un passaggio: (socket del client, byte gia' letti), oppure None se il router e' chiuso."""
+    prefix, fds, _flags, _addr = socket.recv_fds(channel, MAX_HANDOFF_BYTES, 1)
+    if not fds: return None
+    return socket.socket(fileno=fds[0]), prefix
@@ -0,0 +1,104 @@
+import heapq
+import itertools
+import threading
+import time
+
+# ==========================================
+# TIMER DI PROCESSO (UN SOLO THREAD PER TUTTE LE SCADENZE)
+# ==========================================
+# In modalita' threaded ogni timer di fase e ogni tick di commit era un threading.Timer,
+# cioe' un thread per scadenza in attesa: con molte stanze, molti thread fermi.
+# Qui le scadenze stanno in un heap (pianificazione O(log n)) servito da un unico thread.
+# La cancellazione e' O(1): l'handle viene solo marcato e scartato quando arriva in cima;
+# se gli handle cancellati diventano la maggioranza, l'heap viene ricostruito.
+
+class TimerHandle:
+    """Scadenza pianificata. Come gli handle di asyncio: .cancel() la annulla (senza effetto se gia' eseguita)."""
+    __slots__ = ("when", "callback", "_service")
+
+    def __init__(self, when, callback, service):
+        self.when = when
+        self.callback = callback
+        self._service = service
+
+    def cancel(self):
+        self._service._cancel(self)
+
+
+class TimerService:
+    """
+    Esegue callback() allo scadere di ogni timer, in ordine di scadenza, sul thread del
+    servizio: le callback devono essere brevi (quelle lunghe ritardano le altre scadenze).
+    Il thread parte alla prima pianificazione. call_later e cancel sono thread-safe e si
+    possono chiamare anche da una callback.
+    """
+    def __init__(self):
+        self._heap = []                  # (scadenza, progressivo, handle)
+        self._counter = itertools.count()
+        self._cancelled = 0              # handle cancellati ancora nell'heap
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def call_later(self, delay, callback):
+        """Pianifica callback() tra 'delay' secondi. Restituisce un TimerHandle."""
+        handle = TimerHandle(time.monotonic() + max(0.0, delay), callback, self)
+        with self._cond:
+            if self._closed: raise RuntimeError("TimerService chiuso")
+            heapq.heappush(self._heap, (handle.when, next(self._counter), handle))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="timers", daemon=True)
+                self._thread.start()
+            # Sveglia il thread solo se la nuova scadenza e' la piu' vicina
+            elif self._heap[0][2] is handle: self._cond.notify()
+        return handle
+
+    def __len__(self):
+        """Timer in attesa (esclusi quelli cancellati)."""
+        with self._cond: return len(self._heap) - self._cancelled
+
+    def close(self):
+        """Ferma il thread; i timer ancora in attesa non vengono eseguiti."""
+        with self._cond:
+            self._closed = True
+            self._heap.clear()
+            self._cancelled = 0
+            self._cond.notify()
+        if self._thread: self._thread.join()
+
+    def _cancel(self, handle):
+        with self._cond:
+            if handle.callback is None: return
+            handle.callback = None
+            self._cancelled += 1
+            if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+                self._heap = [entry for entry in self._heap if entry[2].callback is not None]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                callback = None
+                while callback is None:
+                    if self._closed: return
+                    now = time.monotonic()
+                    if not self._heap: self._cond.wait()
+                    elif self._heap[0][0] > now: self._cond.wait(self._heap[0][0] - now)
+                    else:
+                        handle = heapq.heappop(self._heap)[2]
+                        callback, handle.callback = handle.callback, None
+                        if callback is None: self._cancelled -= 1
+            # Fuori dal lock: la callback puo' pianificare o cancellare altri timer
+            try: callback()
+            except Exception as e: print(f"[TIMER] Errore: {e}")
+
+
+_shared_timers = None
+_shared_timers_lock = threading.Lock()
+
+def shared_timers():
+    global _shared_timers
+    with _shared_timers_lock:
+        if _shared_timers is None: _shared_timers = TimerService()
+        return _shared_timers
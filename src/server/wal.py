@@ -0,0 +1,146 @@
+import atexit
+import json
+import os
+import threading
+from collections import deque
+
+# ==========================================
+# WRITE-AHEAD LOG DELLO STATO DI GIOCO
+# ==========================================
+# Un unico file JSON-lines: la prima riga e' uno snapshot completo
+#   {"op": "snapshot", "state": {...}}
+# le successive sono record di mutazione compatti, riapplicati in ordine al recovery.
+# Uno snapshot periodico riscrive il file (compattazione atomica con os.replace).
+
+COMPACT_EVERY = 200   # record in coda oltre i quali si riscrive lo snapshot
+
+def encode_record(record):
+    return json.dumps(record, separators=(',', ':')) + "\n"
+
+def read_log(path):
+    """
+    Legge il file di recovery. Restituisce (stato, record, compattato):
+    'compattato' e' False per il vecchio formato (un solo dizionario indentato).
+    Un'ultima riga troncata (crash durante la scrittura) viene ignorata.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    try:
+        legacy = json.loads(content)
+        if isinstance(legacy, dict) and "op" not in legacy: return legacy, [], False
+    except ValueError: pass
+
+    lines = content.splitlines()
+    head = json.loads(lines[0])
+    if head.get("op") != "snapshot": raise ValueError("Il log non inizia con uno snapshot")
+    records = []
+    for line in lines[1:]:
+        try: records.append(json.loads(line))
+        except ValueError: break
+    return head["state"], records, True
+
+
+class LogWriter:
+    """
+    Thread di scrittura condiviso da tutti i WAL del processo (uno per stanza):
+    migliaia di stanze non costano migliaia di thread. I comandi di ogni log
+    restano nell'ordine di arrivo; quelli arrivati insieme diventano un'unica write.
+    """
+    def __init__(self):
+        self._commands = deque()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, log, command):
+        with self._cond:
+            self._commands.append((log, command))
+            self._cond.notify_all()
+
+    def flush(self):
+        """Attende che tutte le scritture accodate siano su disco."""
+        with self._cond:
+            while self._commands or self._busy: self._cond.wait()
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                while not self._commands: self._cond.wait()
+                batch = list(self._commands)
+                self._commands.clear()
+                self._busy = True
+            per_log = {}
+            for log, command in batch: per_log.setdefault(log, []).append(command)
+            for log, commands in per_log.items():
+                try: log._write_batch(commands)
+                except Exception as e: print(f"[ERRORE] Salvataggio fallito: {e}")
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+_shared_writer = None
+_shared_writer_lock = threading.Lock()
+
+def shared_writer():
+    global _shared_writer
+    with _shared_writer_lock:
+        if _shared_writer is None: _shared_writer = LogWriter()
+        return _shared_writer
+
+
+class StateLog:
+    """
+    WAL di uno stato di gioco. I metodi pubblici accodano e ritornano subito:
+    le scritture le esegue il LogWriter condiviso, in ordine.
+    Solo flush() (e snapshot(wait=True)) attende il disco.
+    """
+    def __init__(self, path, writer=None):
+        self.path = path
+        self.has_snapshot = False        # il file corrente inizia con uno snapshot valido
+        self.records_since_snapshot = 0
+        self._writer = writer or shared_writer()
+
+    def append(self, records):
+        self._enqueue(("append", "".join(encode_record(r) for r in records)))
+        self.records_since_snapshot += len(records)
+
+    def snapshot(self, state, wait=False):
+        """state: dizionario dello stato, serializzato qui (sul thread chiamante, quindi coerente)."""
+        self._enqueue(("snapshot", encode_record({"op": "snapshot", "state": state})))
+        self.has_snapshot = True
+        self.records_since_snapshot = 0
+        if wait: self.flush()
+
+    def clear(self):
+        """Partita finita: il file di recovery viene rimosso."""
+        self._enqueue(("clear", None))
+        self.has_snapshot = False
+        self.records_since_snapshot = 0
+
+    def flush(self):
+        self._writer.flush()
+
+    def _enqueue(self, command):
+        self._writer.submit(self, command)
+
+    def _write_batch(self, batch):
+        # Uno snapshot o una cancellazione rende superfluo tutto cio' che lo precede
+        last_reset = max((i for i, (kind, _) in enumerate(batch) if kind != "append"), default=-1)
+        if last_reset >= 0:
+            kind, data = batch[last_reset]
+            if kind == "clear":
+                if os.path.exists(self.path): os.remove(self.path)
+            else:
+                self._replace(data)
+        tail = "".join(data for kind, data in batch[last_reset + 1:])
+        if tail:
+            with open(self.path, 'a', encoding='utf-8') as f: f.write(tail)
+
+    def _replace(self, data):
+        directory = os.path.dirname(self.path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f: f.write(data)
+        os.replace(tmp_path, self.path)
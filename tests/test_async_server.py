@@ -0,0 +1,61 @@
+import unittest
+import sys
+import os
+import socket
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from common.protocol import send_json, recv_json, encode_frame
+from server.aioserver import AsyncGameServer
+
+class TestAsyncServer(unittest.TestCase):
+
+    def setUp(self):
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        self.port = probe.getsockname()[1]
+        probe.close()
+
+        self.connected = []
+        self.disconnected = []
+        ready = threading.Event()
+
+        def on_message(conn, addr, msg):
+            if msg.get('type') == "QUIT": return False
+            conn.send_message({"type": "ECHO", "n": msg.get('n')})
+            return True
+
+        self.server = AsyncGameServer('127.0.0.1', self.port,
+                                      lambda c, a: self.connected.append(a),
+                                      on_message,
+                                      lambda c, a: self.disconnected.append(a))
+        threading.Thread(target=self.server.serve_forever, args=(ready.set,), daemon=True).start()
+        ready.wait(5)
+        self.sock = socket.create_connection(('127.0.0.1', self.port))
+
+    def tearDown(self):
+        self.sock.close()
+        self.server.stop()
+
+    def test_fragmented_and_coalesced_frames(self):
+        """Frame spezzati a meta' e piu' frame nello stesso pacchetto vengono decodificati in ordine."""
+        frames = b"".join(encode_frame({"type": "PING", "n": i}) for i in range(3))
+        self.sock.sendall(frames[:5])
+        time.sleep(0.05)
+        self.sock.sendall(frames[5:])
+
+        replies = [recv_json(self.sock)['n'] for _ in range(3)]
+        self.assertEqual(replies, [0, 1, 2])
+        self.assertEqual(len(self.connected), 1)
+
+    def test_callback_can_close_connection(self):
+        """Se on_message restituisce False il server chiude la connessione e notifica la disconnessione."""
+        send_json(self.sock, {"type": "QUIT"})
+        self.assertIsNone(recv_json(self.sock))
+        time.sleep(0.05)
+        self.assertEqual(len(self.disconnected), 1)
+
+if __name__ == '__main__':
+    unittest.main()
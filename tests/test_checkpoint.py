@@ -0,0 +1,82 @@
+import unittest
+import sys
+import os
+import tempfile
+import shutil
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from common.protocol import DEFAULT_ROOM
+from server.gamestate import GameState
+from server.checkpoint import (
+    adopt_checkpoint, freshest_checkpoint, node_dir, prune_checkpoint, recovery_file, recovery_files,
+)
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir)
+
+    def write(self, directory, room_id, age):
+        path = recovery_file(directory, room_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f: f.write(room_id)
+        when = 1_000_000 - age
+        for p in (path, os.path.dirname(path), directory):
+            os.utime(p, (when, when))
+        return path
+
+    def test_standby_writes_only_on_checkpoint(self):
+        """Lo standby applica i record in memoria; il disco cambia solo al checkpoint."""
+        master = GameState(persistence=False)
+        master.save_state = lambda: None     # i record restano in _pending, come tra due tick del master
+        master.add_player(1, "Alice")
+        master.add_player(2, "Bruno")
+        master.start_new_story()
+        master.start_new_segment()
+        records = master._pending
+
+        save_file = recovery_file(node_dir(self.data_dir, 65433), "alfa")
+        standby = GameState(save_file=save_file, load=False)
+        standby.apply_records(records)
+        self.assertEqual(standby._pending, [])
+        self.assertFalse(os.path.exists(save_file))
+
+        standby.checkpoint()
+        standby._log.flush()
+        restored = GameState(save_file=save_file)
+        self.assertTrue(restored.is_running)
+        self.assertEqual(restored.narrator_username, master.narrator_username)
+        self.assertEqual(restored.phase, master.phase)
+
+    def test_freshest_node_directory_is_adopted(self):
+        """Dopo un riavvio completo si riparte dalla directory scritta per ultima, poi si sfoltisce."""
+        old_node = node_dir(self.data_dir, 65432)
+        new_node = node_dir(self.data_dir, 65433)
+        target = node_dir(self.data_dir, 65434)
+        self.write(old_node, DEFAULT_ROOM, age=100)
+        self.write(old_node, "vecchia", age=100)
+        self.write(new_node, DEFAULT_ROOM, age=10)
+        self.write(new_node, "alfa", age=10)
+        self.write(target, "orfana", age=500)
+        self.assertEqual(freshest_checkpoint(self.data_dir), new_node)
+
+        adopt_checkpoint(new_node, target)
+        self.assertEqual(sorted(recovery_files(target)), ["alfa", DEFAULT_ROOM])
+        with open(recovery_file(target, "alfa")) as f: self.assertEqual(f.read(), "alfa")
+
+        prune_checkpoint(target, keep={DEFAULT_ROOM})
+        self.assertEqual(list(recovery_files(target)), [DEFAULT_ROOM])
+
+    def test_legacy_shared_directory_is_a_candidate(self):
+        """I file del vecchio layout condiviso in data/ restano recuperabili."""
+        self.assertIsNone(freshest_checkpoint(self.data_dir))
+        self.write(self.data_dir, DEFAULT_ROOM, age=10)
+        self.write(node_dir(self.data_dir, 65432), DEFAULT_ROOM, age=100)
+        self.assertEqual(freshest_checkpoint(self.data_dir), self.data_dir)
+
+if __name__ == '__main__':
+    unittest.main()
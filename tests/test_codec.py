@@ -0,0 +1,67 @@
+import unittest
+import sys
+import os
+import json
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from common.protocol import *
+
+class TestBinaryCodec(unittest.TestCase):
+
+    def test_roundtrip_all_value_types(self):
+        """Ogni tipo di valore (annidato, negativo, unicode, chiavi sconosciute) torna identico."""
+        msg = {"type": EVT_NARRATOR_DECISION_NEEDED, "timeout": 30, "delta": -7, "ratio": 0.5, "extra": None,
+               "proposals": [{"id": 0, "author": "Niccolò", "text": "Però è così."}, {"id": 1, "author": "Bob", "text": ""}],
+               "nested": {"flags": [True, False]}}
+        body = encode_body(msg, CODEC_BINARY)
+        self.assertNotEqual(body[0], ord('{'))
+        self.assertEqual(decode_body(body), msg)
+
+    def test_binary_is_smaller(self):
+        """Gli eventi piccoli devono occupare molto meno che in JSON."""
+        for msg in ({"type": CMD_HEARTBEAT}, {"type": EVT_VOTE_UPDATE, "count": 3, "needed": 8}):
+            self.assertLess(len(encode_body(msg, CODEC_BINARY)) * 3, len(encode_body(msg, CODEC_JSON)))
+
+    def test_legacy_json_and_unknown_types(self):
+        """I frame JSON restano decodificabili e i tipi fuori tabella ricadono su JSON."""
+        self.assertEqual(decode_body(json.dumps({"type": CMD_JOIN}).encode('utf-8')), {"type": CMD_JOIN})
+        unknown = {"type": "CUSTOM_EVENT", "x": 1}
+        self.assertEqual(encode_body(unknown, CODEC_BINARY), json.dumps(unknown).encode('utf-8'))
+        for opcode in (0, len(MESSAGE_TYPES) + 1):
+            with self.assertRaises(ValueError): decode_body(bytes([opcode, 0]))
+
+class TestBroadcastFrames(unittest.TestCase):
+
+    def test_shared_frame_encoded_once_per_codec(self):
+        """Tutti i destinatari con lo stesso codec ricevono gli stessi buffer."""
+        frame = SharedFrame({"type": EVT_NEW_SEGMENT, "segment_id": 3, "timeout": 60})
+        self.assertIs(frame.buffers_for(CODEC_JSON), frame.buffers_for(CODEC_JSON))
+        self.assertEqual(decode_body(frame.buffers_for(CODEC_BINARY)[1])["segment_id"], 3)
+
+    def test_shared_frame_compressed_variant(self):
+        """La variante compressa riusa il corpo gia' codificato e si decodifica uguale all'originale."""
+        msg = {"type": EVT_STORY_UPDATE, "story": ["Il drago dormiva sulla torre."] * 100}
+        frame = SharedFrame(msg)
+        plain = frame.buffers_for(CODEC_BINARY)
+        packed = frame.buffers_for(CODEC_BINARY, compress=True)
+        self.assertIs(packed, frame.buffers_for(CODEC_BINARY, True))
+        header = HEADER.unpack(packed[0])[0]
+        self.assertTrue(header & COMPRESSED_FLAG)
+        self.assertLess(len(packed[1]), len(plain[1]))
+        self.assertEqual(decode_frame(header, packed[1], allow_compressed=True), msg)
+
+    def test_personalized_frame_patches_only_the_tail(self):
+        """Il campo personale cambia solo la coda; il prefisso e' condiviso e il frame resta valido."""
+        evt = {"type": EVT_GAME_STARTED, "narrator": "Alice", "theme": "Tema", "is_spectator": False}
+        frame = PersonalizedFrame(evt, "am_i_narrator")
+        for codec in (CODEC_JSON, CODEC_BINARY):
+            yes, no = frame.buffers_for(codec, True), frame.buffers_for(codec, False)
+            self.assertIs(yes[1], no[1])
+            for value, buffers in ((True, yes), (False, no)):
+                raw = b"".join(buffers)
+                self.assertEqual(HEADER.unpack(raw[:HEADER_SIZE])[0], len(raw) - HEADER_SIZE)
+                self.assertEqual(decode_body(raw[HEADER_SIZE:]), dict(evt, am_i_narrator=value))
+
+if __name__ == '__main__':
+    unittest.main()
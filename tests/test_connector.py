@@ -0,0 +1,60 @@
+import unittest
+import sys
+import os
+import socket
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from client.connector import ServerConnector
+
+def listener():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)
+    return server, server.getsockname()
+
+def closed_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    addr = sock.getsockname()
+    sock.close()
+    return addr
+
+class TestServerConnector(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers: server.close()
+
+    def test_dead_nodes_are_skipped_and_master_remembered(self):
+        """I nodi che rifiutano non fanno attendere; il nodo che risponde diventa il primo candidato."""
+        server, live = listener()
+        self.servers.append(server)
+        dead = [closed_port(), closed_port()]
+        connector = ServerConnector(dead + [live], stagger=1.0, timeout=5.0)
+
+        connected = connector.connect()
+        self.assertIsNotNone(connected)
+        sock, addr = connected
+        self.assertEqual(addr, live)
+        self.assertTrue(sock.getblocking())
+        sock.close()
+        self.assertEqual(connector.candidates()[0], live)
+
+    def test_last_master_wins_the_race(self):
+        """Con piu' nodi in ascolto vince l'ultimo master noto; senza nessuno si ottiene None."""
+        first, first_addr = listener()
+        second, second_addr = listener()
+        self.servers += [first, second]
+        connector = ServerConnector([first_addr, second_addr])
+        connector.last_master = second_addr
+        sock, addr = connector.connect()
+        sock.close()
+        self.assertEqual(addr, second_addr)
+
+        self.assertIsNone(ServerConnector([closed_port()], timeout=0.2).connect())
+
+if __name__ == '__main__':
+    unittest.main()
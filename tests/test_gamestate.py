@@ -41,5 +41,24 @@ class TestGameState(unittest.TestCase):
         self.assertEqual(count, 1)
         self.assertEqual(self.game.player_votes[('127.0.0.1', 1001)], True)
 
+    def test_indexes_follow_direct_assignment(self):
+        """Gli indici (scrittori, proposte) seguono anche le assegnazioni dirette degli attributi."""
+        self.game.add_player(('127.0.0.1', 1001), "Alice")
+        self.game.add_player(('127.0.0.1', 1002), "Bob")
+        self.game.add_player(('127.0.0.1', 1003), "Carlo")
+        self.game.story_usernames = ["Alice", "Bob", "Carlo"]
+        self.game.narrator_username = "Alice"
+        self.assertEqual(self.game.count_active_writers(), 2)
+
+        self.game.narrator_username = "Bob"
+        self.game.remove_player(('127.0.0.1', 1003))
+        self.assertEqual(self.game.count_active_writers(), 1)
+        self.assertEqual(self.game.leader, ('127.0.0.1', 1001))
+
+        self.game.active_proposals = [{"id": 0, "author": "Alice", "text": "x"}]
+        self.assertTrue(self.game.has_user_submitted("Alice"))
+        self.assertTrue(self.game.select_proposal(0)[0])
+        self.assertFalse(self.game.has_user_submitted("Alice"))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,53 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+import shutil
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from server.history import HistoryStore
+
+class TestHistoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = HistoryStore(os.path.join(self.tmp_dir, "history.db"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _entry(self, i, theme="Horror"):
+        return {"date": f"2024-01-{i + 1:02d} 10:00:00", "theme": theme, "narrator": f"N{i % 2}", "full_text": [f"frase {i}"]}
+
+    def test_pagination_walks_all_stories_newest_first(self):
+        """Le pagine con cursore restituiscono ogni storia una volta, dalla piu' recente."""
+        for i in range(25): self.store.append(self._entry(i))
+        seen, cursor = [], None
+        while True:
+            stories, cursor = self.store.page(before=cursor, limit=10)
+            seen.extend(s["full_text"][0] for s in stories)
+            if cursor is None: break
+        self.assertEqual(seen, [f"frase {i}" for i in reversed(range(25))])
+
+    def test_filters_by_theme_and_narrator(self):
+        """I filtri per tema e narratore usano gli stessi cursori della pagina completa."""
+        for i in range(10): self.store.append(self._entry(i, theme="Horror" if i < 6 else "Fantasy"))
+        stories, cursor = self.store.page(theme="Horror", narrator="N0")
+        self.assertEqual([s["full_text"] for s in stories], [["frase 4"], ["frase 2"], ["frase 0"]])
+        self.assertIsNone(cursor)
+
+    def test_migrates_legacy_json_once(self):
+        """Il vecchio history.json viene importato una volta e poi rinominato."""
+        json_path = os.path.join(self.tmp_dir, "history.json")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump([self._entry(0), self._entry(1)], f, indent=4)
+        self.assertEqual(self.store.migrate_json(json_path), 2)
+        self.assertEqual(self.store.migrate_json(json_path), 0)
+        self.assertEqual(self.store.count(), 2)
+        self.assertTrue(os.path.exists(json_path + ".migrated"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import sys
+import os
+import socket
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from common.protocol import *
+from server.outbound import OutboundQueue, QueuedConnection
+
+class TestOutboundQueue(unittest.TestCase):
+
+    def test_frames_leave_in_order(self):
+        """I frame escono nell'ordine di accodamento, anche la storia completa seguita da un evento di fase."""
+        queue = OutboundQueue()
+        queue.put([b"story"])
+        queue.put([b"ask"])
+        self.assertEqual(queue.take_batch(), [b"story", b"ask"])
+        self.assertEqual(queue.queued_bytes, 0)
+
+    def test_high_water_rejects(self):
+        """Oltre la soglia put() rifiuta invece di bloccare."""
+        queue = OutboundQueue(high_water=10)
+        self.assertTrue(queue.put([b"12345"]))
+        self.assertFalse(queue.put([b"123456"]))
+
+    def test_stalled_client_is_disconnected(self):
+        """Un client che non legge mai viene chiuso senza bloccare chi invia."""
+        server_side, client_side = socket.socketpair()
+        conn = QueuedConnection(FramedConnection(server_side), high_water=256 * 1024)
+        story = {"type": EVT_STORY_UPDATE, "story": ["x" * 1000] * 50}
+
+        start = time.time()
+        for _ in range(200):
+            conn.send_message(story)
+        self.assertLess(time.time() - start, 1.0, "send_message non deve bloccare")
+        self.assertTrue(conn.closing)
+        client_side.close()
+
+    def test_long_backlog_of_small_frames(self):
+        """Centinaia di frame piccoli accodati dietro uno grande arrivano tutti (niente EMSGSIZE)."""
+        server_side, client_side = socket.socketpair()
+        conn = QueuedConnection(FramedConnection(server_side))
+        conn.send_message({"type": EVT_GAME_ENDED, "final_story": ["x" * 1000] * 200})
+        for i in range(600): conn.send_message({"type": EVT_VOTE_UPDATE, "count": i, "needed": 600})
+        reader = FramedConnection(client_side)
+        received = [reader.recv_message() for _ in range(601)]
+        self.assertEqual([m['count'] for m in received[1:]], list(range(600)))
+        conn.abort()
+        client_side.close()
+
+    def test_send_buffers_splits_iovecs(self):
+        """send_buffers non passa mai a sendmsg piu' di IOV_MAX buffer."""
+        server_side, client_side = socket.socketpair()
+        frames = [encode_frame({"type": EVT_VOTE_UPDATE, "count": i}) for i in range(IOV_MAX * 2 + 5)]
+        FramedConnection(server_side).send_buffers(frames)
+        reader = FramedConnection(client_side)
+        self.assertEqual([reader.recv_message()['count'] for _ in frames], list(range(len(frames))))
+        server_side.close()
+        client_side.close()
+
+if __name__ == '__main__':
+    unittest.main()
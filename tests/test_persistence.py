@@ -21,6 +21,7 @@ class TestPersistence(unittest.TestCase):
         self.game = GameState()
 
     def tearDown(self):
+        if self.game._log: self.game._log.flush()
         if os.path.exists(self.test_file):
             os.remove(self.test_file)
         gs_module.SAVE_FILE = self.original_save_file
@@ -49,5 +50,40 @@ class TestPersistence(unittest.TestCase):
         self.assertEqual(len(new_game.active_proposals), 1)
         self.assertEqual(new_game.active_proposals[0]['text'], "C'era una volta un fungo.")
 
+    def test_mutations_are_appended_and_replayed(self):
+        """Le mutazioni finiscono in coda al WAL come record e vengono riapplicate al recovery."""
+        self.game.add_player(('IP1', 1), "Mario")
+        self.game.add_player(('IP2', 2), "Luigi")
+        self.game.start_new_story()
+        self.game.start_new_segment()
+        writer = next(a for a, n in self.game.players.items() if n != self.game.narrator_username)
+        self.game.add_proposal(writer, "Un fungo parlante.")
+        self.game.select_proposal(0)
+        self.game.start_new_segment()
+        self.game._state_log().flush()
+
+        with open(self.test_file, encoding='utf-8') as f:
+            ops = [json.loads(line)["op"] for line in f]
+        self.assertEqual(ops, ["snapshot", "segment_started", "proposal_added", "proposal_selected", "segment_started"])
+
+        new_game = GameState()
+        self.assertEqual(new_game.story, ["Un fungo parlante."])
+        self.assertEqual((new_game.current_segment_id, new_game.phase), (2, "WRITING"))
+
+    def test_compaction_and_legacy_file(self):
+        """Oltre COMPACT_EVERY record il log viene compattato; il vecchio formato indentato resta leggibile."""
+        with open(self.test_file, 'w', encoding='utf-8') as f:
+            json.dump({"story": ["Uno"], "is_running": True, "phase": "WRITING", "current_segment_id": 1,
+                       "story_usernames": ["Mario", "Luigi"], "narrator_username": "Mario"}, f, indent=4)
+        game = GameState()
+        self.assertEqual(game.story, ["Uno"])
+        for _ in range(gs_module.COMPACT_EVERY + 5): game.set_phase_selecting()
+        game._state_log().flush()
+        with open(self.test_file, encoding='utf-8') as f:
+            lines = f.readlines()
+        self.assertLess(len(lines), gs_module.COMPACT_EVERY)
+        self.assertEqual(json.loads(lines[0])["op"], "snapshot")
+        self.assertEqual(GameState().phase, "SELECTING")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
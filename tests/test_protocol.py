@@ -2,11 +2,15 @@ import unittest
 import sys
 import os
 import json
+import socket
 import struct
+import threading
+import zlib
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 
-from common.protocol import send_json, recv_json
+from common.protocol import send_json, recv_json, encode_frame, apply_story_update, FramedConnection
+from common.protocol import make_batch, unpack_batch, decode_body, HEADER, HEADER_SIZE, COMPRESSED_FLAG, MAX_FRAME_SIZE, decode_frame, FrameBuffer, FrameTooLarge, CODEC_JSON, CODEC_BINARY, EVT_STORY_UPDATE, EVT_NEW_SEGMENT
 
 class MockSocket:
     def __init__(self, data_to_receive=b""):
@@ -58,5 +62,114 @@ class TestProtocol(unittest.TestCase):
         result = recv_json(mock_sock)
         self.assertIsNone(result)
 
+class TestFramedConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_many_frames_from_one_read(self):
+        """Piu' frame arrivati insieme vengono restituiti tutti con un solo recv_into."""
+        self.left.sendall(b"".join(encode_frame({"type": "PING", "n": i}) for i in range(50)))
+        reader = FramedConnection(self.right)
+        self.assertEqual([reader.recv_message()['n'] for _ in range(50)], list(range(50)))
+
+    def test_large_frame_grows_buffer(self):
+        """Un frame piu' grande del buffer preallocato viene ricevuto intero."""
+        writer = FramedConnection(self.left)
+        reader = FramedConnection(self.right, bufsize=128)
+        big = {"type": "STORY_UPDATE", "story": ["x" * 1000] * 300}
+        threading.Thread(target=writer.send_message, args=(big,)).start()
+        self.assertEqual(reader.recv_message(), big)
+
+    def test_interoperates_with_recv_json(self):
+        """I frame inviati con sendmsg sono identici a quelli di send_json."""
+        FramedConnection(self.left).send_message({"type": "TEST", "content": "Ciao"})
+        self.assertEqual(recv_json(self.right), {"type": "TEST", "content": "Ciao"})
+
+    def test_compressed_frames_only_above_threshold(self):
+        """Con la compressione negoziata i frame grandi viaggiano compressi, quelli piccoli no."""
+        writer = FramedConnection(self.left)
+        writer.compress = True
+        story = {"type": "STORY_UPDATE", "story": ["C'era una volta un drago gentile."] * 200}
+        small = {"type": "PING", "n": 1}
+        self.assertTrue(HEADER.unpack(encode_frame(story, compress=True)[:HEADER_SIZE])[0] & COMPRESSED_FLAG)
+        self.assertFalse(HEADER.unpack(encode_frame(small, compress=True)[:HEADER_SIZE])[0] & COMPRESSED_FLAG)
+        writer.send_message(story)
+        writer.send_message(small)
+        reader = FramedConnection(self.right)
+        reader.accept_compressed = True
+        self.assertEqual(reader.recv_message(), story)
+        self.assertEqual(reader.recv_message(), small)
+
+    def test_rejects_unnegotiated_or_oversized_compressed_frames(self):
+        """Un frame compresso non negoziato o che si espande oltre il limite chiude la connessione."""
+        bomb = zlib.compress(b"{" + b" " * (MAX_FRAME_SIZE + 1), 9)
+        frame = HEADER.pack(len(bomb) | COMPRESSED_FLAG) + bomb
+        reader = FramedConnection(self.right)
+        self.left.sendall(encode_frame({"type": "STORY_UPDATE", "story": ["abc"] * 500}, compress=True))
+        self.assertIsNone(reader.recv_message())
+        with self.assertRaises(ValueError):
+            decode_frame(HEADER.unpack(frame[:HEADER_SIZE])[0], frame[HEADER_SIZE:], allow_compressed=True)
+
+class TestFrameBuffer(unittest.TestCase):
+
+    def test_incremental_feed(self):
+        """feed() accetta input a pezzi e restituisce zero o piu' messaggi senza bloccare."""
+        stream = b"".join(encode_frame({"type": "PING", "n": i}) for i in range(3))
+        decoder = FrameBuffer(size=16)
+        received = []
+        for i in range(0, len(stream), 5):
+            received.extend(decoder.feed(stream[i:i + 5]))
+        self.assertEqual([m['n'] for m in received], [0, 1, 2])
+        self.assertEqual(decoder.feed(stream[:3]), [])
+        self.assertEqual(decoder.buffered, 3)
+
+    def test_oversized_header_rejected_without_allocating(self):
+        """Un header oltre il limite viene rifiutato subito, senza far crescere il buffer."""
+        decoder = FrameBuffer(size=1024, max_frame_size=4096)
+        with self.assertRaises(FrameTooLarge):
+            decoder.feed(HEADER.pack(1 << 30) + b"{")
+        self.assertEqual(decoder.memory_usage, 1024)
+
+    def test_buffer_shrinks_after_large_frame(self):
+        """Dopo un frame grande (entro il limite) il buffer torna alla dimensione iniziale."""
+        decoder = FrameBuffer(size=1024, max_frame_size=1 << 20)
+        big = {"type": "STORY_UPDATE", "story": ["x" * 1000] * 100}
+        self.assertEqual(decoder.feed(encode_frame(big)), [big])
+        self.assertEqual(decoder.memory_usage, 1024)
+
+class TestStoryDelta(unittest.TestCase):
+
+    def test_deltas_append_in_order(self):
+        """I delta consecutivi estendono la copia locale; i duplicati sono ignorati."""
+        story = []
+        self.assertTrue(apply_story_update(story, {"version": 1, "segment": "Uno"}))
+        self.assertTrue(apply_story_update(story, {"version": 2, "segment": "Due"}))
+        self.assertTrue(apply_story_update(story, {"version": 2, "segment": "Due"}))
+        self.assertEqual(story, ["Uno", "Due"])
+
+    def test_gap_requires_resync(self):
+        """Un delta con versione saltata viene rifiutato finche' non arriva la storia intera."""
+        story = ["Uno"]
+        self.assertFalse(apply_story_update(story, {"version": 3, "segment": "Tre"}))
+        self.assertEqual(story, ["Uno"])
+        self.assertTrue(apply_story_update(story, {"version": 3, "story": ["Uno", "Due", "Tre"]}))
+        self.assertEqual(len(story), 3)
+
+class TestBatch(unittest.TestCase):
+
+    def test_batch_roundtrip_keeps_order(self):
+        """Un BATCH attraversa entrambi i codec e restituisce gli eventi nell'ordine originale."""
+        events = [{"type": EVT_STORY_UPDATE, "version": 2, "segment": "Due"},
+                  {"type": EVT_NEW_SEGMENT, "segment_id": 3, "timeout": 60}]
+        for codec in (CODEC_JSON, CODEC_BINARY):
+            raw = encode_frame(make_batch(events), codec)
+            self.assertEqual(unpack_batch(decode_body(raw[HEADER_SIZE:])), events)
+        self.assertEqual(unpack_batch(events[1]), [events[1]])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
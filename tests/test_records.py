@@ -0,0 +1,35 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from server.gamestate import GameState
+from server.records import Proposal
+
+class TestRecords(unittest.TestCase):
+
+    def test_proposal_dict_compatibility(self):
+        """Una Proposal si legge come il vecchio dizionario e torna dizionario solo ai bordi."""
+        p = Proposal.from_dict({"id": 3, "author": "Alice", "text": "C'era una volta"})
+        self.assertEqual((p['id'], p['author'], p['text']), (3, "Alice", "C'era una volta"))
+        self.assertEqual(p.to_dict(), {"id": 3, "author": "Alice", "text": "C'era una volta"})
+        self.assertFalse(hasattr(p, '__dict__'))
+        with self.assertRaises(KeyError): p['missing']
+
+    def test_author_names_are_shared(self):
+        """Il nome del giocatore e l'autore della proposta sono la stessa stringa internata."""
+        game = GameState(persistence=False)
+        game.save_state = lambda: None
+        game.add_player(1, "".join(["Ali", "ce "]))
+        game.add_player(2, "Bob")
+        game.start_new_story()
+        game.start_new_segment()
+        writer = 2 if game.narrator == 1 else 1
+        ok, proposal = game.add_proposal(writer, "frase")
+        self.assertTrue(ok)
+        self.assertIs(proposal.author, game.players[writer])
+        self.assertEqual(game.get_state_dict()["active_proposals"], [proposal.to_dict()])
+
+if __name__ == '__main__':
+    unittest.main()
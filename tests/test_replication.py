@@ -0,0 +1,102 @@
+import unittest
+import sys
+import os
+import zlib
+import socket
+import json
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from common.protocol import HEADER_SIZE
+from server.gamestate import GameState
+from server.replication import (
+    ReplicationLog, SnapshotReader, encode_message, encode_snapshot, is_lease_renewal, make_hello, make_lease, read_hello,
+)
+
+class TestSnapshotReader(unittest.TestCase):
+
+    def test_zlib_stream_split_across_recv(self):
+        """Il flusso zlib persistente viene ricomposto anche se spezzato in chunk arbitrari."""
+        compressor = zlib.compressobj()
+        states = [{"story": ["Frase"] * i, "phase": "WRITING"} for i in range(1, 6)]
+        stream = b"".join(compressor.compress(encode_snapshot(s)) + compressor.flush(zlib.Z_SYNC_FLUSH) for s in states)
+        reader = SnapshotReader()
+        received = []
+        for i in range(0, len(stream), 7): received.extend(reader.feed(stream[i:i + 7]))
+        self.assertEqual(received, states)
+
+    def test_plain_stream_from_legacy_master(self):
+        """Un master legacy invia gli snapshot in chiaro: lo slave li accetta comunque."""
+        stream = encode_snapshot({"phase": "LOBBY"}) + encode_snapshot({"phase": "VOTING"})
+        reader = SnapshotReader()
+        self.assertEqual(reader.feed(stream[:10]) + reader.feed(stream[10:]), [{"phase": "LOBBY"}, {"phase": "VOTING"}])
+
+    def test_framed_stream_survives_delimiter_text(self):
+        """Il flusso a frame non cerca delimitatori: una storia che contiene '__END__' arriva intera."""
+        states = [{"room": "main", "state": {"story": ["fine\n__END__\n"] * 20000}}, {"seq": 1, "room": "main", "ops": []}]
+        compressor = zlib.compressobj()
+        stream = b"".join(compressor.compress(encode_message(m)) + compressor.flush(zlib.Z_SYNC_FLUSH) for m in states)
+        reader = SnapshotReader()
+        received = []
+        for i in range(0, len(stream), 4096): received.extend(reader.feed(memoryview(stream)[i:i + 4096]))
+        self.assertEqual(received, states)
+
+    def test_log_catch_up_and_snapshot_fallback(self):
+        """Lo slave riceve solo le voci mancanti; se non sono piu' conservate serve lo stato completo."""
+        log = ReplicationLog(retain=3)
+        for i in range(5): log.append({"room": "main", "ops": [{"op": "phase", "phase": str(i)}]})
+        self.assertEqual([json.loads(p[HEADER_SIZE:])["seq"] for p in log.since(3)], [4, 5])
+        self.assertEqual(log.since(5), [])
+        self.assertIsNone(log.since(1))     # la voce 2 e' uscita dalla finestra
+        self.assertIsNone(log.since(9))     # slave avanti rispetto al master: altro log
+
+    def test_promoted_standby_opens_a_new_log(self):
+        """Dopo la promozione uno standby piu' avanti del nuovo master non viene riallineato per numero."""
+        old = ReplicationLog()
+        for i in range(2): old.append({"room": "main", "ops": [{"op": "phase", "phase": str(i)}]})
+        promoted = ReplicationLog()
+        promoted.reset(old.log_id, 1)        # ha applicato solo la voce 1 del vecchio master
+        promoted.start_epoch()
+        promoted.append({"room": "main", "ops": [{"op": "phase", "phase": "nuova"}]})   # la sua voce 2
+
+        self.assertEqual(promoted.seq, 2)
+        self.assertIsNone(promoted.resume(old.log_id, 2))   # lo standby con la vecchia voce 2: stato completo
+        self.assertEqual(len(promoted.resume(promoted.log_id, 1)), 1)
+
+    def test_slave_converges_by_applying_records(self):
+        """Lo slave che applica i record dei tick arriva allo stesso stato del master."""
+        master, slave = GameState(persistence=False), GameState(persistence=False)
+        persist, master.save_state = master.save_state, lambda: None
+        slave.save_state = lambda: None
+        master.add_player(1, "Alice"); master.add_player(2, "Bob")
+        master.start_new_story(); master.start_new_segment()
+        slave.apply_records(persist())
+        writer = 2 if master.narrator == 1 else 1
+        master.add_proposal(writer, "C'era una volta"); master.set_phase_selecting(); master.select_proposal(0)
+        slave.apply_records(persist())
+        self.assertEqual(slave.get_state_dict(), master.get_state_dict())
+
+    def test_hello_negotiates_ops(self):
+        """L'HELLO con 'ops' porta log, sequenza e lease; quelli delle versioni precedenti no."""
+        hellos = (
+            (make_hello("abc", 42), (True, ("abc", 42), True)),
+            (b"HELLO zlib ops abc 42\n", (True, ("abc", 42), False)),
+            (b"HELLO zlib\n", (True, None, False)),
+        )
+        for hello, expected in hellos:
+            master, slave = socket.socketpair()
+            slave.sendall(hello)
+            self.assertEqual(read_hello(master), expected)
+            master.close(); slave.close()
+
+    def test_lease_renewals_are_not_replicated_entries(self):
+        """I rinnovi della lease si distinguono dall'intestazione e dalle voci del log."""
+        log = ReplicationLog()
+        stream = encode_message({"log": log.log_id, "seq": 0, "lease": 0.5, "pid": 1}) + make_lease(0.5)
+        stream += log.append({"room": "main", "ops": []}) + make_lease(0.5)
+        messages = SnapshotReader().feed(stream)
+        self.assertEqual([is_lease_renewal(m) for m in messages], [False, True, False, True])
+        self.assertEqual(messages[1], {"lease": 0.5})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import sys
+import os
+import shutil
+import socket
+import tempfile
+import importlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'server')))
+
+from server.rooms import RoomEvents
+from server.outbound import QueuedConnection
+from server.wal import shared_writer
+from common.protocol import (ResumeCursor, FramedConnection, CMD_JOIN, CMD_START_GAME,
+                             EVT_WELCOME, EVT_GAME_STARTED, EVT_NEW_SEGMENT)
+
+server = importlib.import_module("server.__main__")
+
+class TestSessionResume(unittest.TestCase):
+
+    def test_only_missed_events_are_replayed(self):
+        """Il client riceve solo gli eventi successivi all'ultima sequenza vista; buchi o stream diversi danno None."""
+        events = RoomEvents(retain=3)
+        for i in range(5): events.append({"type": EVT_NEW_SEGMENT, "segment_id": i})
+        self.assertEqual([e["seq"] for e in events.since(events.stream, 3)], [4, 5])
+        self.assertEqual(events.since(events.stream, 5), [])
+        self.assertIsNone(events.since(events.stream, 1))       # evento 2 non piu' conservato
+        self.assertIsNone(events.since("altra-stanza", 4))
+        self.assertIsNone(events.since(events.stream, 9))
+
+    def test_standby_merge_follows_the_master(self):
+        """Lo standby accoda gli eventi contigui e riparte da capo se lo stream cambia."""
+        master, standby = RoomEvents(), RoomEvents()
+        standby.merge(master.snapshot())
+        for i in range(3):
+            evt = master.append({"type": EVT_NEW_SEGMENT, "segment_id": i})
+            standby.merge({"stream": master.stream, "entries": [evt]})
+        self.assertEqual(standby.since(master.stream, 1), master.since(master.stream, 1))
+
+        other = RoomEvents()
+        other.append({"type": EVT_NEW_SEGMENT, "segment_id": 0})
+        standby.merge(other.snapshot())
+        self.assertEqual((standby.stream, standby.seq, len(standby.entries)), (other.stream, 1, 1))
+
+    def test_cursor_skips_duplicates(self):
+        """Il cursore del client scarta gli eventi gia' visti e si annuncia al JOIN solo dopo il primo WELCOME."""
+        cursor = ResumeCursor()
+        self.assertEqual(cursor.join_fields(), {})
+        self.assertTrue(cursor.accept({"type": EVT_WELCOME, "resume": "s", "last_seq": 4}))
+        self.assertFalse(cursor.accept({"type": EVT_NEW_SEGMENT, "seq": 4}))
+        self.assertTrue(cursor.accept({"type": EVT_NEW_SEGMENT, "seq": 5}))
+        self.assertTrue(cursor.accept({"type": EVT_WELCOME, "resume": "s", "last_seq": 9, "resumed": True}))
+        self.assertEqual(cursor.join_fields(), {"resume": "s", "last_seq": 5})
+
+class TestResumeJoin(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.previous = server.NODE_DIR, server.AM_I_MASTER
+        server.NODE_DIR, server.AM_I_MASTER = self.data_dir, True
+        self.sockets = []
+
+    def tearDown(self):
+        shared_writer().flush()
+        server.NODE_DIR, server.AM_I_MASTER = self.previous
+        for sock in self.sockets: sock.close()
+        shutil.rmtree(self.data_dir)
+
+    def join(self, username, **fields):
+        """Client collegato con un socketpair: (connessione lato server, messaggi ricevuti fino al silenzio)."""
+        server_side, client_side = socket.socketpair()
+        self.sockets += [server_side, client_side]
+        conn = QueuedConnection(FramedConnection(server_side))
+        server.register_client(conn, username)
+        server.process_message(conn, conn.session_id, {"type": CMD_JOIN, "username": username, "room": "ripresa",
+                                                       "story_deltas": True, **fields})
+        return conn, FramedConnection(client_side)
+
+    def received(self, peer):
+        peer.settimeout(0.2)
+        messages = []
+        # Allo scadere del timeout recv_message restituisce None
+        for msg in iter(peer.recv_message, None): messages.append(msg)
+        return messages
+
+    def test_player_who_left_before_the_start_resumes_as_spectator(self):
+        """Chi esce dalla lobby e rientra a partita avviata riceve GAME_STARTED da spettatore."""
+        alice, _ = self.join("A")
+        self.join("B")
+        carol, carol_peer = self.join("C")
+        cursor = ResumeCursor()
+        for msg in self.received(carol_peer): cursor.accept(msg)
+        server.unregister_client(carol, carol.session_id)
+
+        server.process_message(alice, alice.session_id, {"type": CMD_START_GAME})
+        _, peer = self.join("C", **cursor.join_fields())
+        messages = self.received(peer)
+
+        self.assertEqual(messages[0]["type"], EVT_WELCOME)
+        self.assertTrue(messages[0].get("resumed"))
+        started = next(m for m in messages if m["type"] == EVT_GAME_STARTED)
+        self.assertTrue(started["is_spectator"])
+        self.assertFalse(started["am_i_narrator"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import sys
+import os
+import tempfile
+import shutil
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from common.protocol import DEFAULT_ROOM
+from server.gamestate import GameState
+from server.rooms import RoomRegistry, Room, valid_room_id, room_save_file
+
+class TestRooms(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        def factory(room_id):
+            game = GameState(persistence=False)
+            game.save_state = lambda: None
+            return Room(room_id, game)
+        self.registry = RoomRegistry(factory)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_rooms_are_independent_and_idle_ones_are_dropped(self):
+        """Ogni stanza ha il proprio stato; una stanza vuota e ferma esce dal registro."""
+        alfa = self.registry.get_or_create("alfa")
+        beta = self.registry.get_or_create("beta")
+        self.assertIs(self.registry.get_or_create("alfa"), alfa)
+        alfa.game_state.add_player(1, "Alice")
+        alfa.connections[1] = object()
+        self.assertEqual(beta.game_state.players, {})
+        self.registry.discard_if_idle(alfa)
+        self.registry.discard_if_idle(beta)
+        self.assertIs(self.registry.get("alfa"), alfa)
+        self.assertIsNone(self.registry.get("beta"))
+        self.assertEqual(len(self.registry), 1)
+
+    def test_room_ids_and_save_files(self):
+        """I nomi delle stanze sono validati; la principale conserva il file di recovery storico."""
+        self.assertTrue(valid_room_id("stanza_1-b"))
+        for bad in ("", "../etc", "a b", "x" * 33, None, 7):
+            self.assertFalse(valid_room_id(bad))
+        self.assertIsNone(room_save_file(self.tmp_dir, DEFAULT_ROOM))
+        self.assertEqual(room_save_file(self.tmp_dir, "alfa"), os.path.join(self.tmp_dir, "alfa.json"))
+
+    def test_load_persisted_recreates_rooms(self):
+        """Dopo un riavvio le stanze con un file di recovery tornano nel registro."""
+        for name in ("alfa.json", "beta.json", "non valida.json", "note.txt"):
+            open(os.path.join(self.tmp_dir, name), 'w').close()
+        self.registry.load_persisted(self.tmp_dir)
+        self.assertEqual(sorted(r.room_id for r in self.registry), sorted([DEFAULT_ROOM, "alfa", "beta"]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from server.scheduler import CommitScheduler
+
+class TestCommitScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.pending = []
+        self.commits = []
+        # Pianificazione manuale: il tick parte solo quando il test lo decide
+        self.scheduler = CommitScheduler(lambda changed, broadcasts: self.commits.append((changed, broadcasts)), schedule=lambda delay, cb: self.pending.append(cb))
+
+    def test_burst_becomes_one_commit(self):
+        """100 modifiche nella stessa finestra producono un solo commit con l'ultimo broadcast per chiave."""
+        for i in range(100):
+            self.scheduler.mark_dirty()
+            self.scheduler.broadcast_latest("VOTE_UPDATE", {"count": i})
+        self.assertEqual(len(self.pending), 1)
+        self.pending.pop()()
+        self.assertEqual(self.commits, [(True, [{"count": 99}])])
+
+    def test_flush_now_commits_immediately(self):
+        """flush_now() esegue subito il commit; il tick gia' pianificato non lo ripete."""
+        self.scheduler.mark_dirty()
+        self.scheduler.flush_now()
+        self.assertEqual(len(self.commits), 1)
+        self.pending.pop()()
+        self.assertEqual(len(self.commits), 1)
+
+    def test_broadcast_only_tick_skips_persistence(self):
+        """Un tick con soli broadcast non chiede di salvare o replicare lo stato."""
+        self.scheduler.broadcast_latest("VOTE_UPDATE", {"count": 1})
+        self.pending.pop()()
+        self.assertEqual(self.commits, [(False, [{"count": 1}])])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import sys
+import os
+import socket
+import shutil
+import tempfile
+import importlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src', 'server')))
+
+from common.protocol import CMD_HEARTBEAT, CMD_JOIN, CMD_START_GAME, DEFAULT_ROOM, EVT_ERROR, FramedConnection, encode_frame
+from server.outbound import QueuedConnection
+from server.wal import shared_writer
+from server.sharding import handoff_channel, read_routing_prefix, recv_handoff, send_handoff, shard_for
+
+server = importlib.import_module("server.__main__")
+
+class TestSharding(unittest.TestCase):
+
+    def test_rooms_map_to_stable_workers(self):
+        """La stessa stanza va sempre allo stesso worker e le stanze si distribuiscono su tutti."""
+        owners = [shard_for(f"stanza_{i}", 4) for i in range(200)]
+        self.assertEqual(owners, [shard_for(f"stanza_{i}", 4) for i in range(200)])
+        self.assertEqual(set(owners), {0, 1, 2, 3})
+
+    def test_prefix_stops_at_first_command(self):
+        """Il router legge heartbeat e JOIN, non i comandi successivi."""
+        client, server = socket.socketpair()
+        frames = [encode_frame({"type": CMD_HEARTBEAT}), encode_frame({"type": CMD_JOIN, "username": "A", "room": "alfa"})]
+        client.sendall(b"".join(frames) + encode_frame({"type": CMD_START_GAME}))
+        self.assertEqual(read_routing_prefix(server), (b"".join(frames), "alfa"))
+        # Il START_GAME e' rimasto sul socket per il worker; senza JOIN si va nella stanza principale
+        self.assertEqual(read_routing_prefix(server), (encode_frame({"type": CMD_START_GAME}), DEFAULT_ROOM))
+        client.close(); server.close()
+
+    def test_worker_refuses_rooms_of_other_shards(self):
+        """Un secondo JOIN verso una stanza di un altro worker viene rifiutato senza aprirne lo stato."""
+        own = next(f"stanza_{i}" for i in range(100) if shard_for(f"stanza_{i}", 4) == 0)
+        foreign = next(f"stanza_{i}" for i in range(100) if shard_for(f"stanza_{i}", 4) != 0)
+        previous = server.AM_I_MASTER, server.SHARD_INDEX, server.SHARD_COUNT, server.NODE_DIR
+        data_dir = tempfile.mkdtemp()
+        server.AM_I_MASTER, server.SHARD_INDEX, server.SHARD_COUNT, server.NODE_DIR = True, 0, 4, data_dir
+        worker_end, client_end = socket.socketpair()
+        try:
+            conn = QueuedConnection(FramedConnection(worker_end))
+            server.register_client(conn, "A")
+            client = FramedConnection(client_end)
+            server.process_message(conn, conn.session_id, {"type": CMD_JOIN, "username": "A", "room": own})
+            client.recv_message()
+            server.process_message(conn, conn.session_id, {"type": CMD_JOIN, "username": "A", "room": foreign})
+            self.assertEqual(client.recv_message()["type"], EVT_ERROR)
+            self.assertEqual(conn.room.room_id, own)
+            self.assertNotIn(foreign, [room.room_id for room in server.rooms])
+        finally:
+            server.unregister_client(conn, conn.session_id)
+            shared_writer().flush()
+            server.AM_I_MASTER, server.SHARD_INDEX, server.SHARD_COUNT, server.NODE_DIR = previous
+            worker_end.close(); client_end.close()
+            shutil.rmtree(data_dir)
+
+    def test_handoff_passes_socket_and_prefix(self):
+        """Il worker riceve il socket del client e rielabora per primi i byte letti dal router."""
+        client, accepted = socket.socketpair()
+        router_end, worker_end = handoff_channel()
+        join = encode_frame({"type": CMD_JOIN, "username": "A"})
+        send_handoff(router_end, accepted, join)
+        accepted.close()
+        sock, prefix = recv_handoff(worker_end)
+        conn = FramedConnection(sock)
+        conn.feed(prefix)
+        client.sendall(encode_frame({"type": CMD_START_GAME}))
+        self.assertEqual([conn.recv_message()["type"], conn.recv_message()["type"]], [CMD_JOIN, CMD_START_GAME])
+        router_end.close()
+        self.assertIsNone(recv_handoff(worker_end))
+        for s in (client, sock, worker_end): s.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import sys
+import os
+import socket
+import time
+import zlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from server.replication import SEND_CHUNK, SlaveLink
+
+class TestSlaveLink(unittest.TestCase):
+
+    def test_sends_in_order_and_tracks_lag(self):
+        """Le voci accodate arrivano in ordine e a coda vuota il ritardo torna a zero."""
+        master, slave = socket.socketpair()
+        link = SlaveLink(master)
+        for seq in range(1, 4): self.assertTrue(link.send(f"voce {seq};".encode(), seq))
+        received = b""
+        while len(received) < 21: received += slave.recv(64)
+        self.assertEqual(received, b"voce 1;voce 2;voce 3;")
+        deadline = time.time() + 2
+        while link.lag(3)["entries"] and time.time() < deadline: time.sleep(0.01)
+        self.assertEqual(link.lag(5), {"slave": link.name, "entries": 2, "bytes": 0, "seconds": 0.0})
+        link.close(); slave.close()
+
+    def test_stalled_slave_is_dropped_without_blocking(self):
+        """Uno slave che non legge riempie solo la propria coda e viene scollegato, senza bloccare chi accoda."""
+        master, slave = socket.socketpair()
+        link = SlaveLink(master, high_water=256 * 1024)
+        chunk = b"x" * 16 * 1024
+        start = time.perf_counter()
+        results = [link.send(chunk, seq) for seq in range(1, 200)]
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertFalse(all(results))
+        self.assertTrue(link.closed)
+        self.assertEqual(link.close_reason, "coda di replica piena")
+        slave.close()
+    def test_large_backlog_is_compressed_in_chunks(self):
+        """Uno stato di molti blocchi parte a pezzi nello stesso flusso zlib e arriva intatto, seguito dalle voci."""
+        master, slave = socket.socketpair()
+        link = SlaveLink(master, compress=True)
+        state = os.urandom(SEND_CHUNK // 2).hex().encode() * 3
+        link.send(state, 1)
+        link.send(b"voce 2;", 2)
+        inflater, received = zlib.decompressobj(), b""
+        slave.settimeout(5)
+        while len(received) < len(state) + 7: received += inflater.decompress(slave.recv(65536))
+        self.assertEqual(received, state + b"voce 2;")
+        link.close(); slave.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import sys
+import os
+import random
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from server.timers import TimerService
+
+class TestTimerService(unittest.TestCase):
+
+    def setUp(self):
+        self.timers = TimerService()
+
+    def tearDown(self):
+        self.timers.close()
+
+    def test_100k_deadlines_with_bounded_drift(self):
+        """100k scadenze concorrenti su un solo thread: nessuna persa, le cancellate non scattano, ritardo limitato."""
+        count = 100_000
+        fired = [None] * count
+        threads_before = threading.active_count()
+
+        def deadline(i):
+            return lambda: fired.__setitem__(i, time.monotonic())
+        handles = [self.timers.call_later(1.0 + random.random(), deadline(i)) for i in range(count)]
+        self.assertLessEqual(threading.active_count(), threads_before + 1)
+        for handle in handles[::2]: handle.cancel()
+        self.assertEqual(len(self.timers), count // 2)
+
+        time.sleep(2.1)
+        deadline_end = time.monotonic() + 5
+        while len(self.timers) and time.monotonic() < deadline_end: time.sleep(0.05)
+        self.assertEqual(len(self.timers), 0)
+        self.assertTrue(all(t is None for t in fired[::2]))
+        drift = [fired[i] - handles[i].when for i in range(1, count, 2)]
+        self.assertGreaterEqual(min(drift), 0)
+        self.assertLess(max(drift), 0.25)
+
+    def test_order_and_rescheduling_from_callbacks(self):
+        """Le scadenze scattano in ordine; una callback puo' cancellare e ripianificare altri timer."""
+        order = []
+        done = threading.Event()
+        late = self.timers.call_later(0.05, lambda: order.append("cancellato"))
+
+        def first():
+            order.append("primo")
+            late.cancel()
+            self.timers.call_later(0, lambda: (order.append("ripianificato"), done.set()))
+        self.timers.call_later(0.03, lambda: order.append("secondo"))
+        self.timers.call_later(0.01, first)
+        self.assertTrue(done.wait(2))
+        time.sleep(0.1)
+        self.assertEqual(order, ["primo", "ripianificato", "secondo"])
+
+if __name__ == '__main__':
+    unittest.main()